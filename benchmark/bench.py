@@ -0,0 +1,361 @@
+import argparse
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import numpy as np
+
+from benchmark import synthetic
+from src.gold_finder import gold_finder as gf
+from src.clustering import clustering
+from src.network import density
+from src.helper import data_loading as dl, particles
+from src.helper.output import out, render
+
+DATA_DIR = pathlib.Path(__file__).resolve().parent.parent / "data" / "analyzed synapses"
+
+# (quick, full) parameter lists for each scaling curve
+IMAGE_SIZES = ([256, 512, 1024], [512, 1024, 2048, 4096])
+PARTICLE_COUNTS = ([50, 200, 800], [100, 400, 1600, 6400])
+POINT_COUNTS = ([100, 1000, 5000], [100, 1000, 10_000, 50_000])
+NETWORKX_MAX_POINTS = 500  # the reference density backend is O(n^2), so only time it on small inputs
+BUNDLE_COUNTS = ([2, 4], [4, 16])
+
+PARTICLES_PER_MEGAPIXEL = 400
+PREFILTER_SCALE = 4
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+STARTUP_MODULES = ("src.cli", "src.client", "src.gold_finder.gold_finder", "src.helper.output.out")
+
+
+def measure(function: Callable[[], object], repeats: int) -> dict:
+    """
+    Times a function
+
+    :param function: The function to time
+    :param repeats: The number of times to run it
+    :return: The minimum and median run time in seconds, and the number of runs
+    """
+
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return {"min": min(times), "median": statistics.median(times), "repeats": repeats}
+
+
+def bench_find_gold(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(0)
+    results = []
+
+    # scaling with the number of pixels, at a constant particle density
+    for size in IMAGE_SIZES[full]:
+        num_particles = int(size * size / 1e6 * PARTICLES_PER_MEGAPIXEL)
+        image = synthetic.synthetic_image((size, size), num_particles, rng)[0]
+
+        results.append({
+            "name": "find_gold",
+            "params": {"pixels": size * size, "particles": num_particles},
+            **measure(lambda: gf.GoldFinder(image).find_gold(), repeats)
+        })
+
+    # scaling with the number of particles, at a constant image size
+    size = IMAGE_SIZES[full][1]
+    for num_particles in PARTICLE_COUNTS[full]:
+        image = synthetic.synthetic_image((size, size), num_particles, rng)[0]
+
+        results.append({
+            "name": "find_gold",
+            "params": {"pixels": size * size, "particles": num_particles},
+            **measure(lambda: gf.GoldFinder(image).find_gold(), repeats)
+        })
+
+        # the downsampled candidate prefilter pays off on large, sparse images, and falls back to a full pass on dense ones
+        results.append({
+            "name": "find_gold",
+            "params": {"pixels": size * size, "particles": num_particles, "prefilter": PREFILTER_SCALE},
+            **measure(lambda: gf.GoldFinder(image, prefilter=PREFILTER_SCALE).find_gold(), repeats)
+        })
+
+    return results
+
+
+def bench_gold_cluster(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(1)
+    results = []
+
+    for num_points in POINT_COUNTS[full]:
+        points = synthetic.synthetic_points(num_points, max(num_points // 100, 1), rng)
+
+        for method in clustering.METHODS:
+            eps_nm = None if method == "hdbscan" else 100  # hdbscan picks its own scale
+
+            results.append({
+                "name": "gold_cluster",
+                "params": {"particles": num_points, "method": method},
+                **measure(lambda: clustering.gold_cluster(points, (10_000, 10_000), method=method, eps_nm=eps_nm),
+                          repeats)
+            })
+
+    return results
+
+
+def bench_density(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(2)
+    results = []
+
+    for num_points in POINT_COUNTS[full]:
+        points = [tuple(point) for point in synthetic.synthetic_points(num_points, 1, rng).tolist()]
+
+        for backend in density.BACKENDS:
+            if backend == "networkx" and num_points > NETWORKX_MAX_POINTS:
+                continue
+
+            results.append({
+                "name": "density",
+                "params": {"particles": num_points, "backend": backend},
+                **measure(lambda: density.density(points, backend=backend), repeats)
+            })
+
+    return results
+
+
+def bench_create_output_df(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(3)
+    results = []
+
+    for num_points in POINT_COUNTS[full]:
+        points = synthetic.synthetic_points(num_points, max(num_points // 100, 1), rng)
+        clusters = clustering.gold_cluster(points, (10_000, 10_000), method="grid", eps_nm=100)
+
+        results.append({
+            "name": "create_output_df",
+            "params": {"particles": num_points, "clusters": len(clusters)},
+            **measure(lambda: out.create_output_df(clusters), repeats)
+        })
+
+        table = clustering.cluster_table(particles.ParticleTable(points), (10_000, 10_000), method="grid", eps_nm=100)
+
+        results.append({
+            "name": "create_output_df",
+            "params": {"particles": num_points, "clusters": len(clusters), "table": True},
+            **measure(lambda: out.create_output_df(table), repeats)
+        })
+
+    return results
+
+
+def bench_render(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(5)
+    results = []
+
+    for size in IMAGE_SIZES[full]:
+        num_particles = int(size * size / 1e6 * PARTICLES_PER_MEGAPIXEL)
+        image = synthetic.synthetic_image((size, size), 0, rng)[0]
+        points = synthetic.synthetic_points(num_particles, max(num_particles // 20, 1), rng, extent=size)
+        clusters = clustering.gold_cluster(points, (size, size), method="grid")
+
+        results.append({
+            "name": "render",
+            "params": {"pixels": size * size, "particles": num_particles, "clusters": len(clusters)},
+            **measure(lambda: render.render(image, clusters), repeats)
+        })
+
+    return results
+
+
+def bench_get_image_bundles(full: bool, repeats: int) -> list[dict]:
+    rng = np.random.default_rng(4)
+    results = []
+
+    for num_bundles in BUNDLE_COUNTS[full]:
+        with tempfile.TemporaryDirectory() as data_dir:
+            for i in range(num_bundles):
+                synthetic.write_bundle(data_dir, f"S{i}", rng, size=1024, num_particles=200)
+
+            results.append({
+                "name": "get_image_bundles",
+                "params": {"bundles": num_bundles, "pixels": 1024 * 1044},
+                **measure(lambda: list(dl.get_image_bundles(data_dir)), repeats)
+            })
+
+    return results
+
+
+def bench_load_image(full: bool, repeats: int) -> list[dict]:
+    """
+    Times loading one source image (decoding it and filling its scale bar) with PIL and with the memory-mapped TIFF
+    loader. The memory-mapped loader only reads the pixels that are used, so the first access to the pixels is timed
+    separately
+    """
+
+    rng = np.random.default_rng(6)
+    results = []
+
+    for size in IMAGE_SIZES[full]:
+        with tempfile.TemporaryDirectory() as data_dir:
+            synthetic.write_bundle(data_dir, "S1", rng, size=size, num_particles=0)
+            path = pathlib.Path(data_dir) / "S1" / "S1.tif"
+
+            for loader, load in (("pil", dl.load_source_image), ("mmap", dl.load_source_array)):
+                results.append({
+                    "name": "load_image",
+                    "params": {"pixels": size * size, "loader": loader},
+                    **measure(lambda: load(path), repeats)
+                })
+
+            results.append({
+                "name": "load_image",
+                "params": {"pixels": size * size, "loader": "mmap+read"},
+                **measure(lambda: np.bincount(dl.load_source_array(path)[0].ravel(), minlength=256), repeats)
+            })
+
+    return results
+
+
+def bench_real_bundles(full: bool, repeats: int) -> list[dict]:
+    """
+    Times find_gold on each bundled 'analyzed synapses' image. Bundles without an image are skipped
+    """
+
+    results = []
+
+    for bundle_dir in sorted(dl.find_bundle_dirs(DATA_DIR)):
+        try:
+            bundle = dl.load_bundle(bundle_dir)
+        except FileNotFoundError:
+            continue
+
+        results.append({
+            "name": "find_gold_bundle",
+            "params": {"bundle": bundle.name, "pixels": bundle.image.width * bundle.image.height},
+            **measure(lambda: gf.GoldFinder(bundle.image).find_gold(), repeats)
+        })
+
+    return results
+
+
+def bench_import_time(full: bool, repeats: int) -> list[dict]:
+    """
+    Times a fresh interpreter importing each entry point, which is what `python -m src.cli -h` pays before doing
+    anything. Heavy dependencies (sklearn, matplotlib, pandas, scipy) should only be imported by the stages that use them
+    """
+
+    results = []
+
+    for module in STARTUP_MODULES:
+        results.append({
+            "name": "import_time",
+            "params": {"module": module},
+            **measure(lambda: subprocess.run([sys.executable, "-c", f"import {module}"], cwd=REPO_ROOT, check=True),
+                      repeats)
+        })
+
+    return results
+
+
+BENCHMARKS = {
+    "find_gold": bench_find_gold,
+    "gold_cluster": bench_gold_cluster,
+    "density": bench_density,
+    "create_output_df": bench_create_output_df,
+    "render": bench_render,
+    "get_image_bundles": bench_get_image_bundles,
+    "load_image": bench_load_image,
+    "real_bundles": bench_real_bundles,
+    "import_time": bench_import_time
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=pathlib.Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: list[str], full: bool, repeats: int) -> dict:
+    """
+    Runs benchmarks and prints each result as it finishes
+
+    :param names: The benchmarks to run (keys of BENCHMARKS)
+    :param full: Whether to use the full (slow) parameter lists instead of the quick ones
+    :param repeats: The number of times each measurement is repeated
+    :return: The machine-readable report
+    """
+
+    results = []
+
+    for name in names:
+        for result in BENCHMARKS[name](full, repeats):
+            print(f"{result['name']:>18} {json.dumps(result['params']):<60} {result['median'] * 1000:10.2f} ms")
+            results.append(result)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "full": full,
+        "results": results
+    }
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """
+    Prints the speedup of each measurement in current over the matching measurement in baseline
+    """
+
+    baseline_times = {(r["name"], json.dumps(r["params"], sort_keys=True)): r["median"] for r in baseline["results"]}
+
+    print(f"\n--- COMPARED TO {baseline.get('commit')} ---")
+
+    for result in current["results"]:
+        key = (result["name"], json.dumps(result["params"], sort_keys=True))
+
+        if key in baseline_times:
+            print(f"{result['name']:>18} {key[1]:<60} {baseline_times[key] / result['median']:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Golden benchmarks",
+        description="Time detection, clustering, density and I/O on synthetic and bundled data"
+    )
+
+    parser.add_argument("--out", type=str, default=None, help="The JSON file to write the results to")
+    parser.add_argument("--compare", type=str, default=None, help="A previous JSON result file to compare against")
+    parser.add_argument("--full", action="store_true", help="Use larger inputs. Default: False")
+    parser.add_argument("--repeats", type=int, default=3, help="The number of runs per measurement. Default: 3")
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="The benchmarks to run. Default: all of them"
+    )
+
+    args = parser.parse_args()
+
+    report = run(args.only, args.full, args.repeats)
+
+    if args.out is not None:
+        pathlib.Path(args.out).write_text(json.dumps(report, indent=2))
+
+    if args.compare is not None:
+        compare(json.loads(pathlib.Path(args.compare).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import pathlib
+
+from PIL import Image
+
+import numpy as np
+import pandas as pd
+
+from src.helper import units as uc
+
+PARTICLE_DIAMETERS_NM = (6, 12)
+
+
+def particle_radius(diameter_nm: float) -> float:
+    """
+    :param diameter_nm: The diameter of a gold particle in nanometers
+    :return: The radius of the particle in pixels
+    """
+    
+    return uc.nanometers_to_pixels(diameter_nm)[0] / 2
+
+
+def draw_disk(image: np.ndarray, row: float, col: float, radius: float, value: int) -> None:
+    """
+    Draws a filled disk onto an image, touching only the disk's bounding box
+    """
+    
+    top, bottom = max(int(row - radius), 0), min(int(row + radius) + 2, image.shape[0])
+    left, right = max(int(col - radius), 0), min(int(col + radius) + 2, image.shape[1])
+    
+    rows, cols = np.ogrid[top:bottom, left:right]
+    image[top:bottom, left:right][(rows - row) ** 2 + (cols - col) ** 2 <= radius ** 2] = value
+
+
+def synthetic_image(shape: tuple[int, int], num_particles: int, rng: np.random.Generator, noise: float = 20,
+                    background: int = 150, diameters_nm: tuple[float, ...] = PARTICLE_DIAMETERS_NM,
+                    margin: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generates an EM-like image: dark gold particles on a noisy gray background
+    
+    :param shape: The (height, width) of the image
+    :param num_particles: The number of particles to draw. Particles may overlap
+    :param rng: The random number generator
+    :param noise: The standard deviation of the background noise
+    :param background: The average luminosity of the background
+    :param diameters_nm: The particle diameters to choose from, in nanometers
+    :param margin: The minimum distance between a particle center and the edge of the image
+    :return: [the uint8 image, an (n, 3) array of (row, column, diameter in nm) of each particle]
+    """
+    
+    image = rng.normal(background, noise, shape).clip(0, 254).astype(np.uint8)
+    
+    particles = np.column_stack((
+        rng.uniform(margin, shape[0] - margin, num_particles),
+        rng.uniform(margin, shape[1] - margin, num_particles),
+        rng.choice(diameters_nm, num_particles)
+    ))
+    
+    for row, col, diameter_nm in particles:
+        draw_disk(image, row, col, particle_radius(diameter_nm), rng.integers(20, 60))
+    
+    return image, particles
+
+
+def synthetic_points(num_points: int, num_clusters: int, rng: np.random.Generator, extent: float = 10_000,
+                     spread: float = 100) -> np.ndarray:
+    """
+    Generates particle locations in Gaussian clusters, like the output of GoldFinder
+    
+    :param num_points: The number of points
+    :param num_clusters: The number of clusters the points are spread over
+    :param rng: The random number generator
+    :param extent: The width and height of the area the cluster centers are placed in, in pixels
+    :param spread: The standard deviation of each cluster, in pixels
+    :return: An (n, 2) integer array of points
+    """
+    
+    centers = rng.uniform(0, extent, (num_clusters, 2))
+    points = centers[rng.integers(0, num_clusters, num_points)] + rng.normal(0, spread, (num_points, 2))
+    
+    return points.round().astype(np.int64)
+
+
+def write_bundle(base_path, name: str, rng: np.random.Generator, size: int = 300, bar_width: int = 20,
+                 num_particles: int = 40) -> pathlib.Path:
+    """
+    Writes an image bundle laid out like the ones in 'analyzed synapses': a TIFF with a black scale bar along the
+    bottom, a mask that covers the left half of the image, and ground truth CSVs (in microns) of the drawn particles
+    
+    :param base_path: The dataset directory to write the bundle into
+    :param name: The name of the bundle
+    :param rng: The random number generator
+    :param size: The width and height of the image, excluding the scale bar
+    :param bar_width: The height of the scale bar
+    :param num_particles: The number of particles to draw
+    :return: The bundle directory
+    """
+    
+    bundle_dir = pathlib.Path(base_path) / name
+    (bundle_dir / "Results").mkdir(parents=True)
+    
+    image = np.full((size + bar_width, size), 150, dtype=np.uint8)
+    image[size:] = 0
+    
+    margin = int(particle_radius(max(PARTICLE_DIAMETERS_NM))) + 2
+    particles = synthetic_image((size, size), num_particles, rng, noise=0, margin=margin)[1]
+    
+    for row, col, diameter_nm in particles:
+        draw_disk(image, row, col, particle_radius(diameter_nm), 40)
+    
+    mask = np.full(image.shape, 255, dtype=np.uint8)
+    mask[:size, :size // 2] = 0
+    
+    Image.fromarray(image, "L").save(bundle_dir / f"{name}.tif")
+    Image.fromarray(mask, "L").save(bundle_dir / f"{name} mask.tif")
+    
+    for diameter_nm in PARTICLE_DIAMETERS_NM:
+        truth = particles[particles[:, 2] == diameter_nm]
+        
+        pd.DataFrame(
+            [uc.pixels_to_microns(col, row) for row, col, _ in truth], columns=["X", "Y"]
+        ).to_csv(bundle_dir / "Results" / f"Results {diameter_nm}nm XY in microns.csv")
+    
+    return bundle_dir
@@ -0,0 +1,181 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.gold_finder import gold_finder as gf, tiling
+from src.clustering import clustering
+from src.helper import catalog, preprocessing
+from src.helper.output import writer
+
+STAGES = ("load", "detect", "cluster", "density", "write")
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden batch",
+        description="Find gold particles and their density in every image bundle of a dataset directory"
+    )
+
+    parser.add_argument(
+        "outdir",
+        type=str,
+        help="The dataset directory to write the results to, partitioned by bundle (e.g., 'bundle=S1/part-0.csv')"
+    )
+
+    parser.add_argument(
+        "--data",
+        type=str,
+        default="./data/analyzed synapses/",
+        help="The directory that contains one subdirectory per image bundle. Default: './data/analyzed synapses/'"
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. Default: the number of CPUs"
+    )
+
+    parser.add_argument(
+        "-m", "--mask",
+        action="store_true",
+        help="Whether to apply the mask to each image before finding gold particles. Default: False"
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=list(writer.FORMATS),
+        default="csv",
+        help="The file format of the results. 'parquet' and 'arrow' need pyarrow. Default: 'csv'"
+    )
+
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Find gold particles in tiles of this many pixels to bound memory use on very large images"
+    )
+
+    return parser.parse_args()
+
+
+def analyze_bundle(bundle: catalog.BundleEntry, dataset: writer.DatasetWriter, use_mask: bool,
+                   tile_size: int | None) -> dict:
+    """
+    Runs detection, clustering and density on one image bundle and writes the results to the bundle's partition of the
+    dataset as soon as they are ready. This runs in a worker process, and only the (unloaded) catalog entry is sent to
+    it, so the bundle is loaded here.
+
+    :param bundle: The catalog entry of the image bundle
+    :param dataset: The dataset to write the bundle's results to
+    :param use_mask: Whether to apply the bundle's mask before finding gold particles
+    :param tile_size: The tile size for GoldFinder, or None to process the whole image at once
+    :return: A summary of the run: the bundle name, particle and cluster counts, the seconds spent in each stage and
+             the position of the scale bar found while loading
+    """
+
+    timings = {}
+
+    start = time.perf_counter()
+    preprocessed = preprocessing.preprocess(bundle.image, bundle.mask if use_mask else None)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gold_particles = gf.GoldFinder(
+        preprocessed.image, img_luminosity=preprocessed.stats.mean, tile_size=tile_size, region=preprocessed.region
+    ).find_table()
+    timings["detect"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    clusters = clustering.cluster_table(gold_particles, tiling.image_size(preprocessed.image))
+    timings["cluster"] = time.perf_counter() - start
+
+    # particle_columns is where the density of each cluster is calculated
+    start = time.perf_counter()
+    columns = writer.particle_columns(clusters)
+    timings["density"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dataset.write(bundle.name, columns)
+    timings["write"] = time.perf_counter() - start
+
+    return {
+        "name": bundle.name,
+        "particles": len(gold_particles),
+        "clusters": len(clusters.cluster_ranges()),
+        "timings": timings,
+        "bar_position": bundle.bar_position
+    }
+
+
+def run_batch(data_dir: str, outdir: str, workers: int | None = None, use_mask: bool = False,
+              tile_size: int | None = None, file_format: str = "csv") -> list[dict]:
+    """
+    Analyzes every image bundle in data_dir with a process pool. Each bundle's results are appended to the dataset in
+    outdir by its worker, and a line is printed for each finished bundle.
+
+    :param data_dir: The directory that contains one subdirectory per image bundle
+    :param outdir: The dataset directory to write the results to, partitioned by bundle (see writer.DatasetWriter)
+    :param workers: The number of worker processes. If None, the number of CPUs
+    :param use_mask: Whether to apply each bundle's mask before finding gold particles
+    :param tile_size: The tile size for GoldFinder, or None to process each image at once
+    :param file_format: The file format of the results, one of writer.FORMATS
+    :return: The summaries of the bundles that were analyzed successfully (see analyze_bundle)
+    """
+
+    dataset = writer.DatasetWriter(outdir, file_format)
+
+    bundle_catalog = catalog.BundleCatalog(data_dir)
+
+    results = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(analyze_bundle, bundle, dataset, use_mask, tile_size): bundle
+            for bundle in bundle_catalog
+        }
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{futures[future].name}: failed ({e})")
+                continue
+
+            futures[future].bar_position = result["bar_position"]
+
+            results.append(result)
+            print(f"{result['name']}: {result['particles']} particles in {result['clusters']} clusters "
+                  f"({sum(result['timings'].values()):.2f}s)")
+
+    bundle_catalog.save()
+    print_summary(results, time.perf_counter() - start)
+    return results
+
+
+def print_summary(results: list[dict], wall_time: float) -> None:
+    """
+    Prints the time spent in each stage and the overall throughput of a batch run
+
+    :param results: The bundle summaries returned by analyze_bundle
+    :param wall_time: The total time the batch took, in seconds
+    """
+
+    print(f"\n--- {len(results)} BUNDLES IN {wall_time:.2f}s ({len(results) / wall_time:.2f} images/sec) ---")
+
+    for stage in STAGES:
+        stage_times = [result["timings"][stage] for result in results]
+        total = sum(stage_times)
+        mean = total / len(stage_times) if stage_times else 0
+
+        print(f"{stage:>8}: {total:8.2f}s total, {mean:8.3f}s per image")
+
+
+def main():
+    args = get_args()
+    run_batch(args.data, args.outdir, args.workers, args.mask, args.tile_size, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 import argparse
 
-from src.gold_finder import gold_finder as gf
+from src.gold_finder import gold_finder as gf, tiling
 from src.clustering import clustering
-from src.helper import masking, data_loading as dl
-from src.helper.output import out
+from src.helper import catalog, cache, preprocessing, profiling, roi
+from src.helper.output import writer
+
+# Heavy dependencies are imported by the stages that use them: sklearn by clustering, scipy by density, pandas by CSV
+# output and matplotlib by -v. src.helper.output.out is only imported when a figure is drawn
 
 
 def get_args() -> argparse.Namespace:
@@ -25,6 +28,14 @@ def get_args() -> argparse.Namespace:
         help="Whether to apply the mask to the image before finding gold particles. Default: False"
     )
     
+    parser.add_argument(
+        "--roi",
+        type=str,
+        default=None,
+        help="An ImageJ .roi file, or a .zip file of them from the ROI manager. Only the pixels inside its area ROIs "
+             "(polygons, rectangles, ovals and freehand selections) are scanned for gold particles, as with --mask"
+    )
+    
     parser.add_argument(
         "-v", "--visual",
         action="store_true",
@@ -35,7 +46,9 @@ def get_args() -> argparse.Namespace:
         "--dataloc",
         type=str,
         default=None,
-        help="The location to store the data CSV file. If not specified, the data will not be saved."
+        help="The location to store the data file. The format follows the extension: '.csv', '.parquet' or '.arrow' "
+             "(the latter two need pyarrow). Other extensions are written as CSV. If not specified, the data will not "
+             "be saved."
     )
     
     parser.add_argument(
@@ -45,33 +58,186 @@ def get_args() -> argparse.Namespace:
         help="The location to store the figure shown with the -m flag. If not specified, the figure will not be saved."
     )
     
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Find gold particles in tiles of this many pixels to bound memory use on very large images. If not "
+             "specified, the whole image is processed at once."
+    )
+    
+    parser.add_argument(
+        "--threshold-method",
+        choices=preprocessing.THRESHOLD_METHODS,
+        default="mean",
+        help="How to find the luminosity below which pixels are part of a splotch: a fraction of the average "
+             "luminosity ('mean', the default), Otsu's method ('otsu') or a fraction of the local average ('local')"
+    )
+    
+    parser.add_argument(
+        "--cluster-method",
+        choices=clustering.METHODS,
+        default=clustering.DEFAULT_METHOD,
+        help=f"The algorithm used to cluster the gold particles. Default: '{clustering.DEFAULT_METHOD}'"
+    )
+    
+    parser.add_argument(
+        "--eps-nm",
+        type=float,
+        default=None,
+        help="The clustering neighborhood radius in nanometers. If not specified, it is estimated from the image size."
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always find the gold particles instead of reusing the results of an earlier run with the same image, "
+             "mask and parameters"
+    )
+    
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove every cached result before running"
+    )
+    
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=cache.DEFAULT_CACHE_DIR,
+        help=f"The directory to cache preprocessed images and found gold particles in. "
+             f"Default: '{cache.DEFAULT_CACHE_DIR}'"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Record the time and peak memory of each stage, plus counters such as the number of components labeled, "
+             "print them and write them to this file. If not specified, nothing is recorded"
+    )
+    
+    parser.add_argument(
+        "--profile-format",
+        choices=profiling.PROFILE_FORMATS,
+        default="json",
+        help="The format of the --profile file: 'json' (the default) or 'chrome' (a trace for chrome://tracing or "
+             "Perfetto)"
+    )
+    
     return parser.parse_args()
 
 
+def detect(bundle: catalog.BundleEntry, use_mask: bool, tile_size: int | None, threshold_method: str,
+           detection_cache: cache.DetectionCache | None, roi_path: str | None = None):
+    """
+    Preprocesses the bundle's image and finds the gold particles in it, reusing a cached result when the image, mask,
+    parameters and code are unchanged
+    
+    :param bundle: The bundle to analyze
+    :param use_mask: Whether to apply the bundle's mask before finding gold particles
+    :param tile_size: The tile size for GoldFinder, or None to process the whole image at once
+    :param threshold_method: How to find the luminosity threshold (see helper.preprocessing.THRESHOLD_METHODS)
+    :param detection_cache: The cache to use, or None to always find the gold particles
+    :param roi_path: An ImageJ ROI file whose area ROIs are applied as the mask (instead of the bundle's mask), or None
+    :return: [the preprocessed image, the gold particles]
+    """
+    
+    params = gf.GoldFinder.default_params(tile_size=tile_size)
+    params["use_mask"] = use_mask
+    params["threshold_method"] = threshold_method
+    params["roi"] = roi_path is not None
+    
+    key = None
+    if detection_cache is not None:
+        files = [bundle.files["image"], bundle.files["mask"]] if use_mask else [bundle.files["image"]]
+        files += [roi_path] if roi_path is not None else []
+        key = detection_cache.key(files, params)
+        
+        cached = detection_cache.get(key)
+        if cached is not None:
+            return cached.image, cached.particles
+    
+    with profiling.stage("load"):
+        image, mask = bundle.image, bundle.mask if use_mask else None
+        
+        if roi_path is not None:
+            mask = roi.region(roi.read(roi_path), tiling.image_size(image))
+    
+    preprocessed = preprocessing.preprocess(image, mask)
+    
+    gold_particles = gf.GoldFinder(
+        preprocessed.image, tile_size=tile_size,
+        threshold=preprocessed.threshold(threshold_method, params["mask_threshold"]), region=preprocessed.region
+    ).find_table()
+    
+    if detection_cache is not None:
+        detection_cache.put(key, preprocessed.image, gold_particles, preprocessed.stats.mean)
+    
+    return preprocessed.image, gold_particles
+
+
 def main():
     args = get_args()
     
-    bundles = dl.get_image_bundles("./data/analyzed synapses/")
-    bundle_dict = {bundle.name: bundle for bundle in bundles}
+    if args.profile is None:
+        run(args)
+        return
+    
+    profiler = profiling.Profiler()
     
-    if args.name not in bundle_dict:
+    with profiling.activate(profiler):
+        run(args)
+    
+    print(profiler.summary())
+    profiler.write(args.profile, args.profile_format)
+
+
+def run(args: argparse.Namespace) -> None:
+    """
+    Finds, clusters and outputs the gold particles of one bundle
+    
+    :param args: The parsed command line arguments
+    """
+    
+    bundle_catalog = catalog.BundleCatalog("./data/analyzed synapses/")
+    
+    try:
+        bundle = bundle_catalog.get(args.name)
+    except KeyError:
         print(f"Dataset '{args.name}' not found")
         return
     
-    bundle = bundle_dict[args.name]
+    if args.clear_cache:
+        cache.DetectionCache(args.cache_dir).clear()
     
-    img_luminosity = gf.GoldFinder.get_avg_luminosity(bundle.image)
-    image = masking.apply_mask(bundle.image, bundle.mask) if args.mask else bundle.image
+    detection_cache = None if args.no_cache else cache.DetectionCache(args.cache_dir)
     
-    gold_locations = gf.GoldFinder(image, img_luminosity=img_luminosity).find_gold()
-    clusters = clustering.gold_cluster(gold_locations, image.size)
+    with profiling.stage("detect"):
+        image, gold_particles = detect(
+            bundle, args.mask, args.tile_size, args.threshold_method, detection_cache, args.roi
+        )
     
-    output_data = out.create_output_df(clusters)
+    clusters = clustering.cluster_table(
+        gold_particles, tiling.image_size(image), method=args.cluster_method, eps_nm=args.eps_nm
+    )
     
     if args.dataloc is not None:
-        output_data.to_csv(args.dataloc, index=False)
+        columns = writer.particle_columns(clusters)
+        
+        with profiling.stage("write"):
+            writer.write_columns(columns, args.dataloc, writer.format_of(args.dataloc, default="csv"))
+    
+    if (args.visual or args.figloc) and detection_cache is not None and not args.mask and args.roi is None:
+        # previews of the unmasked image are drawn on its cached pyramid, so huge images are only downsampled once
+        image = detection_cache.pyramid(bundle)
+    
+    if args.visual or args.figloc:
+        with profiling.stage("visualize"):
+            from src.helper.output import out
+            out.gen_visualization(image, clusters, args.visual, args.figloc)
     
-    out.gen_visualization(image, clusters, args.visual, args.figloc)
+    bundle_catalog.save()  # keep the scale bar position found while loading the image
 
 
 if __name__ == "__main__":
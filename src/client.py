@@ -0,0 +1,111 @@
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+from typing import Iterator
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden client",
+        description="Analyze an image bundle on a running Golden server (see src.server), which keeps images and "
+                    "detected particles in memory between runs"
+    )
+
+    parser.add_argument(
+        "name",
+        type=str,
+        help="The name of the dataset to analyze, e.g., 'S1' or 'S7'"
+    )
+
+    parser.add_argument(
+        "--url",
+        type=str,
+        default=DEFAULT_URL,
+        help=f"The address of the server. Default: {DEFAULT_URL}"
+    )
+
+    parser.add_argument(
+        "-m", "--mask",
+        action="store_true",
+        help="Whether to apply the mask to the image before finding gold particles. Default: False"
+    )
+
+    parser.add_argument("--tile-size", type=int, default=None, help="See src.cli")
+    parser.add_argument("--threshold-method", type=str, default="mean", help="See src.cli. Default: 'mean'")
+    parser.add_argument("--cluster-method", type=str, default="dbscan", help="See src.cli. Default: 'dbscan'")
+    parser.add_argument("--eps-nm", type=float, default=None, help="See src.cli")
+
+    parser.add_argument(
+        "--dataloc",
+        type=str,
+        default=None,
+        help="The location to store the data file, as with src.cli. If not specified, the data will not be saved."
+    )
+
+    return parser.parse_args()
+
+
+def analyze(url: str, job: dict) -> Iterator[dict]:
+    """
+    Submits a job to the server and yields its messages as they arrive
+
+    :param url: The address of the server
+    :param job: The job parameters (see server.Job)
+    :return: The messages of the job (see server.Analyzer.run)
+    :raises urllib.error.HTTPError: If the server rejects the job. A 503 means the server is busy
+    """
+
+    request = urllib.request.Request(
+        f"{url}/analyze", data=json.dumps(job).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            yield json.loads(line)
+
+
+def main():
+    args = get_args()
+
+    job = {
+        "name": args.name,
+        "mask": args.mask,
+        "tile_size": args.tile_size,
+        "threshold_method": args.threshold_method,
+        "cluster_method": args.cluster_method,
+        "eps_nm": args.eps_nm
+    }
+
+    columns = {}
+
+    try:
+        for message in analyze(args.url, job):
+            if message["event"] == "rows":
+                for name, values in message["columns"].items():
+                    columns.setdefault(name, []).extend(values)
+            elif message["event"] == "error":
+                sys.exit(f"The job failed: {message['error']}")
+            else:
+                print(" ".join(f"{key}={value}" for key, value in message.items()))
+    except urllib.error.HTTPError as e:
+        sys.exit(f"The server rejected the job ({e.code}): {json.loads(e.read()).get('error')}")
+    except urllib.error.URLError as e:
+        sys.exit(f"Could not reach the server at {args.url}: {e.reason}")
+
+    if args.dataloc is not None:
+        # imported here so the client starts without numpy, pandas or pyarrow unless it writes a file
+        import numpy as np
+        from src.helper.output import writer
+
+        writer.write_columns(
+            {name: np.asarray(values) for name, values in columns.items()}, args.dataloc,
+            writer.format_of(args.dataloc, default="csv")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,187 @@
-from sklearn.cluster import DBSCAN
-
 import numpy as np
 
+from src.helper import particles, profiling, units, union_find
+
+METHODS = ("dbscan", "hdbscan", "grid")
+DEFAULT_METHOD = "dbscan"
+
 
-def gold_cluster(particle_locs: list[tuple[int, int]], image_dim: tuple[int, int]) -> dict[int, list[tuple[int, int]]]:
+@profiling.stage("gold_cluster")
+def gold_cluster(particle_locs: list[tuple[int, int]] | np.ndarray, image_dim: tuple[int, int],
+                 method: str = DEFAULT_METHOD, eps_nm: float | None = None, min_samples: int = 3,
+                 n_jobs: int | None = None) -> dict[int, list[tuple[int, int]]]:
     """
     Clusters the immunigold particles
     
     :param particle_locs: The particle locations
     :param image_dim: The image dimensions
+    :param method: The clustering algorithm. One of METHODS: 'dbscan' (sklearn, ball tree), 'hdbscan' (sklearn) or
+                   'grid' (DBSCAN with a grid hash for the neighbor search)
+    :param eps_nm: The neighborhood radius for 'dbscan' and 'grid', in nanometers. If None, a rough estimate based on
+                   the image dimensions is used. 'hdbscan' doesn't use a fixed radius, so this only sets its
+                   cluster_selection_epsilon
+    :param min_samples: The number of particles (including itself) within eps of a particle for it to be a core point
+    :param n_jobs: The number of parallel jobs for the sklearn methods. None means 1
     :return: A dictionary of the cluster name and a list of its points
     """
     
-    clustering = DBSCAN(
-        eps=min(image_dim) / 10,  # just provide a rough estimate of a good EPS
-        min_samples=3
-    )
+    points = np.asarray(particle_locs).reshape(-1, 2)
+    
+    if len(points) == 0:
+        return {}
+    
+    return group_by_label(points, cluster_labels(points, image_dim, method, eps_nm, min_samples, n_jobs))
+
+
+@profiling.stage("gold_cluster")
+def cluster_table(table: particles.ParticleTable, image_dim: tuple[int, int], method: str = DEFAULT_METHOD,
+                  eps_nm: float | None = None, min_samples: int = 3,
+                  n_jobs: int | None = None) -> particles.ParticleTable:
+    """
+    Clusters the immunogold particles of a table in place: sets the cluster_id of each particle and sorts the table by
+    cluster (see ParticleTable.sort_by_cluster). The clusters are the same as gold_cluster's
+    
+    :param table: The particles
+    :param image_dim: See gold_cluster
+    :param method: See gold_cluster
+    :param eps_nm: See gold_cluster
+    :param min_samples: See gold_cluster
+    :param n_jobs: See gold_cluster
+    :return: The table
+    """
+    
+    if len(table) == 0:
+        return table.sort_by_cluster()
+    
+    return table.sort_by_cluster(cluster_labels(table.pixels, image_dim, method, eps_nm, min_samples, n_jobs))
+
+
+def cluster_labels(points: np.ndarray, image_dim: tuple[int, int], method: str = DEFAULT_METHOD,
+                   eps_nm: float | None = None, min_samples: int = 3, n_jobs: int | None = None) -> np.ndarray:
+    """
+    :param points: An (n, 2) array of at least one particle location
+    :return: The cluster label of each particle. -1 = noise. See gold_cluster for the other parameters
+    """
+    
+    if eps_nm is not None:
+        eps = units.nanometers_to_pixels(eps_nm)[0]
+    else:
+        eps = min(image_dim) / 10  # just provide a rough estimate of a good EPS
+    
+    if method == "dbscan":
+        from sklearn.cluster import DBSCAN  # sklearn takes about a second to import, so only its methods import it
+        
+        labels = DBSCAN(eps=eps, min_samples=min_samples, algorithm="ball_tree", n_jobs=n_jobs).fit_predict(points)
+    elif method == "hdbscan":
+        from sklearn.cluster import HDBSCAN
+        
+        labels = HDBSCAN(
+            min_cluster_size=max(min_samples, 2),
+            min_samples=min_samples,
+            cluster_selection_epsilon=eps if eps_nm is not None else 0.0,
+            n_jobs=n_jobs,
+            copy=True
+        ).fit_predict(points)
+    elif method == "grid":
+        labels = grid_dbscan(points, eps, min_samples)
+    else:
+        raise ValueError(f"Unknown clustering method '{method}'. Expected one of {list(METHODS)}")
+    
+    return labels
+
+
+def group_by_label(points: np.ndarray, labels: np.ndarray) -> dict[int, list[tuple[int, int]]]:
+    """
+    Groups points by their cluster label with a single sort
+    
+    :param points: An (n, 2) array of points
+    :param labels: The cluster label of each point
+    :return: A dictionary of the cluster label and a list of its points, in ascending label order
+    """
+    
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    
+    unique_labels, starts = np.unique(sorted_labels, return_index=True)
+    groups = np.split(points[order], starts[1:])
+    
+    return {
+        int(label): [tuple(point) for point in group.tolist()]
+        for label, group in zip(unique_labels, groups)
+    }
+
 
-    clusters = clustering.fit_predict(np.array(particle_locs))
+def neighbor_pairs(points: np.ndarray, eps: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds every pair of points within eps of each other (including each point paired with itself) by hashing the points
+    into a grid of eps-sized cells, so only points in the 3x3 block of cells around each point are compared
+    
+    :param points: An (n, 2) array of points
+    :param eps: The neighborhood radius
+    :return: [the first point of each pair, the second point of each pair], as indices into points
+    """
+    
+    cells = np.floor((points - points.min(axis=0)) / eps).astype(np.int64)
+    row_length = cells[:, 1].max() + 3  # leave room so the cell offsets below never wrap into another row
+    keys = (cells[:, 0] + 1) * row_length + cells[:, 1] + 1
+    
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    cell_keys, cell_starts, cell_counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+    
+    pairs_a = []
+    pairs_b = []
+    
+    for d_x in (-1, 0, 1):
+        for d_y in (-1, 0, 1):
+            neighbor_keys = keys + d_x * row_length + d_y
+            
+            cell = np.clip(np.searchsorted(cell_keys, neighbor_keys), 0, len(cell_keys) - 1)
+            counts = np.where(cell_keys[cell] == neighbor_keys, cell_counts[cell], 0)
+            
+            total = counts.sum()
+            candidates_a = np.repeat(np.arange(len(points)), counts)
+            candidates_b = order[
+                np.repeat(cell_starts[cell], counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            ]
+            
+            distance_squared = ((points[candidates_a] - points[candidates_b]) ** 2).sum(axis=1)
+            within = distance_squared <= eps ** 2
+            
+            pairs_a.append(candidates_a[within])
+            pairs_b.append(candidates_b[within])
+    
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def grid_dbscan(points: np.ndarray, eps: float, min_samples: int) -> np.ndarray:
+    """
+    DBSCAN with a grid-hash neighbor search. This gives the same labels as sklearn's DBSCAN: clusters are numbered in
+    the order of their first core point, and a border point joins the lowest numbered cluster it neighbors.
+    
+    :param points: An (n, 2) array of points
+    :param eps: The neighborhood radius
+    :param min_samples: The number of points (including itself) within eps of a point for it to be a core point
+    :return: The cluster label of each point. -1 = noise
+    """
+    
+    points = points.astype(float)
+    pairs_a, pairs_b = neighbor_pairs(points, eps)
+    
+    is_core = np.bincount(pairs_a, minlength=len(points)) >= min_samples
+    
+    core_edges = is_core[pairs_a] & is_core[pairs_b]
+    roots = union_find.connected_components(len(points), pairs_a[core_edges], pairs_b[core_edges])
+    
+    # roots are the smallest point index in each cluster, so ranking them numbers clusters by their first core point
+    labels = np.full(len(points), -1, dtype=np.intp)
+    labels[is_core] = np.unique(roots[is_core], return_inverse=True)[1]
+    
+    border_edges = ~is_core[pairs_a] & is_core[pairs_b]
+    border_labels = np.full(len(points), np.iinfo(np.intp).max, dtype=np.intp)
+    np.minimum.at(border_labels, pairs_a[border_edges], labels[pairs_b[border_edges]])
     
-    cluster_dict = {}
-    for cluster_num in set(clusters):
-        # generate a list of the particle locations only if the cluster == cluster_num
-        cluster_dict[cluster_num] = [
-            tuple(particle_locs[i])
-            for i, cluster in enumerate(clusters)
-            if cluster == cluster_num
-        ]
+    is_border = ~is_core & (border_labels != np.iinfo(np.intp).max)
+    labels[is_border] = border_labels[is_border]
     
-    return cluster_dict
+    return labels
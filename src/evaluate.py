@@ -0,0 +1,146 @@
+import argparse
+import dataclasses
+import json
+import time
+
+from src.evaluation import evaluation
+from src.helper import catalog
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden evaluate",
+        description="Evaluate the gold particles found in each image bundle against the bundle's ground truth"
+    )
+    
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="The names of the bundles to evaluate. Default: every bundle"
+    )
+    
+    parser.add_argument(
+        "--data",
+        type=str,
+        default="./data/analyzed synapses/",
+        help="The directory that contains one subdirectory per image bundle. Default: './data/analyzed synapses/'"
+    )
+    
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. Default: the number of CPUs"
+    )
+    
+    parser.add_argument(
+        "-m", "--mask",
+        action="store_true",
+        help="Whether to apply the mask to each image before finding gold particles. Default: False"
+    )
+    
+    parser.add_argument("--mask-threshold", type=float, default=0.7, help="GoldFinder's mask_threshold. Default: 0.7")
+    parser.add_argument("--circle-threshold", type=float, default=0.4, help="GoldFinder's circle_threshold. Default: 0.4")
+    parser.add_argument("--min-pixels", type=int, default=15, help="GoldFinder's min_pixels. Default: 15")
+    
+    parser.add_argument(
+        "--prefilter",
+        type=int,
+        default=None,
+        help="Find candidate regions on the image downsampled by this factor first (GoldFinder's prefilter), e.g. 4"
+    )
+    
+    parser.add_argument(
+        "--recall-loss",
+        action="store_true",
+        help="Also evaluate without the prefilter and report the recall lost and the time saved by it"
+    )
+    
+    parser.add_argument(
+        "--json",
+        type=str,
+        default=None,
+        help="The file to write the per-bundle and total metrics to, as JSON"
+    )
+    
+    args = parser.parse_args()
+    
+    if args.recall_loss and args.prefilter is None:
+        parser.error("--recall-loss needs --prefilter")
+    
+    return args
+
+
+def print_recall_loss(full: list[evaluation.Evaluation], prefiltered: list[evaluation.Evaluation], full_time: float,
+                      prefiltered_time: float) -> None:
+    """
+    Prints how much recall the prefilter loses on each bundle and in total, and how much time it saves
+    
+    :param full: The evaluations without the prefilter
+    :param prefiltered: The evaluations with the prefilter, in the same order
+    :param full_time: The seconds the evaluations without the prefilter took
+    :param prefiltered_time: The seconds the evaluations with the prefilter took
+    """
+    
+    print("\n--- RECALL LOSS OF THE PREFILTER ---")
+    
+    for without, with_prefilter in [*zip(full, prefiltered), (total_of(full), total_of(prefiltered))]:
+        print(f"{without.name:>12}: recall {without.overall.recall:.3f} -> {with_prefilter.overall.recall:.3f} "
+              f"(loss {without.overall.recall - with_prefilter.overall.recall:.3f}, "
+              f"{without.overall.true_positive - with_prefilter.overall.true_positive} particles)")
+    
+    print(f"time: {full_time:.2f}s -> {prefiltered_time:.2f}s ({full_time / prefiltered_time:.2f}x)")
+
+
+def total_of(evaluations: list[evaluation.Evaluation]) -> evaluation.Evaluation:
+    """
+    :return: The sum of the evaluations, named 'total'. The evaluations are not modified
+    """
+    
+    if not evaluations:
+        return evaluation.Evaluation("total")
+    
+    return sum(evaluations[1:], dataclasses.replace(evaluations[0], name="total"))
+
+
+def main():
+    args = get_args()
+    
+    bundle_catalog = catalog.BundleCatalog(args.data)
+    bundles = [bundle_catalog.get(name) for name in args.names] if args.names else list(bundle_catalog)
+    
+    finder_kwargs = {
+        "mask_threshold": args.mask_threshold,
+        "circle_threshold": args.circle_threshold,
+        "min_pixels": args.min_pixels
+    }
+    
+    start = time.perf_counter()
+    evaluations = evaluation.evaluate_bundles(
+        bundles, workers=args.workers, use_mask=args.mask, prefilter=args.prefilter, **finder_kwargs
+    )
+    elapsed = time.perf_counter() - start
+    
+    for bundle_evaluation in evaluations:
+        print(bundle_evaluation)
+    
+    total = total_of(evaluations)
+    
+    print(total)
+    print(f"\n{len(evaluations)} bundles evaluated in {elapsed:.2f}s")
+    
+    if args.recall_loss:
+        start = time.perf_counter()
+        full = evaluation.evaluate_bundles(bundles, workers=args.workers, use_mask=args.mask, **finder_kwargs)
+        print_recall_loss(full, evaluations, time.perf_counter() - start, elapsed)
+    
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({
+                "bundles": [bundle_evaluation.to_dict() for bundle_evaluation in evaluations],
+                "total": total.to_dict()
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+
+from scipy.spatial import cKDTree
+from PIL import Image
+
+import numpy as np
+
+from src.gold_finder import gold_finder as gf
+from src.helper import units as uc, preprocessing, data_loading as dl
+
+POSITIVE_DISTANCE_NM = 10  # units: nanometers, the leeway for a predicted gold particle position vs actual position
+POSITIVE_DISTANCE_MICRONS = POSITIVE_DISTANCE_NM / 1000
+
+# Ground truth classes, in the order detections are matched to them
+SIZE_CLASSES = ("12nm", "6nm")
+
+
+@dataclass
+class ClassMetrics:
+    true_positive: int = 0
+    false_negative: int = 0
+    false_positive: int | None = None  # None if the detections can't be attributed to this class
+
+    @property
+    def precision(self) -> float:
+        if self.false_positive is None or self.true_positive + self.false_positive == 0:
+            return float("nan")
+
+        return self.true_positive / (self.true_positive + self.false_positive)
+
+    @property
+    def recall(self) -> float:
+        if self.true_positive + self.false_negative == 0:
+            return float("nan")
+
+        return self.true_positive / (self.true_positive + self.false_negative)
+
+    @property
+    def f1(self) -> float:
+        if self.precision + self.recall == 0:
+            return 0.0
+
+        return 2 * self.precision * self.recall / (self.precision + self.recall)
+
+    def __add__(self, other: "ClassMetrics") -> "ClassMetrics":
+        false_positive = None
+        if self.false_positive is not None and other.false_positive is not None:
+            false_positive = self.false_positive + other.false_positive
+
+        return ClassMetrics(
+            self.true_positive + other.true_positive,
+            self.false_negative + other.false_negative,
+            false_positive
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "true_positive": self.true_positive,
+            "false_positive": self.false_positive,
+            "false_negative": self.false_negative,
+            "precision": self.precision,
+            "recall": self.recall,
+            "f1": self.f1
+        }
+
+
+@dataclass
+class Evaluation:
+    name: str
+    classes: dict[str, ClassMetrics] = field(default_factory=lambda: {size: ClassMetrics() for size in SIZE_CLASSES})
+    overall: ClassMetrics = field(default_factory=lambda: ClassMetrics(false_positive=0))
+
+    def __add__(self, other: "Evaluation") -> "Evaluation":
+        return Evaluation(
+            "total",
+            {size: self.classes[size] + other.classes[size] for size in SIZE_CLASSES},
+            self.overall + other.overall
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "overall": self.overall.to_dict(),
+            **{size: metrics.to_dict() for size, metrics in self.classes.items()}
+        }
+
+    def __str__(self) -> str:
+        lines = [f"--- {self.name} ---"]
+
+        for label, metrics in (("overall", self.overall), *self.classes.items()):
+            lines.append(
+                f"{label:>8}: TP {metrics.true_positive:5d}  FP {str(metrics.false_positive):>5}  "
+                f"FN {metrics.false_negative:5d}  precision {metrics.precision:.3f}  recall {metrics.recall:.3f}  "
+                f"F1 {metrics.f1:.3f}"
+            )
+
+        return "\n".join(lines)
+
+
+def match(detections: np.ndarray, truth: np.ndarray, max_distance: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Matches detections to ground truth one-to-one. Candidate pairs within max_distance are found with KD-trees, then
+    accepted from the closest to the farthest as long as neither side is already matched
+
+    :param detections: An (n, 2) array of detected locations
+    :param truth: An (m, 2) array of ground truth locations, in the same units as detections
+    :param max_distance: The largest distance at which a detection can match a ground truth location
+    :return: [the indices of the matched detections, the indices of the ground truth they matched]
+    """
+
+    if len(detections) == 0 or len(truth) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    pairs = cKDTree(detections).sparse_distance_matrix(cKDTree(truth), max_distance, output_type="ndarray")
+    pairs = pairs[np.argsort(pairs["v"], kind="stable")]
+
+    detection_used = np.zeros(len(detections), dtype=bool)
+    truth_used = np.zeros(len(truth), dtype=bool)
+    matched_detections = []
+    matched_truth = []
+
+    for detection, truth_index in zip(pairs["i"].tolist(), pairs["j"].tolist()):
+        if detection_used[detection] or truth_used[truth_index]:
+            continue
+
+        detection_used[detection] = truth_used[truth_index] = True
+        matched_detections.append(detection)
+        matched_truth.append(truth_index)
+
+    return np.array(matched_detections, dtype=np.intp), np.array(matched_truth, dtype=np.intp)
+
+
+def evaluate(name: str, detections: list[tuple[int, int]] | np.ndarray, truth: dict[str, np.ndarray],
+             mask: Image.Image | np.ndarray | None = None, detection_classes: np.ndarray | None = None) -> Evaluation:
+    """
+    Evaluates detected gold particles against the ground truth
+
+    Detections outside the mask that don't match the ground truth are not counted as false positives, since the ground
+    truth data also includes some particles that are not in the mask.
+
+    :param name: The name of the evaluation (e.g., the bundle name)
+    :param detections: The detected particle locations, in pixels (x, y)
+    :param truth: The ground truth locations in microns (x, y), keyed by size class (see SIZE_CLASSES)
+    :param mask: The mask of the image. Pixels where the mask is white are outside of it. If None, every detection is
+                 treated as inside the mask
+    :param detection_classes: The predicted size class of each detection (e.g., '6nm'). If given, false positives
+                              are attributed to the classes, so per-class precision can be reported
+    :return: The evaluation
+    """
+
+    detections = np.asarray(detections, dtype=float).reshape(-1, 2)
+    detections_microns = np.column_stack(uc.pixels_to_microns(detections[:, 0], detections[:, 1]))
+
+    if mask is not None:
+        pixels = detections.astype(np.intp)
+        in_mask = preprocessing.as_array(mask)[pixels[:, 1], pixels[:, 0]] != 255
+    else:
+        in_mask = np.ones(len(detections), dtype=bool)
+
+    evaluation = Evaluation(name)
+    unmatched = np.ones(len(detections), dtype=bool)
+
+    for size in SIZE_CLASSES:
+        candidates = np.flatnonzero(unmatched)
+        matched, _ = match(detections_microns[candidates], truth[size], POSITIVE_DISTANCE_MICRONS)
+        unmatched[candidates[matched]] = False
+
+        evaluation.classes[size].true_positive = len(matched)
+        evaluation.classes[size].false_negative = len(truth[size]) - len(matched)
+
+    false_positive = unmatched & in_mask
+
+    if detection_classes is not None:
+        for size in SIZE_CLASSES:
+            evaluation.classes[size].false_positive = int(np.count_nonzero(false_positive & (detection_classes == size)))
+
+    evaluation.overall = sum(evaluation.classes.values(), ClassMetrics(false_positive=0))
+    evaluation.overall.false_positive = int(np.count_nonzero(false_positive))
+
+    return evaluation
+
+
+def bundle_truth(bundle: dl.ImageBundle) -> dict[str, np.ndarray]:
+    """
+    :return: The ground truth locations of a bundle in microns (x, y), keyed by size class
+    """
+
+    truth = {"6nm": bundle.ground_truth_6nm, "12nm": bundle.ground_truth_12nm}
+
+    return {
+        size: df[["X", "Y"]].to_numpy(dtype=float) if df is not None else np.zeros((0, 2))
+        for size, df in truth.items()
+    }
+
+
+def evaluate_bundle(bundle: dl.ImageBundle, use_mask: bool = False, **finder_kwargs) -> Evaluation:
+    """
+    Finds the gold particles in a bundle and evaluates them against its ground truth
+
+    :param bundle: The image bundle (or catalog entry)
+    :param use_mask: Whether to apply the mask before finding gold particles
+    :param finder_kwargs: Keyword arguments for GoldFinder (e.g., mask_threshold)
+    :return: The evaluation
+    """
+
+    preprocessed = preprocessing.preprocess(bundle.image, bundle.mask if use_mask else None)
+
+    particles = gf.GoldFinder(
+        preprocessed.image, img_luminosity=preprocessed.stats.mean, **finder_kwargs
+    ).find_particles()
+
+    return evaluate(
+        bundle.name, np.column_stack((particles["x"], particles["y"])), bundle_truth(bundle), bundle.mask,
+        particles["size_class"]
+    )
+
+
+def evaluate_bundles(bundles: list[dl.ImageBundle], workers: int | None = None, use_mask: bool = False,
+                     **finder_kwargs) -> list[Evaluation]:
+    """
+    Evaluates bundles in parallel with a process pool
+
+    :param bundles: The image bundles. Catalog entries are best, since they are loaded in the worker processes
+    :param workers: The number of worker processes. If None, the number of CPUs
+    :param use_mask: Whether to apply the mask before finding gold particles
+    :param finder_kwargs: Keyword arguments for GoldFinder (e.g., mask_threshold)
+    :return: The evaluation of each bundle, in the same order as bundles
+    """
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(evaluate_bundle, bundle, use_mask, **finder_kwargs) for bundle in bundles]
+        return [future.result() for future in futures]
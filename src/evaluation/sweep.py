@@ -0,0 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from src.evaluation import evaluation
+from src.gold_finder import gold_finder as gf
+from src.helper import preprocessing, data_loading as dl
+
+
+def sweep_bundle(bundle: dl.ImageBundle, mask_thresholds: list[float], circle_thresholds: list[float],
+                 min_pixels: list[int], use_mask: bool = False) -> list[dict]:
+    """
+    Evaluates every parameter combination on one bundle. The image is preprocessed once, splotches are labeled and
+    scored once per mask threshold, and each circle threshold / min pixels combination only filters those statistics
+
+    :param bundle: The image bundle (or catalog entry)
+    :param mask_thresholds: The values of GoldFinder's mask_threshold to try
+    :param circle_thresholds: The values of GoldFinder's circle_threshold to try
+    :param min_pixels: The values of GoldFinder's min_pixels to try
+    :param use_mask: Whether to apply the mask before finding gold particles
+    :return: One row of parameters and metrics per combination
+    """
+
+    preprocessed = preprocessing.preprocess(bundle.image, bundle.mask if use_mask else None)
+    truth = evaluation.bundle_truth(bundle)
+
+    rows = []
+
+    for mask_threshold in mask_thresholds:
+        stats = gf.GoldFinder(
+            preprocessed.image, img_luminosity=preprocessed.stats.mean, mask_threshold=mask_threshold
+        ).get_component_stats()
+
+        for circle_threshold, pixels in product(circle_thresholds, min_pixels):
+            particles = stats.particles(stats.accepted(pixels, circle_threshold))
+            result = evaluation.evaluate(
+                bundle.name, np.column_stack((particles["x"], particles["y"])), truth, bundle.mask,
+                particles["size_class"]
+            )
+
+            rows.append({
+                "bundle": bundle.name,
+                "mask_threshold": mask_threshold,
+                "circle_threshold": circle_threshold,
+                "min_pixels": pixels,
+                **metric_columns(result)
+            })
+
+    return rows
+
+
+def metric_columns(result: evaluation.Evaluation) -> dict:
+    """
+    :return: The evaluation's counts and metrics as flat columns, e.g. 'f1' and '12nm_recall'
+    """
+
+    columns = {}
+
+    for prefix, metrics in (("", result.overall), *((f"{size}_", m) for size, m in result.classes.items())):
+        columns[f"{prefix}true_positive"] = metrics.true_positive
+        columns[f"{prefix}false_negative"] = metrics.false_negative
+        columns[f"{prefix}recall"] = metrics.recall
+
+        if metrics.false_positive is not None:
+            columns[f"{prefix}false_positive"] = metrics.false_positive
+            columns[f"{prefix}precision"] = metrics.precision
+            columns[f"{prefix}f1"] = metrics.f1
+
+    return columns
+
+
+def sweep(bundles: list[dl.ImageBundle], mask_thresholds: list[float], circle_thresholds: list[float],
+          min_pixels: list[int], use_mask: bool = False, workers: int | None = None) -> pd.DataFrame:
+    """
+    Evaluates every parameter combination on every bundle, one bundle per worker process
+
+    :param bundles: The image bundles. Catalog entries are best, since they are loaded in the worker processes
+    :param mask_thresholds: The values of GoldFinder's mask_threshold to try
+    :param circle_thresholds: The values of GoldFinder's circle_threshold to try
+    :param min_pixels: The values of GoldFinder's min_pixels to try
+    :param use_mask: Whether to apply the mask before finding gold particles
+    :param workers: The number of worker processes. If None, the number of CPUs
+    :return: A grid with one row per bundle and combination, plus one 'total' row per combination that sums the counts
+             over every bundle
+    """
+
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(sweep_bundle, bundle, mask_thresholds, circle_thresholds, min_pixels, use_mask)
+            for bundle in bundles
+        ]
+
+        for future in as_completed(futures):
+            rows.extend(future.result())
+
+    grid = pd.DataFrame(rows)
+
+    params = ["mask_threshold", "circle_threshold", "min_pixels"]
+    totals = []
+
+    for values, group in grid.groupby(params, sort=True):
+        total = evaluation.ClassMetrics(
+            int(group["true_positive"].sum()), int(group["false_negative"].sum()), int(group["false_positive"].sum())
+        )
+
+        totals.append({"bundle": "total", **dict(zip(params, values)), **metric_columns(evaluation.Evaluation(
+            "total",
+            {
+                size: evaluation.ClassMetrics(
+                    int(group[f"{size}_true_positive"].sum()), int(group[f"{size}_false_negative"].sum())
+                )
+                for size in evaluation.SIZE_CLASSES
+            },
+            total
+        ))})
+
+    return pd.concat([grid.sort_values(["bundle", *params]), pd.DataFrame(totals)], ignore_index=True)
@@ -1,16 +1,26 @@
-import sys
-
 from PIL import Image
 
 import numpy as np
 
+import inspect
+import math
+
+from src.gold_finder import labeling, scoring, tiling
+from src.helper import masking, particles, preprocessing, profiling, units
+
+MAX_PARTICLE_DIAMETER_NM = 20  # larger than the 12nm particles plus the blur around them
+DEFAULT_HALO = math.ceil(MAX_PARTICLE_DIAMETER_NM * units.PIXEL_PER_NM)
+
 
 class GoldFinder:
-    def __init__(self, image: Image, img_luminosity: float | None = None, mask_threshold: float = 0.7,
-                 circle_threshold: float = 0.4, min_pixels: int = 15):
+    def __init__(self, image: Image.Image | np.ndarray, img_luminosity: float | None = None, mask_threshold: float = 0.7,
+                 circle_threshold: float = 0.4, min_pixels: int = 15, tile_size: int | None = None,
+                 halo: int = DEFAULT_HALO, threshold: float | np.ndarray | None = None, prefilter: int | None = None,
+                 region: masking.Region | None = None):
         """
         
-        :param image: The image (which only has a luminosity channel) to analyze
+        :param image: The image (which only has a luminosity channel) to analyze. This can also be a 2D uint8 array,
+                      such as a np.memmap of an image that does not fit in memory
         :param img_luminosity: The average luminosity of the original image. This is useful if the provided image is
                             masked. Providing the average luminosity of the original image will provide slightly more
                             accurate results. If None, it will be calculated from the image parameter.
@@ -19,6 +29,21 @@ class GoldFinder:
         :param circle_threshold: The percentage of points that must be within the inscribed circle for the splotch to be
                             considered a circle
         :param min_pixels: The minimum number of pixels for a splotch to be considered a gold particle
+        :param tile_size: If not None, the image is processed in tiles of this size so that peak memory is proportional
+                          to the tile size instead of the image size. If None, the image is processed all at once
+        :param halo: The overlap between tiles, in pixels. Must be at least the diameter of the largest gold particle,
+                     since particles that are cut off by the edge of a tile are left to the neighboring tile
+        :param threshold: The luminosity a pixel must be lower than to be considered part of a splotch, either one value
+                          or a per-pixel array with the same shape as the image (see helper.preprocessing). If None, it
+                          is img_luminosity * mask_threshold
+        :param prefilter: If not None, a pass over the image downsampled by this factor proposes candidate windows, and
+                          splotches are only labeled and scored at full resolution inside them (see
+                          prefilter.candidate_tiles). This is faster on images with few dark regions, but can miss
+                          particles that are smaller than a block. If the windows would cover too much of the image,
+                          the whole image is processed as usual
+        :param region: If not None, only the pixels in this region (e.g., the synapse of a mask or an ImageJ ROI, see
+                       helper.masking and helper.roi) are scanned, so the time taken is proportional to the region's
+                       size instead of the image's. Pixels outside it are never part of a splotch
         """
         
         self.image = image
@@ -27,162 +52,263 @@ class GoldFinder:
         self.mask_threshold = mask_threshold
         self.circle_threshold = circle_threshold
         self.min_pixels = min_pixels
-        self.processed_coords = set()
+        self.tile_size = tile_size
+        self.halo = halo
+        self.threshold = threshold
+        self.prefilter = prefilter
+        self.region = region
     
-    def find_gold(self) -> list[tuple[int, int]]:
+    def params(self) -> dict:
         """
-        :return: A list of coordinates of the gold particles, in pixels
+        :return: The parameters that affect which gold particles are found
         """
         
-        luminosity = self.img_luminosity if self.img_luminosity is not None else self.get_avg_luminosity(self.image)
+        return GoldFinder.default_params(**{name: getattr(self, name) for name in GoldFinder.setting_names()})
+    
+    @staticmethod
+    def setting_names() -> list[str]:
+        """
+        :return: The names of the constructor arguments other than the image
+        """
         
-        masked = self.mask_on_luminosity(luminosity * self.mask_threshold)
-        bool_array = np.array(masked.getdata()).reshape(masked.size[::-1])
+        return [name for name in inspect.signature(GoldFinder.__init__).parameters if name not in ("self", "image")]
+    
+    @staticmethod
+    def default_params(**settings) -> dict:
+        """
+        The parameters of a finder, without making one (e.g., to look up a cached detection before the image is loaded)
+        
+        :param settings: The constructor arguments (other than the image) that differ from the defaults
+        :return: The parameters that affect which gold particles a finder with these settings finds (see params)
+        """
+        
+        names = GoldFinder.setting_names()
         
-        original_recursion_limit = sys.getrecursionlimit()
-        sys.setrecursionlimit(1000000)  # big number for the next function, which is recursive
+        if not set(settings) <= set(names):
+            raise TypeError(f"Unknown GoldFinder settings: {sorted(set(settings) - set(names))}")
         
-        circle_coords = self.find_circles(bool_array)
+        arguments = inspect.signature(GoldFinder.__init__).parameters
+        settings = {name: settings.get(name, arguments[name].default) for name in names}
         
-        sys.setrecursionlimit(original_recursion_limit)
+        threshold, region = settings["threshold"], settings["region"]
+        settings["threshold"] = threshold if not isinstance(threshold, np.ndarray) else "per-pixel"
+        settings["region"] = region.box if region is not None else None
         
-        # flip the x and y for some reason
-        return [(coord[1], coord[0]) for coord in circle_coords]
+        return settings
     
-    @staticmethod
-    def get_avg_luminosity(image: Image) -> float:
+    def tiles(self) -> list[tiling.Tile]:
+        """
+        :return: The tiles the image is processed in. If tile_size is None, a single tile covers the whole image (or the
+                 region's bounding box). Tiles with no pixel of the region are left out
         """
-        Returns the average luminosity of an image
         
-        :param image: The image to get the average luminosity of
-        :return: The average luminosity of the image
+        size = tiling.image_size(self.image)
+        
+        if self.region is None and self.tile_size is None:
+            return [tiling.Tile(core=(0, 0, *size), outer=(0, 0, *size))]
+        
+        box = self.region.box if self.region is not None else None
+        
+        if self.tile_size is None:
+            # one pixel of halo, so splotches that touch the edge of the box aren't taken as cut off by the tile
+            tiles = list(tiling.iter_tiles(size, max(size), 1, box))
+        else:
+            tiles = list(tiling.iter_tiles(size, self.tile_size, self.halo, box))
+        
+        return self.in_region(tiles)
+    
+    def in_region(self, tiles: list[tiling.Tile]) -> list[tiling.Tile]:
+        """
+        :return: The tiles whose core region has a pixel in the region. A particle's center is one of its pixels, so the
+                 other tiles can't have any
         """
         
-        image_array = np.array(image.getdata())
-        filtered_array = image_array[image_array < 255]
-        # filter the array to remove white pixels since applying the
-        # mask will make all masked pixels white. This can skew results
+        if self.region is None:
+            return tiles
         
-        return np.mean(filtered_array)
+        return [tile for tile in tiles if self.region.intersects(tile.core)]
     
-    def mask_on_luminosity(self, threshold: float) -> Image:
-        return self.image.point(lambda p: int(p < threshold), mode="1")
+    def find_gold(self) -> list[tuple[int, int]]:
+        """
+        :return: A list of coordinates of the gold particles, in pixels
+        """
+        
+        particles = self.find_particles()
+        
+        return list(zip(particles["pixel_x"].tolist(), particles["pixel_y"].tolist()))
     
-    @staticmethod
-    def get_all_splotch_coords(
-            image_data: np.array,
-            coords: tuple[int, int],
-            splotch_coords: set | None = None) \
-            -> set[tuple[int, int]]:
+    def find_table(self) -> particles.ParticleTable:
         """
-        Returns all coordinates of a splotch
-
-        :param image_data: The image gold_finder
-        :param coords: A coordinate that is on the splotch
-        :param splotch_coords: A set of coordinates that are already known to be part of the splotch
-        :return: A list of coordinates that are part of the splotch
+        :return: The gold particles as a table, which the later stages (clustering, density, output) fill in and read
+                 without converting it
         """
         
-        if not image_data[*coords]:
-            return set()  # not sure how this will happen, but it's a good idea to check for it
+        return particles.ParticleTable.from_particles(self.find_particles())
+    
+    @profiling.stage("find_gold")
+    def find_particles(self) -> np.ndarray:
+        """
+        Finds the gold particles along with their subpixel location, size and size class. These come from the same pass
+        over the image as find_gold
         
-        if splotch_coords is None:
-            splotch_coords = set()
+        :return: A structured array with scoring.PARTICLE_DTYPE, in the same order as find_gold
+        """
         
-        splotch_coords.add(coords)
+        tiles, threshold = self.plan()
         
-        for offset in ((-1, 0), (1, 0), (0, -1), (0, 1)):
-            new_coords = (coords[0] + offset[0], coords[1] + offset[1])
-            
-            coords_out_of_bounds = (new_coords[0] < 0 or new_coords[0] >= image_data.shape[0]
-                                    or new_coords[1] < 0 or new_coords[1] >= image_data.shape[1])
-            
-            # Check now to prevent is_white throwing a key error
-            if coords_out_of_bounds:
-                continue
+        return self.merge([self.find_circles_in_tile(tile, threshold) for tile in tiles])
+    
+    def plan(self) -> tuple[list[tiling.Tile], float | np.ndarray]:
+        """
+        :return: [the tiles (or prefilter windows) to find particles in with find_circles_in_tile, the threshold to
+                 pass to it]
+        """
+        
+        tiles = self.tiles()
+        threshold = self.get_threshold(tiles)
+        
+        if self.prefilter is not None:
+            from src.gold_finder import prefilter  # needs scipy.ndimage, which is slow to import
             
-            not_already_in_splotch = new_coords not in splotch_coords
-            is_white = image_data[*new_coords]
+            # a particle's splotch extends less than a block past the blocks that lie inside it
+            windows = prefilter.candidate_tiles(self.image, threshold, self.prefilter, 2 * self.prefilter)
             
-            if not_already_in_splotch and is_white:
-                splotch_coords.update(GoldFinder.get_all_splotch_coords(image_data, new_coords, splotch_coords))
+            if windows is not None:
+                tiles = self.in_region(windows)
+                profiling.count("prefilter_windows", len(windows))
         
-        return splotch_coords
+        return tiles, threshold
     
     @staticmethod
-    def get_perimeter_coords(splotch_coords: set[tuple[int, int]]) -> set[tuple[int, int]]:
+    def merge(results: list[tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
         """
-        Returns the coordinates of the perimeter of the splotch
-
-        :param splotch_coords: A set of coordinates that are part of the splotch
-        :return: A set of coordinates that are part of the perimeter of the splotch
+        :param results: The results of find_circles_in_tile for each tile, in any order
+        :return: The particles of every tile, in the order of find_particles
         """
         
-        perimeter_coords = set()
+        particles = [np.zeros(0, dtype=scoring.PARTICLE_DTYPE)] + [result[0] for result in results]
+        first_pixels = [np.zeros(0, dtype=np.int64)] + [result[1] for result in results]
         
-        for coord in splotch_coords:
-            for offset in ((-1, 0), (1, 0), (0, -1), (0, 1)):
-                new_coords = (coord[0] + offset[0], coord[1] + offset[1])
-                
-                # You can also check for black pixels here - might be faster.
-                # Only employ this optimization if you run into performance issues
-                if new_coords not in splotch_coords:
-                    perimeter_coords.add(coord)
-                    break
-        
-        return perimeter_coords
+        # order the particles by the first pixel of their splotch, which is the order a single pass over the whole
+        # image finds them in. A splotch in more than one (overlapping) prefilter window is only kept once
+        _, order = np.unique(np.concatenate(first_pixels), return_index=True)
+        return np.concatenate(particles)[order]
     
-    def analyze_splotch(self, image_data: np.array, coords: tuple[int, int]) \
-            -> tuple[bool, tuple[int, int]]:
+    def get_threshold(self, tiles: list[tiling.Tile] | None = None) -> float | np.ndarray:
         """
-        :param image_data: The image gold_finder
-        :param coords: A coordinate that is on the splotch
-        :return: [if it is a circle, center of the splotch]
+        :param tiles: The tiles to read the image in if the average luminosity has to be calculated
+        :return: The luminosity a pixel must be lower than to be considered part of a splotch
         """
         
-        splotch_coords = self.get_all_splotch_coords(image_data, coords)
-        self.processed_coords.update(splotch_coords)  # optimization that prevents analyzing the same splotch twice
+        if self.threshold is not None:
+            return self.threshold
+        
+        luminosity = self.img_luminosity
+        if luminosity is None:
+            luminosity = self.get_avg_luminosity(self.image, tiles)
+        
+        return luminosity * self.mask_threshold
+    
+    @staticmethod
+    def get_avg_luminosity(image: Image.Image | np.ndarray, tiles: list[tiling.Tile] | None = None) -> float:
+        """
+        Returns the average luminosity of an image
         
-        if len(splotch_coords) < self.min_pixels:
-            return False, coords
+        :param image: The image to get the average luminosity of
+        :param tiles: The tiles to read the image in. If None, the image is read all at once
+        :return: The average luminosity of the image
+        """
         
-        splotch_center = (sum(coord[0] for coord in splotch_coords) // len(splotch_coords),
-                          sum(coord[1] for coord in splotch_coords) // len(splotch_coords))
+        if tiles is None:
+            size = tiling.image_size(image)
+            tiles = [tiling.Tile(core=(0, 0, *size), outer=(0, 0, *size))]
         
-        if not image_data[*splotch_center]:
-            return False, splotch_center
+        histogram = np.zeros(256, dtype=np.int64)
+        for tile in tiles:
+            histogram += preprocessing.LuminosityStats.from_array(tiling.read_region(image, tile.core)).histogram
         
-        perimeter_coords = self.get_perimeter_coords(splotch_coords)
+        return preprocessing.LuminosityStats(histogram).mean
+    
+    def mask_on_luminosity(self, threshold: float | np.ndarray) -> np.ndarray:
+        """
+        :param threshold: The luminosity a pixel must be lower than to be considered part of a splotch
+        :return: A boolean array of the pixels that are part of a splotch
+        """
         
-        # Find the closest distance from the perimeter coords to splotch center
-        incircle_rad_squared = float("inf")
-        for coord in perimeter_coords:
-            dist_squared = (coord[0] - splotch_center[0]) ** 2 + (coord[1] - splotch_center[1]) ** 2
-            
-            if dist_squared < incircle_rad_squared:
-                incircle_rad_squared = dist_squared
+        return preprocessing.as_array(self.image) < threshold
+    
+    def get_component_stats(self) -> scoring.ComponentStats:
+        """
+        Labels and scores every splotch in the whole image (not in tiles). Since min_pixels and circle_threshold are only
+        used to filter these statistics, they can be reused to try many values of those parameters
+        
+        :return: The statistics of every splotch. Centers are (row, column)
+        """
         
-        # Find the percentage of points that are within the circle
-        num_points_in_circle = 0
-        for coord in splotch_coords:
-            if (coord[0] - splotch_center[0]) ** 2 + (coord[1] - splotch_center[1]) ** 2 <= incircle_rad_squared:
-                num_points_in_circle += 1
+        intensity = preprocessing.as_array(self.image)
+        image_data = intensity < self.get_threshold()
         
-        circle_score = num_points_in_circle / len(splotch_coords)
+        if self.region is not None:
+            image_data &= self.region.crop((0, 0, *tiling.image_size(self.image)))
         
-        return circle_score > self.circle_threshold, splotch_center
+        return scoring.component_stats(image_data, labeling.label_components(image_data), intensity)
     
     def find_circles(self, image_data: np.array) -> list[tuple[int, int]]:
-        splotch_centers = []
-        
-        for x in range(image_data.shape[0]):
-            for y in range(image_data.shape[1]):
-                if not image_data[x, y] or (x, y) in self.processed_coords:
-                    continue
-                
-                is_gold, coords = self.analyze_splotch(image_data, (x, y))
-                
-                if is_gold:
-                    splotch_centers.append(coords)
-        
-        return splotch_centers
+        components = labeling.label_components(image_data)
+        stats = scoring.component_stats(image_data, components)
+        
+        is_gold = stats.accepted(self.min_pixels, self.circle_threshold)
+        
+        return [tuple(center) for center in stats.center[is_gold].tolist()]
+    
+    def find_circles_in_tile(self, tile: tiling.Tile, threshold: float | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the gold particles whose center is in the tile's core region. Splotches that are cut off by the edge of
+        the tile (and not by the edge of the image) are skipped, since a neighboring tile sees them whole.
+        
+        :param tile: The tile to analyze
+        :param threshold: The luminosity a pixel must be lower than to be considered part of a splotch
+        :return: [the particles (see scoring.ComponentStats.particles), the flat index of each splotch's first pixel].
+                 Both are relative to the whole image
+        """
+        
+        left, top, right, bottom = tile.outer
+        width, height = tiling.image_size(self.image)
+        
+        if isinstance(threshold, np.ndarray):
+            threshold = tiling.read_region(threshold, tile.outer)
+        
+        intensity = tiling.read_region(self.image, tile.outer)
+        image_data = intensity < threshold
+        
+        if self.region is not None:
+            image_data &= self.region.crop(tile.outer)
+        
+        components = labeling.label_components(image_data)
+        stats = scoring.component_stats(image_data, components, intensity)
+        
+        centers = stats.center + (top, left)
+        first_pixels = components.pixel_indices[components.offsets[:-1]]
+        first_pixels = (first_pixels // image_data.shape[1] + top) * width + first_pixels % image_data.shape[1] + left
+        
+        core_left, core_top, core_right, core_bottom = tile.core
+        in_core = ((centers[:, 0] >= core_top) & (centers[:, 0] < core_bottom)
+                   & (centers[:, 1] >= core_left) & (centers[:, 1] < core_right))
+        
+        cut_off = (((stats.bounds[:, 0] == 0) & (top > 0))
+                   | ((stats.bounds[:, 1] == 0) & (left > 0))
+                   | ((stats.bounds[:, 2] == image_data.shape[0] - 1) & (bottom < height))
+                   | ((stats.bounds[:, 3] == image_data.shape[1] - 1) & (right < width)))
+        
+        is_gold = stats.accepted(self.min_pixels, self.circle_threshold) & in_core & ~cut_off
+        
+        large_enough = stats.area >= self.min_pixels
+        profiling.count("pixels_scanned", image_data.size)
+        profiling.count("components_labeled", components.num)
+        profiling.count("rejected_min_pixels", np.count_nonzero(~large_enough))
+        profiling.count("rejected_circularity", np.count_nonzero(
+            large_enough & stats.center_on_splotch & (stats.circle_score <= self.circle_threshold)
+        ))
+        profiling.count("particles_accepted", np.count_nonzero(is_gold))
+        
+        return stats.particles(is_gold, (top, left)), first_pixels[is_gold]
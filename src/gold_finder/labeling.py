@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.helper import union_find
+
+
+@dataclass
+class Components:
+    """
+    The 4-connected components of a boolean image
+    """
+
+    labels: np.ndarray  # label image with the same shape as the input. 0 = background, components are 1..num
+    num: int
+    pixel_indices: np.ndarray  # flat (row-major) pixel indices, grouped by component
+    offsets: np.ndarray  # component i (1-indexed) owns pixel_indices[offsets[i - 1]:offsets[i]]
+
+    def areas(self) -> np.ndarray:
+        """
+        :return: The number of pixels in each component, indexed by label - 1
+        """
+
+        return np.diff(self.offsets)
+
+    def coords(self, label: int) -> np.ndarray:
+        """
+        :param label: The label of the component (1..num)
+        :return: An (n, 2) array of the (row, column) coordinates of the component's pixels
+        """
+
+        flat = self.pixel_indices[self.offsets[label - 1]:self.offsets[label]]
+        return np.column_stack(np.unravel_index(flat, self.labels.shape))
+
+
+def find_runs(image_data: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the horizontal runs of truthy pixels in a 2D array
+
+    :param image_data: The 2D array to find runs in
+    :return: [row of each run, start column of each run, end column (exclusive) of each run], in row-major order
+    """
+
+    padded = np.zeros((image_data.shape[0], image_data.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = image_data != 0
+
+    edges = np.diff(padded, axis=1)
+
+    # np.nonzero returns row-major order, so the n-th start always pairs with the n-th end
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    return rows, starts, ends
+
+
+def label_components(image_data: np.ndarray) -> Components:
+    """
+    Labels the 4-connected components of a boolean image. Runs of pixels on each row are found first, then runs that
+    overlap a run on the previous row are merged with union-find. No recursion or per-pixel Python loop is involved.
+
+    Components are labeled in the raster order of their first pixel.
+
+    :param image_data: The 2D boolean (or 0/1) array to label
+    :return: The labeled components
+    """
+
+    height, width = image_data.shape
+    rows, starts, ends = find_runs(image_data)
+    num_runs = len(rows)
+
+    # Keys that order run boundaries across the whole image. Runs are sorted by (row, start), and since runs on one row
+    # don't overlap, they're sorted by (row, end) too.
+    stride = width + 1
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+
+    # Runs on the previous row that overlap run j are exactly the ones with end > start_j and start < end_j.
+    # Those form a contiguous range [lo, hi) in run order.
+    prev_row = (rows - 1) * stride
+    lo = np.searchsorted(end_keys, prev_row + starts, side="right")
+    hi = np.searchsorted(start_keys, prev_row + ends, side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    total = counts.sum()
+    edges_a = np.repeat(np.arange(num_runs), counts)
+    edges_b = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+    roots = union_find.connected_components(num_runs, edges_a, edges_b)
+
+    # roots are the smallest run index in each component, so sorting them keeps raster order
+    unique_roots, run_labels = np.unique(roots, return_inverse=True)
+    run_labels = run_labels.astype(np.int32) + 1
+    num = len(unique_roots)
+
+    # Paint the label image by placing +label at each run start and -label at each run end, then taking a cumsum
+    flat_starts = rows * width + starts
+    flat_ends = rows * width + ends
+
+    deltas = np.zeros(height * width + 1, dtype=np.int32)
+    deltas[flat_starts] += run_labels
+    deltas[flat_ends] -= run_labels
+    labels = np.cumsum(deltas[:-1], dtype=np.int32).reshape(height, width)
+
+    # Expand each run into its pixel indices, grouped by component
+    order = np.argsort(run_labels, kind="stable")
+    run_lengths = (ends - starts)[order]
+    run_first_pixel = flat_starts[order]
+
+    pixel_indices = (np.repeat(run_first_pixel, run_lengths)
+                     + np.arange(run_lengths.sum())
+                     - np.repeat(np.cumsum(run_lengths) - run_lengths, run_lengths))
+
+    offsets = np.zeros(num + 1, dtype=np.intp)
+    offsets[1:] = np.cumsum(np.bincount(run_labels, weights=ends - starts, minlength=num + 1)[1:]).astype(np.intp)
+
+    return Components(labels, num, pixel_indices, offsets)
@@ -0,0 +1,91 @@
+from concurrent.futures import Executor
+
+import numpy as np
+
+from src.gold_finder import gold_finder as gf, scoring, tiling
+from src.helper import shared
+
+
+def find_particles_in_tiles(image: shared.SharedArray, threshold: float | shared.SharedArray, tiles: list[tiling.Tile],
+                            min_pixels: int, circle_threshold: float,
+                            region: shared.SharedRegion | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the gold particles in some tiles of a shared image. This runs in a worker process, which opens the image (and
+    the region) without copying it, and only the particles are sent back
+
+    :param image: The preprocessed image
+    :param threshold: The luminosity threshold, or the shared per-pixel threshold array
+    :param tiles: The tiles to analyze
+    :param min_pixels: GoldFinder's min_pixels
+    :param circle_threshold: GoldFinder's circle_threshold
+    :param region: GoldFinder's region, or None to scan the whole image
+    :return: [the particles, the flat index of each particle's first pixel] of every tile (see
+             GoldFinder.find_circles_in_tile)
+    """
+
+    region = region.open() if region is not None else None
+    finder = gf.GoldFinder(image.open(), min_pixels=min_pixels, circle_threshold=circle_threshold, region=region)
+    threshold = threshold.open() if isinstance(threshold, shared.SharedArray) else threshold
+
+    results = [finder.find_circles_in_tile(tile, threshold) for tile in tiles]
+
+    return (
+        np.concatenate([np.zeros(0, dtype=scoring.PARTICLE_DTYPE)] + [result[0] for result in results]),
+        np.concatenate([np.zeros(0, dtype=np.int64)] + [result[1] for result in results])
+    )
+
+
+def find_particles(finder: gf.GoldFinder, executor: Executor, num_tasks: int,
+                   image: shared.SharedArray | None = None, region: shared.SharedRegion | None = None) -> np.ndarray:
+    """
+    The same as finder.find_particles, with the tiles spread over the worker processes of an executor. If the finder
+    has no tile_size, the image (or the bounding box of its region) is split into num_tasks bands of rows instead. The
+    image, the threshold array and the region are shared with the workers instead of being sent to each of them
+
+    :param finder: The finder, whose image is the preprocessed image
+    :param executor: The executor to run the tiles on, e.g. a ProcessPoolExecutor
+    :param num_tasks: The number of tasks to split the tiles into, usually the number of workers
+    :param image: The finder's image, if it is already in shared memory. If None, it is copied to shared memory for the
+                  duration of the call
+    :param region: The finder's region, if it is already in shared memory. If None (and the finder has a region), it
+                   is copied to shared memory for the duration of the call
+    :return: A structured array with scoring.PARTICLE_DTYPE, in the same order as finder.find_particles
+    """
+
+    tiles, threshold = finder.plan()
+
+    if finder.tile_size is None and finder.prefilter is None:
+        box = finder.region.box if finder.region is not None else None
+        tiles = finder.in_region(list(tiling.iter_bands(tiling.image_size(finder.image), num_tasks, finder.halo, box)))
+
+    if len(tiles) == 0:  # the region is empty
+        return finder.merge([])
+
+    owned = []
+
+    try:
+        if image is None:
+            image = shared.SharedArray.from_array(np.asarray(finder.image))
+            owned.append(image)
+
+        if isinstance(threshold, np.ndarray):
+            threshold = shared.SharedArray.from_array(threshold)
+            owned.append(threshold)
+
+        if region is None and finder.region is not None:
+            region = shared.SharedRegion.from_region(finder.region)
+            owned.append(region)
+
+        # every num_tasks-th tile, so each task gets tiles from all over the image
+        futures = [
+            executor.submit(
+                find_particles_in_tiles, image, threshold, tiles[task::num_tasks], finder.min_pixels,
+                finder.circle_threshold, region
+            )
+            for task in range(min(num_tasks, len(tiles)))
+        ]
+
+        return finder.merge([future.result() for future in futures])
+    finally:
+        for array in owned:
+            array.unlink()
@@ -0,0 +1,98 @@
+from PIL import Image
+
+import numpy as np
+from scipy import ndimage
+
+import math
+
+from src.gold_finder import tiling
+from src.helper import preprocessing
+
+# The fixed cost of processing one window, in pixels of a full pass: labeling and scoring a window takes about as long
+# as labeling and scoring this many pixels of a larger image
+WINDOW_COST_PIXELS = 25_000
+
+
+def block_mean(image_data: np.ndarray, scale: int) -> np.ndarray:
+    """
+    Downsamples an image by averaging scale x scale blocks. Partial blocks at the right and bottom edges are averaged
+    over the pixels they have
+
+    :param image_data: A 2D array
+    :param scale: The width and height of each block
+    :return: The 2D float array of block averages
+    """
+
+    height, width = image_data.shape
+    full_height, full_width = height - height % scale, width - width % scale
+
+    sums = np.zeros((math.ceil(height / scale), math.ceil(width / scale)))
+    counts = np.zeros_like(sums)
+
+    sums[:full_height // scale, :full_width // scale] = image_data[:full_height, :full_width].reshape(
+        full_height // scale, scale, full_width // scale, scale
+    ).sum(axis=(1, 3), dtype=np.float64)
+    counts[:full_height // scale, :full_width // scale] = scale * scale
+
+    # the partial blocks along the right and bottom edges
+    for rows, cols in ((slice(full_height, height), slice(0, width)), (slice(0, full_height), slice(full_width, width))):
+        if rows.start == rows.stop or cols.start == cols.stop:
+            continue
+
+        edge = image_data[rows, cols].astype(np.float64)
+        edge_rows = np.arange(rows.start, rows.stop) // scale
+        edge_cols = np.arange(cols.start, cols.stop) // scale
+
+        np.add.at(sums, (edge_rows[:, None], edge_cols[None, :]), edge)
+        np.add.at(counts, (edge_rows[:, None], edge_cols[None, :]), 1)
+
+    return sums / counts
+
+
+def candidate_tiles(image: Image.Image | np.ndarray, threshold: float | np.ndarray, scale: int, margin: int) \
+        -> list[tiling.Tile] | None:
+    """
+    Proposes the regions of an image that may contain gold particles, from a cheap pass over a downsampled copy. A block
+    of pixels is a candidate if its average luminosity is below the threshold, which is true for any block that lies
+    inside a particle. Candidate blocks are expanded by the margin, and overlapping expanded blocks are merged into one
+    window.
+
+    Particles that are smaller than a block may be missed, so scale must be small enough that a scale x scale block
+    fits inside the smallest particle (about 4 pixels for 6nm particles).
+
+    :param image: The image (or 2D uint8 array)
+    :param threshold: The luminosity a pixel must be lower than to be considered part of a splotch, either one value or
+                      a per-pixel array
+    :param scale: The downsampling factor of the candidate pass
+    :param margin: The number of pixels each candidate block is expanded by. Must be large enough to hold the rest of
+                   the particle's splotch
+    :return: One tile per window, with the same core and outer region. Windows can overlap, so the same splotch can be
+             found in more than one of them. None if the windows are expected to take longer to process than one pass
+             over the whole image (e.g., when dark regions are dense)
+    """
+
+    image_data = preprocessing.as_array(image)
+    height, width = image_data.shape
+
+    block_threshold = block_mean(threshold, scale) if isinstance(threshold, np.ndarray) else threshold
+    candidates = block_mean(image_data, scale) < block_threshold
+
+    if not candidates.any():
+        return []
+
+    margin_blocks = math.ceil(margin / scale)
+    windows = ndimage.maximum_filter(candidates, size=2 * margin_blocks + 1)
+
+    labels, _ = ndimage.label(windows, structure=np.ones((3, 3)))
+    tiles = []
+
+    for rows, cols in ndimage.find_objects(labels):
+        box = (cols.start * scale, rows.start * scale, min(cols.stop * scale, width), min(rows.stop * scale, height))
+        tiles.append(tiling.Tile(core=box, outer=box))
+
+    window_pixels = sum((right - left) * (bottom - top) for left, top, right, bottom in (tile.core for tile in tiles))
+
+    if window_pixels + len(tiles) * WINDOW_COST_PIXELS >= width * height:
+        return None
+
+    return tiles
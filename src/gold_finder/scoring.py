@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.gold_finder import labeling
+from src.helper import units
+
+PARTICLE_DIAMETERS_NM = (6, 12)
+SIZE_CLASS_BOUNDARY_NM = sum(PARTICLE_DIAMETERS_NM) / 2  # splotches at least this wide are 12nm particles
+
+PARTICLE_DTYPE = np.dtype([
+    ("x", np.float64),  # intensity-weighted centroid, in pixels
+    ("y", np.float64),
+    ("pixel_x", np.int64),  # the unweighted centroid rounded down, which is what GoldFinder.find_gold reports
+    ("pixel_y", np.int64),
+    ("area", np.int64),  # in pixels
+    ("diameter_nm", np.float64),  # the diameter of a circle with the same area
+    ("circle_score", np.float64),
+    ("size_class", "U4")  # '6nm' or '12nm'
+])
+
+
+@dataclass
+class ComponentStats:
+    """
+    Per-component statistics used to decide whether a splotch is a gold particle. Every array is indexed by label - 1
+    """
+
+    area: np.ndarray  # number of pixels in the splotch
+    center: np.ndarray  # (num, 2) integer (row, column) centroid of the splotch, rounded down
+    centroid: np.ndarray  # (num, 2) float (row, column) centroid, weighted by darkness if an intensity was given
+    center_on_splotch: np.ndarray  # whether the centroid pixel is part of a splotch
+    circle_score: np.ndarray  # the fraction of the splotch's pixels that are within its inscribed circle
+    bounds: np.ndarray  # (num, 4) inclusive bounding box of the splotch: (min row, min column, max row, max column)
+
+    def accepted(self, min_pixels: int, circle_threshold: float) -> np.ndarray:
+        """
+        :param min_pixels: The minimum number of pixels for a splotch to be considered a gold particle
+        :param circle_threshold: The percentage of points that must be within the inscribed circle for the splotch to
+                                 be considered a circle
+        :return: A boolean array of which components are gold particles
+        """
+
+        return (self.area >= min_pixels) & self.center_on_splotch & (self.circle_score > circle_threshold)
+
+    def diameter_nm(self) -> np.ndarray:
+        """
+        :return: The equivalent diameter of each splotch (the diameter of a circle with the same area), in nanometers
+        """
+
+        return 2 * np.sqrt(self.area / np.pi) / units.PIXEL_PER_NM
+
+    def particles(self, selected: np.ndarray | None = None, origin: tuple[int, int] = (0, 0)) -> np.ndarray:
+        """
+        :param selected: A boolean array of which components to include (e.g., from accepted). If None, every
+                         component is included
+        :param origin: The (row, column) to add to every location, e.g. the corner of the tile the stats are from
+        :return: A structured array of the components with PARTICLE_DTYPE
+        """
+
+        if selected is None:
+            selected = np.ones(len(self.area), dtype=bool)
+
+        diameter_nm = self.diameter_nm()[selected]
+
+        particles = np.empty(np.count_nonzero(selected), dtype=PARTICLE_DTYPE)
+        particles["x"] = self.centroid[selected, 1] + origin[1]
+        particles["y"] = self.centroid[selected, 0] + origin[0]
+        particles["pixel_x"] = self.center[selected, 1] + origin[1]
+        particles["pixel_y"] = self.center[selected, 0] + origin[0]
+        particles["area"] = self.area[selected]
+        particles["diameter_nm"] = diameter_nm
+        particles["circle_score"] = self.circle_score[selected]
+        particles["size_class"] = np.where(diameter_nm >= SIZE_CLASS_BOUNDARY_NM, "12nm", "6nm")
+
+        return particles
+
+
+def perimeter_mask(image_data: np.ndarray) -> np.ndarray:
+    """
+    Finds the pixels of each splotch that have a 4-neighbor outside the splotch (or outside the image). Since splotches
+    are maximal 4-connected components, this is the splotch pixels minus the erosion of the splotch pixels.
+
+    :param image_data: The 2D boolean (or 0/1) array of splotch pixels
+    :return: A boolean array of perimeter pixels
+    """
+
+    padded = np.zeros((image_data.shape[0] + 2, image_data.shape[1] + 2), dtype=bool)
+    padded[1:-1, 1:-1] = image_data != 0
+
+    eroded = (padded[1:-1, 1:-1] & padded[:-2, 1:-1] & padded[2:, 1:-1]
+              & padded[1:-1, :-2] & padded[1:-1, 2:])
+
+    return padded[1:-1, 1:-1] & ~eroded
+
+
+def component_stats(image_data: np.ndarray, components: labeling.Components,
+                    intensity: np.ndarray | None = None) -> ComponentStats:
+    """
+    Computes the centroid, inscribed circle and circle score of every component at once
+
+    :param image_data: The 2D boolean (or 0/1) array that was labeled
+    :param components: The labeled components of image_data
+    :param intensity: The 2D uint8 image that image_data was thresholded from. If given, the subpixel centroid of each
+                      component weights its pixels by how dark they are (255 - luminosity)
+    :return: The statistics of every component
+    """
+
+    if components.num == 0:
+        return ComponentStats(
+            np.zeros(0, dtype=np.intp), np.zeros((0, 2), dtype=np.int64), np.zeros((0, 2)), np.zeros(0, dtype=bool),
+            np.zeros(0), np.zeros((0, 4), dtype=np.int64)
+        )
+
+    area = components.areas()
+    segment_starts = components.offsets[:-1]
+    pixel_labels = np.repeat(np.arange(components.num), area)
+
+    rows, cols = np.divmod(components.pixel_indices.astype(np.int64), image_data.shape[1])
+
+    center = np.column_stack((
+        np.add.reduceat(rows, segment_starts) // area,
+        np.add.reduceat(cols, segment_starts) // area
+    ))
+
+    if intensity is not None:
+        weights = 255 - np.asarray(intensity).reshape(-1)[components.pixel_indices].astype(np.int64)
+    else:
+        weights = np.ones(len(rows))
+
+    weight_sums = np.add.reduceat(weights, segment_starts)
+    centroid = np.column_stack((
+        np.add.reduceat(rows * weights, segment_starts) / weight_sums,
+        np.add.reduceat(cols * weights, segment_starts) / weight_sums
+    ))
+
+    bounds = np.column_stack((
+        np.minimum.reduceat(rows, segment_starts),
+        np.minimum.reduceat(cols, segment_starts),
+        np.maximum.reduceat(rows, segment_starts),
+        np.maximum.reduceat(cols, segment_starts)
+    ))
+
+    center_on_splotch = image_data[center[:, 0], center[:, 1]] != 0
+
+    dist_squared = (rows - center[pixel_labels, 0]) ** 2 + (cols - center[pixel_labels, 1]) ** 2
+
+    # The incircle radius is the distance from the center to the closest perimeter pixel. Every finite splotch has at
+    # least one perimeter pixel, so the minimum is always over a real distance.
+    on_perimeter = perimeter_mask(image_data).ravel()[components.pixel_indices]
+    incircle_rad_squared = np.minimum.reduceat(
+        np.where(on_perimeter, dist_squared, np.iinfo(np.int64).max), segment_starts
+    )
+
+    num_points_in_circle = np.add.reduceat(
+        (dist_squared <= incircle_rad_squared[pixel_labels]).astype(np.intp), segment_starts
+    )
+
+    return ComponentStats(area, center, centroid, center_on_splotch, num_points_in_circle / area, bounds)
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from typing import Iterator
+
+from PIL import Image
+
+import numpy as np
+
+
+@dataclass
+class Tile:
+    """
+    A region of an image processed on its own. The core regions of all tiles partition the image, and the outer region
+    is the core region expanded by a halo on every side (clipped to the image)
+    """
+
+    core: tuple[int, int, int, int]  # (left, top, right, bottom), right and bottom exclusive
+    outer: tuple[int, int, int, int]
+
+
+def iter_tiles(image_size: tuple[int, int], tile_size: int, halo: int,
+               box: tuple[int, int, int, int] | None = None) -> Iterator[Tile]:
+    """
+    Splits an image into overlapping tiles
+
+    :param image_size: The (width, height) of the image
+    :param tile_size: The width and height of each tile's core region
+    :param halo: The number of pixels of overlap added on each side of the core region
+    :param box: The (left, top, right, bottom) part of the image that the core regions cover. If None, the whole image
+    :return: An iterator over the tiles, in raster order
+    """
+
+    width, height = image_size
+    box_left, box_top, box_right, box_bottom = box if box is not None else (0, 0, width, height)
+
+    for top in range(box_top, box_bottom, tile_size):
+        for left in range(box_left, box_right, tile_size):
+            right = min(left + tile_size, box_right)
+            bottom = min(top + tile_size, box_bottom)
+
+            yield Tile(
+                core=(left, top, right, bottom),
+                outer=(max(left - halo, 0), max(top - halo, 0), min(right + halo, width), min(bottom + halo, height))
+            )
+
+
+def iter_bands(image_size: tuple[int, int], num_bands: int, halo: int,
+               box: tuple[int, int, int, int] | None = None) -> Iterator[Tile]:
+    """
+    Splits an image into overlapping bands of rows, e.g. to give each of num_bands workers one band
+
+    :param image_size: The (width, height) of the image
+    :param num_bands: The number of bands. Fewer are returned if the image has fewer rows
+    :param halo: The number of pixels of overlap added on each side of each band's core region
+    :param box: The (left, top, right, bottom) part of the image that the core regions cover. If None, the whole image
+    :return: An iterator over the bands, from top to bottom
+    """
+
+    width, height = image_size
+    left, box_top, right, box_bottom = box if box is not None else (0, 0, width, height)
+    edges = np.linspace(box_top, box_bottom, min(num_bands, box_bottom - box_top) + 1).round().astype(int).tolist()
+
+    for top, bottom in zip(edges[:-1], edges[1:]):
+        yield Tile(
+            core=(left, top, right, bottom),
+            outer=(max(left - halo, 0), max(top - halo, 0), min(right + halo, width), min(bottom + halo, height))
+        )
+
+
+def image_size(image: Image.Image | np.ndarray) -> tuple[int, int]:
+    """
+    :param image: A PIL image or a 2D array (which may be memory-mapped)
+    :return: The (width, height) of the image
+    """
+
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+
+    return image.size
+
+
+def read_region(image: Image.Image | np.ndarray, box: tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Reads a rectangular region of an image into memory
+
+    :param image: A PIL image or a 2D array (which may be memory-mapped)
+    :param box: The (left, top, right, bottom) box to read, right and bottom exclusive
+    :return: A 2D array of the region's pixels
+    """
+
+    left, top, right, bottom = box
+
+    if isinstance(image, np.ndarray):
+        return np.asarray(image[top:bottom, left:right])
+
+    return np.asarray(image.crop(box))
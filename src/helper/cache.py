@@ -0,0 +1,302 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+import ast
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+
+from src.helper import particles
+
+if TYPE_CHECKING:
+    from src.helper import catalog, tiff
+
+DEFAULT_CACHE_DIR = "./.golden_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# The modules whose behavior affects the preprocessed image, the detected particles or the format they are stored in.
+# They and every module of src/gold_finder and src/helper they import (see code_files) are hashed, so changing any of
+# them invalidates every cache entry.
+SOURCE_ROOT = pathlib.Path(__file__).resolve().parent.parent
+DETECTION_PACKAGES = ("gold_finder", "helper")
+DETECTION_MODULES = (
+    "gold_finder",
+    "helper/data_loading.py",
+    "helper/masking.py",
+    "helper/particles.py",
+    "helper/preprocessing.py",
+    "helper/roi.py",
+    "helper/tiff.py",
+)
+
+HASH_CHUNK_SIZE = 1024 ** 2
+PYRAMID_DIR_NAME = "pyramids"
+
+
+@dataclass
+class CachedDetection:
+    image: np.ndarray  # the preprocessed uint8 image, memory-mapped from the cache
+    particles: particles.ParticleTable
+    img_luminosity: float
+
+
+def file_hash(path: pathlib.Path) -> str:
+    """
+    :param path: The file to hash
+    :return: The SHA-256 hex digest of the file's contents
+    """
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def imported_files(path: pathlib.Path, root: pathlib.Path) -> list[pathlib.Path]:
+    """
+    :param path: A source file
+    :param root: The directory of the src package
+    :return: The source files of the src modules the file imports, anywhere in the file (e.g., in a function)
+    """
+
+    modules = []
+
+    for node in ast.walk(ast.parse(path.read_bytes())):
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module is not None:
+            # 'from src.helper import masking' imports a module, 'from src.helper.masking import Region' a name
+            modules += [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+
+    files = []
+    for module in modules:
+        if module.startswith("src."):
+            relative = pathlib.Path(*module.split(".")[1:])
+            files += [file for file in (root / relative.with_suffix(".py"), root / relative / "__init__.py")
+                      if file.is_file()]
+
+    return files
+
+
+@functools.cache
+def code_files(root: pathlib.Path = SOURCE_ROOT) -> tuple[pathlib.Path, ...]:
+    """
+    :param root: The directory of the src package
+    :return: The source files of DETECTION_MODULES and of every module of DETECTION_PACKAGES they import, directly or
+             not, sorted. They are found once per process, but their contents are hashed on every call of code_version
+    """
+
+    pending = []
+    for module in DETECTION_MODULES:
+        path = root / module
+        pending += sorted(path.glob("*.py")) if path.is_dir() else [path]
+
+    packages = [root / package for package in DETECTION_PACKAGES]
+    found = set()
+
+    while pending:
+        path = pending.pop()
+
+        if path not in found and any(path.is_relative_to(package) for package in packages):
+            found.add(path)
+            pending += imported_files(path, root)
+
+    return tuple(sorted(found))
+
+
+def code_version(root: pathlib.Path = SOURCE_ROOT) -> str:
+    """
+    :param root: The directory of the src package
+    :return: A hash of the source code that the cached results depend on
+    """
+
+    digest = hashlib.sha256()
+
+    for path in code_files(root):
+        digest.update(path.relative_to(root).as_posix().encode())
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    A content-addressed on-disk cache of preprocessed images and the gold particles detected in them. Entries are keyed
+    by the hashes of the input files, the detection parameters and the code version, and the least recently used
+    entries are evicted once the cache grows past its size limit.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param directory: The directory to store the cache in. It is created if it doesn't exist
+        :param max_bytes: The size the cache is trimmed to after each new entry
+        """
+
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def pyramid_directory(self) -> pathlib.Path:
+        """
+        The directory that image pyramids (see helper.tiff.Pyramid) are cached in, one subdirectory per image. Each
+        subdirectory counts toward max_bytes as one entry
+        """
+
+        return self.directory / PYRAMID_DIR_NAME
+
+    def pyramid(self, bundle: catalog.BundleEntry) -> tiff.Pyramid:
+        """
+        Loads (or builds and caches) the pyramid of a bundle's image, then evicts the least recently used entries if a
+        new pyramid made the cache too large. Runs that only hit the cache never store a detection, so this is where
+        their pyramids are trimmed
+
+        :param bundle: The bundle
+        :return: The pyramid of the bundle's source image (see catalog.BundleEntry.pyramid)
+        """
+
+        pyramid = bundle.pyramid(self.pyramid_directory)
+        self.evict()
+
+        return pyramid
+
+    def key(self, files: list[pathlib.Path], params: dict) -> str:
+        """
+        :param files: The input files (e.g., the image and mask) the detection depends on
+        :param params: The parameters the detection depends on. Must be JSON serializable
+        :return: The cache key for the inputs
+        """
+
+        digest = hashlib.sha256()
+
+        for path in files:
+            digest.update(file_hash(path).encode())
+
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        digest.update(code_version().encode())
+
+        return digest.hexdigest()
+
+    def paths(self, key: str) -> tuple[pathlib.Path, pathlib.Path]:
+        """
+        :return: [the path of the preprocessed image, the path of the detection metadata]
+        """
+
+        return self.directory / f"{key}.npy", self.directory / f"{key}.json"
+
+    def get(self, key: str) -> CachedDetection | None:
+        """
+        :param key: The cache key (see DetectionCache.key)
+        :return: The cached detection, or None on a cache miss
+        """
+
+        image_path, meta_path = self.paths(key)
+
+        try:
+            meta = json.loads(meta_path.read_text())
+            image = np.load(image_path, mmap_mode="r")
+            particle_table = particles.ParticleTable(**meta["particles"])
+        except (OSError, ValueError, TypeError, KeyError):  # TypeError: an entry from before particle tables
+            return None
+
+        # mark the entry as recently used
+        for path in (image_path, meta_path):
+            os.utime(path)
+
+        return CachedDetection(image, particle_table, meta["img_luminosity"])
+
+    def put(self, key: str, image: np.ndarray, particle_table: particles.ParticleTable | list[tuple[int, int]],
+            img_luminosity: float) -> None:
+        """
+        Stores a detection, then evicts the least recently used entries if the cache is over its size limit
+
+        :param key: The cache key (see DetectionCache.key)
+        :param image: The preprocessed uint8 image
+        :param particle_table: The detected gold particles (or their pixels)
+        :param img_luminosity: The average luminosity used for detection
+        """
+
+        image_path, meta_path = self.paths(key)
+        particle_table = particles.ParticleTable.from_points(particle_table)
+
+        # Write to temporary files first so a concurrent reader never sees a partial entry
+        temp_image_path = image_path.with_suffix(".npy.tmp")
+        with open(temp_image_path, "wb") as f:
+            np.save(f, np.asarray(image, dtype=np.uint8))
+
+        temp_meta_path = meta_path.with_suffix(".json.tmp")
+        temp_meta_path.write_text(json.dumps({
+            "particles": {
+                "pixels": particle_table.pixels.tolist(),
+                "x": particle_table.x.tolist(),
+                "y": particle_table.y.tolist(),
+                "size": particle_table.size.tolist(),
+                "score": particle_table.score.tolist()
+            },
+            "img_luminosity": float(img_luminosity)
+        }))
+
+        os.replace(temp_image_path, image_path)
+        os.replace(temp_meta_path, meta_path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries (detections and pyramids) until the cache is no larger than max_bytes
+        """
+
+        entries = {}  # entry -> [size, last used, its paths]
+
+        for path in self.directory.iterdir():
+            if path.suffix not in (".npy", ".json"):
+                continue
+
+            stat = path.stat()
+            entry = entries.setdefault(path.stem, [0, 0.0, []])
+            entry[0] += stat.st_size
+            entry[1] = max(entry[1], stat.st_mtime)
+            entry[2].append(path)
+
+        if self.pyramid_directory.is_dir():
+            for directory in self.pyramid_directory.iterdir():
+                # a pyramid is marked as used by touching its directory (see tiff.Pyramid.cached)
+                stats = [path.stat() for path in directory.iterdir()] + [directory.stat()]
+                entries[f"{PYRAMID_DIR_NAME}/{directory.name}"] = [
+                    sum(stat.st_size for stat in stats[:-1]), max(stat.st_mtime for stat in stats), [directory]
+                ]
+
+        total = sum(size for size, _, _ in entries.values())
+
+        for size, _, paths in sorted(entries.values(), key=lambda entry: entry[1]):
+            if total <= self.max_bytes:
+                break
+
+            for path in paths:
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Removes every entry and every cached pyramid from the cache
+        """
+
+        for path in self.directory.iterdir():
+            if path.suffix in (".npy", ".json", ".tmp"):
+                path.unlink()
+
+        shutil.rmtree(self.pyramid_directory, ignore_errors=True)
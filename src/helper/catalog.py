@@ -0,0 +1,249 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Iterator, TYPE_CHECKING
+
+import numpy as np
+
+import hashlib
+import json
+import os
+import pathlib
+
+from src.helper import data_loading as dl, tiff
+
+if TYPE_CHECKING:
+    import pandas as pd  # imported when the ground truth is loaded
+
+INDEX_FILE_NAME = ".golden_index.json"
+INDEX_VERSION = 1
+
+FILE_KINDS = ("image", "mask", "ground_truth_6nm", "ground_truth_12nm")
+
+
+@dataclass
+class BundleEntry:
+    """
+    An indexed image bundle. The image, mask and ground truth are loaded from disk the first time they're accessed, so
+    an entry can be used anywhere an ImageBundle is expected without paying for the parts that aren't used.
+    """
+
+    name: str
+    directory: pathlib.Path
+    files: dict[str, pathlib.Path | None]  # file kind (see FILE_KINDS) -> path
+    stamps: dict[str, tuple[int, float]] = field(default_factory=dict)  # path relative to directory -> (size, mtime)
+    bar_position: dl.BarPosition | None = None  # detected when the image is first loaded
+
+    @cached_property
+    def image(self) -> np.ndarray:
+        """
+        The source image as a 2D uint8 array, memory-mapped when it is an uncompressed TIFF (see
+        data_loading.load_source_array)
+        """
+
+        if self.files["image"] is None:
+            raise FileNotFoundError(f"No image found for {self.name}!")
+
+        image, self.bar_position = dl.load_source_array(self.files["image"], self.bar_position)
+        return image
+
+    @cached_property
+    def mask(self) -> np.ndarray | None:
+        if self.files["mask"] is None:
+            return None
+
+        if self.bar_position is None:
+            _ = self.image  # the mask is cropped like its source image, so the scale bar must be found first
+
+        return dl.load_array(self.files["mask"], self.bar_position)
+
+    @cached_property
+    def ground_truth_6nm(self) -> pd.DataFrame | None:
+        import pandas as pd
+        return pd.read_csv(self.files["ground_truth_6nm"]) if self.files["ground_truth_6nm"] is not None else None
+
+    @cached_property
+    def ground_truth_12nm(self) -> pd.DataFrame | None:
+        import pandas as pd
+        return pd.read_csv(self.files["ground_truth_12nm"]) if self.files["ground_truth_12nm"] is not None else None
+
+    def unload(self) -> None:
+        """
+        Drops the loaded image, mask and ground truth, so an entry that is kept around (e.g., in a list of every bundle)
+        doesn't keep them in memory. They are loaded again when accessed. The scale bar position is kept
+        """
+
+        for name in ("image", "mask", "ground_truth_6nm", "ground_truth_12nm"):
+            self.__dict__.pop(name, None)
+
+    def pyramid(self, cache_directory) -> tiff.Pyramid:
+        """
+        :param cache_directory: The directory to cache the downsampled levels of bundle images in
+        :return: The multi-resolution pyramid of the source image, for previews. Its levels are built once per version
+                 of the image file and memory-mapped afterward
+        """
+
+        image_path = self.files["image"]
+        digest = hashlib.sha256(json.dumps([str(image_path.resolve()), stamp(image_path)]).encode()).hexdigest()
+
+        return tiff.Pyramid.cached(self.image, pathlib.Path(cache_directory) / digest)
+
+    def is_stale(self) -> bool:
+        """
+        :return: True if any file or directory the entry was built from has changed since it was indexed
+        """
+
+        return any(stamp(self.directory / path) != recorded for path, recorded in self.stamps.items())
+
+    def to_json(self) -> dict:
+        return {
+            "files": {
+                kind: str(path.relative_to(self.directory)) if path is not None else None
+                for kind, path in self.files.items()
+            },
+            "stamps": self.stamps,
+            "bar_position": self.bar_position.name if self.bar_position is not None else None
+        }
+
+    @staticmethod
+    def from_json(name: str, directory: pathlib.Path, data: dict) -> "BundleEntry":
+        return BundleEntry(
+            name,
+            directory,
+            {kind: directory / path if path is not None else None for kind, path in data["files"].items()},
+            {path: tuple(value) if value is not None else None for path, value in data["stamps"].items()},
+            dl.BarPosition[data["bar_position"]] if data["bar_position"] is not None else None
+        )
+
+    @staticmethod
+    def index(directory: pathlib.Path) -> "BundleEntry":
+        """
+        Builds the entry of a bundle directory from file metadata only. No file is opened.
+
+        :param directory: The bundle directory
+        :return: The bundle's entry
+        """
+
+        bundle_files = dl.find_bundle_files(directory)
+        files = {kind: getattr(bundle_files, kind) for kind in FILE_KINDS}
+
+        # Directory mtimes change when files are added or removed, file stamps change when a file is rewritten
+        watched = [directory, directory / "Results", *(path for path in files.values() if path is not None)]
+        stamps = {str(path.relative_to(directory)): stamp(path) for path in watched}
+
+        return BundleEntry(directory.name, directory, files, stamps)
+
+
+class BundleCatalog:
+    """
+    An index of the image bundles in a dataset directory, keyed by bundle name. The index is persisted next to the
+    bundles, so looking up one bundle only touches that bundle's files no matter how many bundles there are.
+    """
+
+    def __init__(self, base_path, index_path=None):
+        """
+        :param base_path: The directory that contains one subdirectory per image bundle
+        :param index_path: Where to persist the index. If None, it is stored in base_path
+        """
+
+        self.base_path = pathlib.Path(base_path)
+        self.index_path = pathlib.Path(index_path) if index_path is not None else self.base_path / INDEX_FILE_NAME
+        self.entries: dict[str, BundleEntry] = self.load_index()
+
+    def load_index(self) -> dict[str, BundleEntry]:
+        try:
+            data = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+        if data.get("version") != INDEX_VERSION:
+            return {}
+
+        return {
+            name: BundleEntry.from_json(name, self.base_path / name, entry)
+            for name, entry in data["bundles"].items()
+        }
+
+    def save(self) -> None:
+        """
+        Writes the index to disk. The index is only a cache, so failing to write it (e.g., a read-only dataset) is not
+        an error
+        """
+
+        data = {
+            "version": INDEX_VERSION,
+            "bundles": {name: entry.to_json() for name, entry in self.entries.items()}
+        }
+
+        temp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+
+        try:
+            temp_path.write_text(json.dumps(data, indent=1))
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
+
+    def get(self, name: str) -> BundleEntry:
+        """
+        Gets a bundle by name, indexing only that bundle if it isn't indexed yet or has changed
+
+        :param name: The name of the bundle, e.g., 'S1'
+        :return: The bundle's entry
+        :raises KeyError: If there is no bundle with that name
+        """
+
+        entry = self.entries.get(name)
+
+        if entry is not None and not entry.is_stale():
+            return entry
+
+        directory = self.base_path / name
+
+        if not directory.is_dir():
+            self.entries.pop(name, None)
+            raise KeyError(name)
+
+        entry = self.entries[name] = BundleEntry.index(directory)
+        self.save()
+
+        return entry
+
+    def refresh(self) -> None:
+        """
+        Re-indexes the whole dataset directory: new bundles are added, removed ones are dropped and changed ones are
+        re-indexed
+        """
+
+        entries = {}
+
+        for directory in dl.find_bundle_dirs(self.base_path):
+            entry = self.entries.get(directory.name)
+
+            if entry is None or entry.is_stale():
+                entry = BundleEntry.index(directory)
+
+            entries[directory.name] = entry
+
+        self.entries = entries
+        self.save()
+
+    def __iter__(self) -> Iterator[BundleEntry]:
+        self.refresh()
+        return iter(list(self.entries.values()))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def stamp(path: pathlib.Path) -> tuple[int, float] | None:
+    """
+    :param path: The path to stat
+    :return: The (size, mtime) of the path, or None if it doesn't exist
+    """
+
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime
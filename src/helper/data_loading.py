@@ -1,13 +1,18 @@
 from __future__ import annotations  # for type hinting the return type of bar_pos
 from dataclasses import dataclass
-from typing import Iterator
+from typing import Iterator, TYPE_CHECKING
 from enum import Enum
 
 from PIL import Image
 
-import pandas as pd
+import numpy as np
 import pathlib
 
+if TYPE_CHECKING:
+    import pandas as pd  # only the ground truth needs pandas, so it is imported when that is loaded
+
+from src.helper import tiff
+
 
 class BarPosition(Enum):
     """
@@ -37,21 +42,24 @@ class BarPosition(Enum):
             return image_dim[0] - bar_width, 0, image_dim[0], image_dim[1]
     
     @staticmethod
-    def bar_pos(image: Image) -> BarPosition:
+    def bar_pos(image: Image | tiff.TiffImage) -> BarPosition:
         """
         Determines the position of the scale bar in the image
 
-        :param image: The image to analyze
+        :param image: The image to analyze. Only four edge pixels are read, so for a TiffImage the rest of the image
+                      is never read from disk
         :return: The position of the scale bar
         """
         
-        if image.getpixel((image.width // 2, 0)) == 0:
+        width, height = image.size
+        
+        if image.getpixel((width // 2, 0)) == 0:
             return BarPosition.TOP
-        if image.getpixel((image.width // 2, image.height - 1)) == 0:
+        if image.getpixel((width // 2, height - 1)) == 0:
             return BarPosition.BOTTOM
-        if image.getpixel((0, image.height // 2)) == 0:
+        if image.getpixel((0, height // 2)) == 0:
             return BarPosition.LEFT
-        if image.getpixel((image.width - 1, image.height // 2)) == 0:
+        if image.getpixel((width - 1, height // 2)) == 0:
             return BarPosition.RIGHT
         
         raise ValueError("No scale bar found")
@@ -66,37 +74,137 @@ class ImageBundle:
     ground_truth_12nm: pd.DataFrame | None
 
 
-def get_image_bundles(base_path) -> Iterator[ImageBundle]:
+def find_bundle_dirs(base_path) -> Iterator[pathlib.Path]:
+    """
+    Finds the image bundle directories without loading anything from them
+    
+    :param base_path: The directory that contains one subdirectory per image bundle
+    :return: An iterator over the bundle directories
+    """
+    
     for subdir in pathlib.Path(base_path).iterdir():
-        if not subdir.is_dir():
-            continue
-        
-        bundle = ImageBundle(subdir.name, None, None, None, None)
-        
-        # Load the image
-        scale_bar = None
-        
-        for file in subdir.iterdir():
-            if file.is_file() and file.suffix == ".tif" and "mask" not in file.name and "color" not in file.name:
-                scale_bar = BarPosition.bar_pos(Image.open(file).convert("L"))
-                bundle.image = load_image(file, scale_bar)
-                break
-        
-        if bundle.image is None or scale_bar is None:
-            raise FileNotFoundError(f"No image found for {bundle.name}!")
-        
-        # Load the mask if it exists
-        mask_files = list(subdir.glob("*mask.tif"))
-        if len(mask_files) > 0:
-            bundle.mask = load_image(mask_files[0], scale_bar)
-        
-        for file in (subdir / "Results").glob("*.csv"):
-            if "6nm" in file.name:
-                bundle.ground_truth_6nm = pd.read_csv(file)
-            elif "12nm" in file.name:
-                bundle.ground_truth_12nm = pd.read_csv(file)
-        
-        yield bundle
+        if subdir.is_dir():
+            yield subdir
+
+
+@dataclass
+class BundleFiles:
+    """
+    The paths of the files that make up an image bundle. Any of them may be None if the bundle doesn't have that file
+    """
+    
+    image: pathlib.Path | None
+    mask: pathlib.Path | None
+    ground_truth_6nm: pathlib.Path | None
+    ground_truth_12nm: pathlib.Path | None
+
+
+def find_bundle_files(subdir: pathlib.Path) -> BundleFiles:
+    """
+    Finds the files of an image bundle without opening them
+    
+    :param subdir: The bundle directory
+    :return: The paths of the bundle's files
+    """
+    
+    files = BundleFiles(None, None, None, None)
+    
+    for file in subdir.iterdir():
+        if file.is_file() and file.suffix == ".tif" and "mask" not in file.name and "color" not in file.name:
+            files.image = file
+            break
+    
+    mask_files = list(subdir.glob("*mask.tif"))
+    if len(mask_files) > 0:
+        files.mask = mask_files[0]
+    
+    for file in (subdir / "Results").glob("*.csv"):
+        if "6nm" in file.name:
+            files.ground_truth_6nm = file
+        elif "12nm" in file.name:
+            files.ground_truth_12nm = file
+    
+    return files
+
+
+def load_bundle(subdir: pathlib.Path) -> ImageBundle:
+    """
+    Loads the image, mask and ground truth data of a single image bundle
+    
+    :param subdir: The bundle directory
+    :return: The loaded image bundle
+    """
+    
+    files = find_bundle_files(subdir)
+    
+    if files.image is None:
+        raise FileNotFoundError(f"No image found for {subdir.name}!")
+    
+    image, scale_bar = load_source_image(files.image)
+    
+    import pandas as pd
+    
+    return ImageBundle(
+        subdir.name,
+        image,
+        load_image(files.mask, scale_bar) if files.mask is not None else None,
+        pd.read_csv(files.ground_truth_6nm) if files.ground_truth_6nm is not None else None,
+        pd.read_csv(files.ground_truth_12nm) if files.ground_truth_12nm is not None else None
+    )
+
+
+def get_image_bundles(base_path) -> Iterator[ImageBundle]:
+    for subdir in find_bundle_dirs(base_path):
+        yield load_bundle(subdir)
+
+
+def load_source_image(path: pathlib.Path) -> tuple[Image, BarPosition]:
+    """
+    Loads the source image of a bundle, detects its scale bar and fills the scale bar. The image is only decoded once.
+    
+    :param path: The path to the image to load
+    :return: [the loaded image, the position of its scale bar]
+    """
+    
+    image = Image.open(path).convert("L")
+    bar_position = BarPosition.bar_pos(image)
+    
+    return fill_scale_bar(image, bar_position), bar_position
+
+
+def load_source_array(path: pathlib.Path, bar_position: BarPosition | None = None) -> tuple[np.ndarray, BarPosition]:
+    """
+    Loads the source image of a bundle as an array and fills its scale bar. Uncompressed TIFFs are memory-mapped
+    (copy-on-write), so only the pixels that are used are read from disk, and the scale bar is found from four edge
+    pixels. Other images are decoded with PIL.
+    
+    :param path: The path to the image to load
+    :param bar_position: The position of the scale bar, if it is already known (e.g., from the catalog's index)
+    :return: [the image as a 2D uint8 array, the position of its scale bar]
+    """
+    
+    try:
+        tiff_image = tiff.TiffImage(path)
+    except tiff.UnsupportedTiff:
+        image, found_bar_position = load_source_image(path)
+        return np.array(image), found_bar_position
+    
+    if bar_position is None:
+        bar_position = BarPosition.bar_pos(tiff_image)
+    
+    return fill_scale_bar(tiff_image.as_array(), bar_position), bar_position
+
+
+def load_array(path: pathlib.Path, src_img_bar_pos: BarPosition) -> np.ndarray:
+    """
+    Loads an image (e.g., a mask) as an array, memory-mapped when possible, and fills the scale bar
+    
+    :param path: The path to the image to load
+    :param src_img_bar_pos: The position of the scale bar in the bundle's source image
+    :return: The image as a 2D uint8 array
+    """
+    
+    return fill_scale_bar(tiff.open_array(path), src_img_bar_pos)
 
 
 def load_image(path: pathlib.Path, src_img_bar_pos: BarPosition) -> Image:
@@ -112,14 +220,19 @@ def load_image(path: pathlib.Path, src_img_bar_pos: BarPosition) -> Image:
     return fill_scale_bar(image.convert("L"), src_img_bar_pos)
 
 
-def fill_scale_bar(image: Image, bar_position: BarPosition) -> Image:
+def fill_scale_bar(image: Image | np.ndarray, bar_position: BarPosition) -> Image | np.ndarray:
     """
     Fills the scale bar with white, which effectively allows it to be ignored when finding gold particles
     
-    :param image: The image to paste the scale bar onto. This image will be modified
+    :param image: The image (or 2D uint8 array) to paste the scale bar onto. This image will be modified
     :param bar_position: The position of the scale bar
     :return: The modified image
     """
     
+    if isinstance(image, np.ndarray):
+        left, top, right, bottom = bar_position.bar_location((image.shape[1], image.shape[0]))
+        image[top:bottom, left:right] = 255
+        return image
+    
     image.paste(255, bar_position.bar_location(image.size))
     return image
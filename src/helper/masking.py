@@ -1,14 +1,173 @@
+from dataclasses import dataclass
+from functools import cached_property
+
 from PIL import Image
 
+import numpy as np
+
 
-def apply_mask(image: Image, mask: Image) -> Image:
+@dataclass
+class Region:
+    """
+    The pixels of an image to analyze (e.g., a synapse), stored as the bounding box of those pixels and a boolean array
+    over that box, so work that only concerns the region costs in proportion to its box instead of the whole image
+    """
+
+    box: tuple[int, int, int, int]  # (left, top, right, bottom), right and bottom exclusive
+    inside: np.ndarray  # inside[row, col] is True if the pixel at (left + col, top + row) is in the region
+
+    @staticmethod
+    def from_mask(mask: Image.Image | np.ndarray) -> "Region":
+        """
+        :param mask: A mask image or 2D uint8 array. Pixels where the mask is white are not in the region
+        :return: The region of the mask's non-white pixels
+        """
+
+        inside = np.asarray(mask) != 255
+        rows = np.flatnonzero(inside.any(axis=1))
+        cols = np.flatnonzero(inside.any(axis=0))
+
+        if len(rows) == 0:
+            return Region((0, 0, 0, 0), np.zeros((0, 0), dtype=bool))
+
+        top, bottom = int(rows[0]), int(rows[-1]) + 1
+        left, right = int(cols[0]), int(cols[-1]) + 1
+
+        return Region((left, top, right, bottom), inside[top:bottom, left:right].copy())
+
+    @staticmethod
+    def from_spans(spans: np.ndarray, image_size: tuple[int, int] | None = None) -> "Region":
+        """
+        :param spans: An (n, 3) array of runs of pixels in the region (see row_spans). Runs may overlap
+        :param image_size: The (width, height) of the image to clip the runs to. If None, they are not clipped
+        :return: The region made of the runs
+        """
+
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+
+        if image_size is not None:
+            width, height = image_size
+            spans = spans[(spans[:, 0] >= 0) & (spans[:, 0] < height)]
+            spans = np.column_stack((spans[:, 0], spans[:, 1].clip(0, width), spans[:, 2].clip(0, width)))
+
+        spans = spans[spans[:, 2] > spans[:, 1]]
+
+        if len(spans) == 0:
+            return Region((0, 0, 0, 0), np.zeros((0, 0), dtype=bool))
+
+        left, top = int(spans[:, 1].min()), int(spans[:, 0].min())
+        right, bottom = int(spans[:, 2].max()), int(spans[:, 0].max()) + 1
+
+        # mark where each run starts and ends, then a running sum along each row is positive inside the runs
+        edges = np.zeros((bottom - top, right - left + 1), dtype=np.int32)
+        np.add.at(edges, (spans[:, 0] - top, spans[:, 1] - left), 1)
+        np.add.at(edges, (spans[:, 0] - top, spans[:, 2] - left), -1)
+
+        return Region((left, top, right, bottom), np.cumsum(edges, axis=1)[:, :-1] > 0)
+
+    @cached_property
+    def row_spans(self) -> np.ndarray:
+        """
+        The region as runs of pixels within rows, computed once
+
+        :return: An (n, 3) int64 array of (row, start column, end column) runs, end exclusive, in raster order
+        """
+
+        left, top = self.box[:2]
+
+        padded = np.zeros((self.inside.shape[0], self.inside.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = self.inside
+        rows, cols = np.nonzero(np.diff(padded, axis=1))
+
+        # the changes in a row alternate between the start and the end of a run
+        return np.column_stack((rows[0::2] + top, cols[0::2] + left, cols[1::2] + left)).astype(np.int64)
+
+    @property
+    def area(self) -> int:
+        return int(np.count_nonzero(self.inside))
+
+    def crop(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """
+        :param box: The (left, top, right, bottom) box to read, in image coordinates
+        :return: A boolean array over the box of the pixels in the region
+        """
+
+        left, top, right, bottom = box
+        region_left, region_top, region_right, region_bottom = self.box
+
+        cropped = np.zeros((bottom - top, right - left), dtype=bool)
+
+        overlap_left, overlap_right = max(left, region_left), min(right, region_right)
+        overlap_top, overlap_bottom = max(top, region_top), min(bottom, region_bottom)
+
+        if overlap_left < overlap_right and overlap_top < overlap_bottom:
+            cropped[overlap_top - top:overlap_bottom - top, overlap_left - left:overlap_right - left] = self.inside[
+                overlap_top - region_top:overlap_bottom - region_top,
+                overlap_left - region_left:overlap_right - region_left
+            ]
+
+        return cropped
+
+    def intersects(self, box: tuple[int, int, int, int]) -> bool:
+        """
+        :param box: A (left, top, right, bottom) box, in image coordinates
+        :return: Whether any pixel of the box is in the region
+        """
+
+        left, top, right, bottom = box
+        region_left, region_top, region_right, region_bottom = self.box
+
+        if max(left, region_left) >= min(right, region_right) or max(top, region_top) >= min(bottom, region_bottom):
+            return False
+
+        return bool(self.crop(box).any())
+
+    def apply(self, image: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Makes the pixels of an image that are not in the region white
+
+        :param image: The 2D uint8 image
+        :param out: The array to write the masked image to. It may be the image itself. If None, a new array is made
+        :return: The masked image
+        """
+
+        left, top, right, bottom = self.box
+
+        if out is None:
+            out = np.full(image.shape, 255, dtype=np.uint8)
+        else:
+            # only the pixels around the box are filled here, the box itself is written below
+            out[:top] = 255
+            out[bottom:] = 255
+            out[top:bottom, :left] = 255
+            out[top:bottom, right:] = 255
+
+        out[top:bottom, left:right] = np.where(self.inside, image[top:bottom, left:right], np.uint8(255))
+
+        return out
+
+    def to_mask(self, image_size: tuple[int, int]) -> np.ndarray:
+        """
+        :param image_size: The (width, height) of the image
+        :return: The region as a mask array, white outside the region and black inside it
+        """
+
+        width, height = image_size
+        return np.where(self.crop((0, 0, width, height)), np.uint8(0), np.uint8(255))
+
+
+def apply_mask(image: Image.Image | np.ndarray, mask: Image.Image | np.ndarray) -> Image.Image | np.ndarray:
     """
     Applies a mask to an image
 
-    :param image: The image to apply the mask to
-    :param mask: The mask to apply
-    :return: The masked image
+    :param image: The image (or 2D uint8 array) to apply the mask to
+    :param mask: The mask (or 2D uint8 array) to apply. Pixels where the mask is white are made white
+    :return: The masked image, as an image if an image was given and as an array otherwise
     """
-    mask = mask.point(lambda p: p != 255, mode="1")
-    return Image.composite(image, Image.new("L", image.size, 255), mask)
-    
\ No newline at end of file
+
+    masked = Region.from_mask(mask).apply(np.asarray(image))
+
+    if isinstance(image, Image.Image):
+        return Image.fromarray(masked, "L")
+
+    return masked
@@ -1,22 +1,22 @@
-import random
+from __future__ import annotations
+from typing import TYPE_CHECKING
 
 from PIL import Image
 
-import numpy as np
-import pandas as pd
+from src.helper import particles
+from src.helper.output import render, writer
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
+if TYPE_CHECKING:
+    import pandas as pd  # imported when the output is created, so drawing a figure doesn't need it
+    from src.network import incremental
 
-from src.network import density
 
-
-def gen_visualization(image: Image, clusters: dict, display: bool, save_to: str) -> None:
+def gen_visualization(image: Image, clusters: dict | particles.ParticleTable, display: bool, save_to: str) -> None:
     """
-    Shows the image with the clusters and identified particles marked on it
-
-    :param image: The base image to show
-    :param clusters: The clusters of particles
+    Shows the image with the clusters and identified particles marked on it. See render.render for how it is drawn
+    
+    :param image: The base image to show, or its pyramid (see helper.tiff.Pyramid)
+    :param clusters: The clusters of particles, as a table or as returned by clustering.gold_cluster
     :param display: Whether to display the image
     :param save_to: The location to save the figure to. If None, the figure will not be saved
     """
@@ -24,56 +24,33 @@ def gen_visualization(image: Image, clusters: dict, display: bool, save_to: str)
     if not display and not save_to:
         return  # no sense in doing any work
     
-    plt.imshow(np.array(image), cmap="gray")
-    
-    legend = []
-    
-    for cluster_num, cluster_values in clusters.items():
-        cluster_color = (random.random(), random.random(), random.random())
-        
-        legend.append(mpatches.Patch(color=cluster_color, label=f"Cluster {cluster_num}"))
-        
-        plt.scatter(
-            x=[coord[0] for coord in cluster_values],
-            y=[coord[1] for coord in cluster_values],
-            label=f"Cluster {cluster_num}",
-            alpha=0.6,
-            color=cluster_color,
-            s=3
-        )
-        
-        for coord in cluster_values:
-            plt.text(coord[0], coord[1], f"C: {cluster_num}", fontsize=5, color="white")
+    rendering = render.render(image, clusters)
     
-    plt.legend(handles=legend, prop={"size": 6})
+    if save_to is not None:
+        rendering.save(save_to)
     
     if display is True:
+        # pyplot picks an interactive backend when it is imported, so it is only imported to display a figure
+        import matplotlib.pyplot as plt
+        
+        # a new figure for each call, closed afterward, so repeated calls don't draw over each other
+        figure = plt.figure()
+        figure.add_subplot().imshow(rendering)
         plt.show()
-    
-    if save_to is not None:
-        plt.savefig(save_to, dpi=512)  # dpi = 512 to create an image that is sufficiently large
+        plt.close(figure)
 
 
-def create_output_df(clusters: dict) -> pd.DataFrame:
+def create_output_df(clusters: dict | particles.ParticleTable,
+                     density_service: incremental.DensityService | None = None) -> pd.DataFrame:
     """
     Creates a DataFrame from the clusters that can be saved to a CSV file. This dataframe is representative of
     everything the Golden algorithm found during its run
 
-    :param clusters: The clusters of particles
-    :return: A DataFrame of the clusters
+    :param clusters: The clusters of particles, as a table or as returned by clustering.gold_cluster
+    :param density_service: See writer.particle_columns
+    :return: A DataFrame of the clusters. See writer.particle_columns for the columns
     """
     
-    rows_list = []
-    
-    for cluster_num, cluster_values in clusters.items():
-        cluster_density = density.density(cluster_values)
-        
-        for coord in cluster_values:
-            rows_list.append({
-                "particle_x": coord[0],
-                "particle_y": coord[1],
-                "cluster_id": cluster_num,
-                "cluster_density": cluster_density
-            })
+    import pandas as pd
     
-    return pd.DataFrame(rows_list)
+    return pd.DataFrame(writer.particle_columns(clusters, density_service))
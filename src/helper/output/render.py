@@ -0,0 +1,98 @@
+import colorsys
+import math
+
+from PIL import Image, ImageDraw
+
+import numpy as np
+
+from src.helper import particles, preprocessing, profiling, tiff
+
+DEFAULT_MAX_SIZE = 4096  # the longest side of a rendering, in pixels. Larger images are downsampled
+DEFAULT_MARKER_RADIUS = 2
+DEFAULT_MAX_LABELS_PER_MEGAPIXEL = 50  # cluster labels are skipped when they would be denser than this
+
+NOISE_COLOR = (160, 160, 160)
+LABEL_COLOR = (255, 255, 255)
+GOLDEN_RATIO_CONJUGATE = (math.sqrt(5) - 1) / 2
+
+
+def cluster_color(cluster_id: int) -> tuple[int, int, int]:
+    """
+    :param cluster_id: The cluster ID. -1 is noise
+    :return: The RGB color of the cluster. It only depends on the ID, and the hues of consecutive IDs are spread far
+             apart by stepping around the color wheel by the golden ratio. Noise is gray
+    """
+
+    if cluster_id == -1:
+        return NOISE_COLOR
+
+    hue = (cluster_id * GOLDEN_RATIO_CONJUGATE) % 1
+    return tuple(round(channel * 255) for channel in colorsys.hsv_to_rgb(hue, 0.85, 1.0))
+
+
+def disk_offsets(radius: int) -> np.ndarray:
+    """
+    :return: The (row, column) offsets of the pixels in a disk of the given radius around (0, 0)
+    """
+
+    d_row, d_col = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = d_row ** 2 + d_col ** 2 <= radius ** 2
+
+    return np.stack([d_row[inside], d_col[inside]], axis=1)
+
+
+@profiling.stage("render")
+def render(image: Image.Image | np.ndarray | tiff.Pyramid, clusters: dict | particles.ParticleTable,
+           max_size: int = DEFAULT_MAX_SIZE, marker_radius: int = DEFAULT_MARKER_RADIUS,
+           max_labels_per_megapixel: float = DEFAULT_MAX_LABELS_PER_MEGAPIXEL) -> Image.Image:
+    """
+    Draws the particles of each cluster straight into an RGB copy of the image, with one marker per particle and one
+    label per cluster. This takes a few array operations per cluster no matter how many particles there are
+
+    :param image: The 8-bit ("L") image or 2D uint8 array to draw on, or its pyramid
+    :param clusters: The clusters of particles, in pixels (x, y) of the full-resolution image, as a table or as
+                     returned by clustering.gold_cluster
+    :param max_size: Images with a side longer than this are downsampled by an integer factor so that it fits. For a
+                     pyramid, the largest level that fits is drawn on
+    :param marker_radius: The radius of each particle's marker, in pixels of the rendering
+    :param max_labels_per_megapixel: The cluster labels are only drawn when there are at most this many clusters per
+                                     megapixel of the rendering, since denser labels would be unreadable
+    :return: The RGB rendering
+    """
+
+    if isinstance(image, tiff.Pyramid):
+        image_data, scale = image.level_for(max_size)
+    else:
+        image_data = preprocessing.as_array(image)
+        scale = max(1, math.ceil(max(image_data.shape[:2]) / max_size))
+        image_data = image_data[::scale, ::scale]
+
+    rgb = np.repeat(image_data[:, :, None], 3, axis=2)
+    height, width = rgb.shape[:2]
+
+    clusters = particles.cluster_groups(clusters)
+    offsets = disk_offsets(marker_radius)
+    centroids = {}
+
+    # noise first, so that it never covers the clusters
+    for cluster_id in sorted(clusters):
+        points = (np.asarray(clusters[cluster_id]).reshape(-1, 2) // scale).astype(np.intp)
+
+        rows = (points[:, 1, None] + offsets[None, :, 0]).ravel()
+        cols = (points[:, 0, None] + offsets[None, :, 1]).ravel()
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+
+        rgb[rows[inside], cols[inside]] = cluster_color(cluster_id)
+
+        if cluster_id != -1 and len(points) > 0:
+            centroids[cluster_id] = points.mean(axis=0)
+
+    rendering = Image.fromarray(rgb)
+
+    if 0 < len(centroids) <= max_labels_per_megapixel * width * height / 1e6:
+        draw = ImageDraw.Draw(rendering)
+
+        for cluster_id, (x, y) in centroids.items():
+            draw.text((x + marker_radius + 1, y), f"C: {cluster_id}", fill=LABEL_COLOR)
+
+    return rendering
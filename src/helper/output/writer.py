@@ -0,0 +1,222 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import os
+import pathlib
+import shutil
+
+import numpy as np
+
+from src.helper import particles, profiling, units
+
+if TYPE_CHECKING:
+    from src.network import incremental  # imported when densities are found, since it needs scipy
+
+# file format -> file extension. 'parquet' and 'arrow' need pyarrow. Uncompressed 'arrow' (IPC) files can be
+# memory-mapped by downstream analysis without decoding them
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+PARTITION_KEY = "bundle"
+
+COLUMNS = ("particle_x", "particle_y", "particle_x_um", "particle_y_um", "cluster_id", "cluster_density")
+
+
+def import_pyarrow():
+    """
+    :return: The pyarrow module. It is only imported when Parquet or Arrow output is used, so CSV output works without it
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.feather
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow output need pyarrow. Install it with 'pip install pyarrow'") from e
+
+    return pyarrow
+
+
+@profiling.stage("density")
+def particle_columns(clusters: dict | particles.ParticleTable,
+                     density_service: incremental.DensityService | None = None) -> dict[str, np.ndarray]:
+    """
+    Builds the output columns directly from arrays: one row per particle, with its position in pixels and microns, its
+    cluster and the density of its cluster. Noise particles (cluster -1) have a NaN density
+
+    :param clusters: The clusters of particles, as a table or as returned by clustering.gold_cluster. A table's columns
+                     are used as they are, with one density per range of rows
+    :param density_service: The service to find densities with, which reuses the trees of clusters that are unchanged
+                            since its last call. If None, every density is found from scratch
+    :return: The columns, in the order of COLUMNS
+    """
+
+    if density_service is None:
+        from src.network import incremental
+        density_service = incremental.DensityService()
+
+    if isinstance(clusters, particles.ParticleTable):
+        groups = clusters.clusters()  # sorts the table by cluster if it isn't
+        coords = clusters.pixels
+        cluster_ids = clusters.cluster_id
+        sizes = clusters.cluster_sizes()
+    else:
+        groups = clusters
+        coords = np.concatenate(
+            [np.asarray(cluster_values).reshape(-1, 2) for cluster_values in clusters.values()]
+        ) if clusters else np.empty((0, 2), dtype=np.int64)
+        sizes = [len(cluster_values) for cluster_values in clusters.values()]
+        cluster_ids = np.repeat(np.array(list(clusters), dtype=np.int64), sizes)
+
+    densities = list(density_service.densities(groups).values())
+
+    x_um, y_um = units.pixels_to_microns(coords[:, 0], coords[:, 1])
+
+    return {
+        "particle_x": coords[:, 0],
+        "particle_y": coords[:, 1],
+        "particle_x_um": x_um,
+        "particle_y_um": y_um,
+        "cluster_id": cluster_ids,
+        "cluster_density": np.repeat(np.array(densities, dtype=np.float64), sizes)
+    }
+
+
+def format_of(path, default: str | None = None) -> str:
+    """
+    :param path: A file path
+    :param default: The format to return for an unknown extension. If None, an unknown extension raises a ValueError
+    :return: The file format (a key of FORMATS) that matches the path's extension
+    """
+
+    suffix = pathlib.Path(path).suffix.lower()
+
+    for file_format, extension in FORMATS.items():
+        if suffix == extension:
+            return file_format
+
+    if default is not None:
+        return default
+
+    raise ValueError(f"Unknown output file extension '{suffix}'. Expected one of {list(FORMATS.values())}")
+
+
+def write_columns(columns: dict[str, np.ndarray], path, file_format: str | None = None) -> None:
+    """
+    Writes columns to a CSV, Parquet or Arrow file. The file is written to a temporary file first and then moved into
+    place, so a reader never sees a partial file
+
+    :param columns: The columns to write
+    :param path: The file to write
+    :param file_format: One of FORMATS. If None, it is inferred from the path's extension
+    """
+
+    path = pathlib.Path(path)
+    file_format = format_of(path) if file_format is None else file_format
+    temp_path = path.with_name(f".{path.name}.tmp")
+
+    if file_format == "csv":
+        import pandas as pd
+        pd.DataFrame(columns).to_csv(temp_path, index=False)
+    elif file_format in FORMATS:
+        pyarrow = import_pyarrow()
+        table = pyarrow.table(columns)
+
+        if file_format == "parquet":
+            pyarrow.parquet.write_table(table, temp_path)
+        else:
+            pyarrow.feather.write_feather(table, temp_path, compression="uncompressed")
+    else:
+        raise ValueError(f"Unknown output format '{file_format}'. Expected one of {list(FORMATS)}")
+
+    os.replace(temp_path, path)
+
+
+class DatasetWriter:
+    """
+    Writes the results of many bundles to one dataset directory that is partitioned by bundle (Hive-style, e.g.
+    'bundle=S1/part-0.parquet'). Each bundle's partition can be written as soon as the bundle is analyzed, from any
+    process, and the whole dataset can be read at once with open_dataset.
+    """
+
+    def __init__(self, directory, file_format: str = "csv"):
+        """
+        :param directory: The dataset directory. It is created if it doesn't exist
+        :param file_format: The file format of the partitions, one of FORMATS
+        """
+
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown output format '{file_format}'. Expected one of {list(FORMATS)}")
+
+        self.directory = pathlib.Path(directory)
+        self.file_format = file_format
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def partition(self, name: str) -> pathlib.Path:
+        """
+        :return: The directory of a bundle's partition
+        """
+
+        return self.directory / f"{PARTITION_KEY}={name}"
+
+    def parts(self, name: str) -> list[pathlib.Path]:
+        """
+        :return: The files in a bundle's partition, in the order they were written
+        """
+
+        return sorted(
+            self.partition(name).glob(f"part-*{FORMATS[self.file_format]}"),
+            key=lambda path: int(path.stem.removeprefix("part-"))
+        )
+
+    def append(self, name: str, columns: dict[str, np.ndarray]) -> pathlib.Path:
+        """
+        Adds a part file to a bundle's partition
+
+        :param name: The bundle name
+        :param columns: The columns to write
+        :return: The path of the new part file
+        """
+
+        parts = self.parts(name)
+        index = int(parts[-1].stem.removeprefix("part-")) + 1 if parts else 0
+
+        path = self.partition(name) / f"part-{index}{FORMATS[self.file_format]}"
+        path.parent.mkdir(exist_ok=True)
+        write_columns(columns, path, self.file_format)
+
+        return path
+
+    def write(self, name: str, columns: dict[str, np.ndarray]) -> pathlib.Path:
+        """
+        Replaces a bundle's partition, e.g. the results of an earlier run, with a single part file
+
+        :param name: The bundle name
+        :param columns: The columns to write
+        :return: The path of the part file
+        """
+
+        shutil.rmtree(self.partition(name), ignore_errors=True)
+        return self.append(name, columns)
+
+
+def open_dataset(directory, file_format: str = "csv"):
+    """
+    Opens a dataset written by DatasetWriter. Arrow partitions are memory-mapped instead of read into memory
+
+    :param directory: The dataset directory
+    :param file_format: The file format of the partitions, one of FORMATS
+    :return: A pyarrow Dataset with a 'bundle' column. Use .to_table().to_pandas() to get a DataFrame
+    """
+
+    pyarrow = import_pyarrow()
+
+    return pyarrow.dataset.dataset(
+        directory,
+        format="ipc" if file_format == "arrow" else file_format,
+        partitioning="hive",
+        filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=False,
+        ignore_prefixes=["."]
+    )
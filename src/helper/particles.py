@@ -0,0 +1,234 @@
+import numpy as np
+
+NOISE = -1  # the cluster id of particles that are not in any cluster (and of every particle before clustering)
+
+
+class Particle:
+    """
+    A view of one row of a ParticleTable. It holds no data of its own, so reading or setting an attribute reads or
+    writes the table
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: "ParticleTable", index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def x(self) -> float:
+        return float(self.table.x[self.index])
+
+    @property
+    def y(self) -> float:
+        return float(self.table.y[self.index])
+
+    @property
+    def pixel(self) -> tuple[int, int]:
+        pixel_x, pixel_y = self.table.pixels[self.index].tolist()
+        return pixel_x, pixel_y
+
+    @property
+    def size(self) -> int:
+        return int(self.table.size[self.index])
+
+    @property
+    def score(self) -> float:
+        return float(self.table.score[self.index])
+
+    @property
+    def cluster_id(self) -> int:
+        return int(self.table.cluster_id[self.index])
+
+    @cluster_id.setter
+    def cluster_id(self, value: int) -> None:
+        self.table.cluster_id[self.index] = value
+        self.table.cluster_starts = None
+
+    def __repr__(self) -> str:
+        return (f"Particle(x={self.x}, y={self.y}, pixel={self.pixel}, size={self.size}, score={self.score}, "
+                f"cluster_id={self.cluster_id})")
+
+
+class ParticleTable:
+    """
+    Gold particles as columns: one array per field, one row per particle. Every stage (detection, clustering, density,
+    output and rendering) reads and writes the same table, so particles are never converted to lists of tuples or
+    dictionaries. After sort_by_cluster, each cluster is a contiguous range of rows, and its columns are views of the
+    table's columns
+    """
+
+    __slots__ = ("pixels", "x", "y", "size", "score", "cluster_id", "cluster_labels", "cluster_starts")
+
+    def __init__(self, pixels: np.ndarray, x: np.ndarray | None = None, y: np.ndarray | None = None,
+                 size: np.ndarray | None = None, score: np.ndarray | None = None,
+                 cluster_id: np.ndarray | None = None):
+        """
+        :param pixels: An (n, 2) array of the (x, y) pixel of each particle, as found by GoldFinder.find_gold
+        :param x: The subpixel x coordinate of each particle. If None, the pixel's
+        :param y: The subpixel y coordinate of each particle. If None, the pixel's
+        :param size: The size of each particle, in pixels. If None, 0
+        :param score: The circle score of each particle (see GoldFinder). If None, NaN
+        :param cluster_id: The cluster of each particle. If None, every particle is NOISE
+        """
+
+        # fields of a structured array are strided, so they are copied into compact columns. Contiguous arrays (e.g.,
+        # the columns of another table) are used as they are
+        self.pixels = np.ascontiguousarray(pixels, dtype=np.int64).reshape(-1, 2)
+        num_particles = len(self.pixels)
+
+        self.x = np.ascontiguousarray(x, dtype=np.float64) if x is not None else self.pixels[:, 0].astype(np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64) if y is not None else self.pixels[:, 1].astype(np.float64)
+        self.size = np.ascontiguousarray(size, dtype=np.int64) if size is not None \
+            else np.zeros(num_particles, dtype=np.int64)
+        self.score = np.ascontiguousarray(score, dtype=np.float64) if score is not None \
+            else np.full(num_particles, np.nan)
+        self.cluster_id = np.ascontiguousarray(cluster_id, dtype=np.int64) if cluster_id is not None \
+            else np.full(num_particles, NOISE, dtype=np.int64)
+
+        # the first row of each cluster (plus the number of rows), set by sort_by_cluster
+        self.cluster_labels: np.ndarray | None = None
+        self.cluster_starts: np.ndarray | None = None
+
+    @staticmethod
+    def from_particles(particles: np.ndarray) -> "ParticleTable":
+        """
+        :param particles: A structured array with gold_finder.scoring.PARTICLE_DTYPE, e.g. from
+                          GoldFinder.find_particles
+        :return: The particles as a table
+        """
+
+        return ParticleTable(
+            np.column_stack((particles["pixel_x"], particles["pixel_y"])),
+            particles["x"],
+            particles["y"],
+            particles["area"],
+            particles["circle_score"]
+        )
+
+    @staticmethod
+    def from_points(points) -> "ParticleTable":
+        """
+        :param points: The (x, y) pixel of each particle, as a list of tuples or an (n, 2) array. Particles that are
+                       already a table are returned as they are
+        :return: The particles as a table
+        """
+
+        if isinstance(points, ParticleTable):
+            return points
+
+        return ParticleTable(points)
+
+    def __len__(self) -> int:
+        return len(self.pixels)
+
+    def __getitem__(self, index: int) -> Particle:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+
+        return Particle(self, index % len(self))
+
+    def __iter__(self):
+        return (Particle(self, index) for index in range(len(self)))
+
+    def sort_by_cluster(self, labels: np.ndarray | None = None) -> "ParticleTable":
+        """
+        Sets the cluster of each particle, then sorts the rows by cluster in place, keeping the order of the particles
+        within each cluster. Afterward, each cluster is one range of rows
+
+        :param labels: The cluster of each particle, in the current row order. If None, cluster_id is kept
+        :return: The table
+        """
+
+        if labels is not None:
+            self.cluster_id[:] = labels
+
+        order = np.argsort(self.cluster_id, kind="stable")
+
+        for column in (self.pixels, self.x, self.y, self.size, self.score, self.cluster_id):
+            column[:] = column[order]
+
+        labels, starts = np.unique(self.cluster_id, return_index=True)
+        self.cluster_labels = labels
+        self.cluster_starts = np.append(starts, len(self))
+
+        return self
+
+    def cluster_ranges(self) -> dict[int, slice]:
+        """
+        :return: The rows of each cluster, in ascending cluster order (noise first). The table is sorted by cluster
+                 first if it isn't
+        """
+
+        if self.cluster_starts is None:
+            self.sort_by_cluster()
+
+        return {
+            label: slice(start, end)
+            for label, start, end in zip(
+                self.cluster_labels.tolist(), self.cluster_starts[:-1].tolist(), self.cluster_starts[1:].tolist()
+            )
+        }
+
+    def clusters(self) -> dict[int, np.ndarray]:
+        """
+        :return: The (n, 2) pixels of each cluster, in ascending cluster order. These are views of the table's pixels,
+                 in the format of clustering.gold_cluster
+        """
+
+        return {label: self.pixels[rows] for label, rows in self.cluster_ranges().items()}
+
+    def cluster(self, label: int) -> "ParticleTable":
+        """
+        :param label: The cluster id
+        :return: The cluster's rows, as a table whose columns are views of this table's columns
+        :raises KeyError: If no particle is in the cluster
+        """
+
+        rows = self.cluster_ranges()[label]
+
+        return ParticleTable(
+            self.pixels[rows], self.x[rows], self.y[rows], self.size[rows], self.score[rows], self.cluster_id[rows]
+        )
+
+    def cluster_sizes(self) -> np.ndarray:
+        """
+        :return: The number of particles in each cluster, in ascending cluster order
+        """
+
+        if self.cluster_starts is None:
+            self.sort_by_cluster()
+
+        return np.diff(self.cluster_starts)
+
+    def copy(self) -> "ParticleTable":
+        """
+        :return: A table with copies of this table's columns, e.g. to cluster a cached detection without changing it
+        """
+
+        table = ParticleTable(
+            self.pixels.copy(), self.x.copy(), self.y.copy(), self.size.copy(), self.score.copy(),
+            self.cluster_id.copy()
+        )
+        table.cluster_labels, table.cluster_starts = self.cluster_labels, self.cluster_starts
+
+        return table
+
+    def to_list(self) -> list[tuple[int, int]]:
+        """
+        :return: The pixel of each particle, as returned by GoldFinder.find_gold
+        """
+
+        return list(map(tuple, self.pixels.tolist()))
+
+
+def cluster_groups(clusters: dict | ParticleTable) -> dict:
+    """
+    :param clusters: Clustered particles, as a table or as returned by clustering.gold_cluster
+    :return: The points of each cluster, in the format of clustering.gold_cluster
+    """
+
+    if isinstance(clusters, ParticleTable):
+        return clusters.clusters()
+
+    return clusters
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+
+from PIL import Image
+
+import numpy as np
+
+from src.helper import masking, profiling
+
+THRESHOLD_METHODS = ("mean", "otsu", "local")
+DEFAULT_LOCAL_BLOCK_SIZE = 255
+
+
+@dataclass
+class LuminosityStats:
+    """
+    Luminosity statistics derived from a single 256-bin histogram of an 8-bit image
+    """
+
+    histogram: np.ndarray  # histogram[i] = number of pixels with luminosity i
+
+    @staticmethod
+    def from_array(image_data: np.ndarray) -> "LuminosityStats":
+        return LuminosityStats(np.bincount(image_data.ravel(), minlength=256).astype(np.int64))
+
+    @property
+    def mean(self) -> float:
+        """
+        The average luminosity of the non-white pixels. White pixels are ignored since applying the mask makes all
+        masked pixels white, which can skew results
+        """
+
+        histogram = self.histogram[:255]
+        return np.dot(histogram, np.arange(255)) / histogram.sum()
+
+    def otsu_threshold(self) -> float:
+        """
+        Finds the threshold that best separates the non-white pixels into a dark and a light class (Otsu's method)
+
+        :return: The threshold. Pixels with a lower luminosity are in the dark class
+        """
+
+        histogram = self.histogram[:255].astype(float)
+        levels = np.arange(255)
+
+        dark_weight = np.cumsum(histogram)
+        light_weight = dark_weight[-1] - dark_weight
+        dark_sum = np.cumsum(histogram * levels)
+        light_sum = dark_sum[-1] - dark_sum
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            between_class_variance = dark_weight * light_weight * (dark_sum / dark_weight - light_sum / light_weight) ** 2
+
+        # pixels at or below the best level are dark, so the threshold is one level above it
+        return float(np.nanargmax(between_class_variance) + 1)
+
+
+def as_array(image: Image.Image | np.ndarray) -> np.ndarray:
+    """
+    :param image: An 8-bit ("L") image or a 2D uint8 array
+    :return: The image as a 2D uint8 array. Arrays (including memory-mapped ones) are returned without copying
+    """
+
+    if isinstance(image, np.ndarray):
+        return image
+
+    return np.asarray(image)
+
+
+def local_threshold(image_data: np.ndarray, mask_threshold: float, block_size: int = DEFAULT_LOCAL_BLOCK_SIZE) \
+        -> np.ndarray:
+    """
+    Finds a per-pixel threshold from the average luminosity of the non-white pixels around each pixel, which adapts to
+    uneven staining and illumination across the image
+
+    :param image_data: The 2D uint8 image
+    :param mask_threshold: The fraction of the local average luminosity that a pixel must be lower than to be
+                           considered part of a splotch
+    :param block_size: The width and height of the neighborhood the local average is taken over
+    :return: A float32 array of thresholds with the same shape as the image
+    """
+
+    non_white = image_data < 255
+    half = block_size // 2
+
+    # Integral images of the luminosity and the number of non-white pixels, so each box sum is four lookups
+    sums = np.zeros((image_data.shape[0] + 1, image_data.shape[1] + 1), dtype=np.int64)
+    counts = np.zeros_like(sums)
+    np.cumsum(np.cumsum(np.where(non_white, image_data, 0), axis=0), axis=1, out=sums[1:, 1:])
+    np.cumsum(np.cumsum(non_white, axis=0), axis=1, out=counts[1:, 1:])
+
+    rows = np.arange(image_data.shape[0])
+    cols = np.arange(image_data.shape[1])
+    top, bottom = np.clip(rows - half, 0, None)[:, None], np.clip(rows + half + 1, None, image_data.shape[0])[:, None]
+    left, right = np.clip(cols - half, 0, None)[None, :], np.clip(cols + half + 1, None, image_data.shape[1])[None, :]
+
+    box_sums = sums[bottom, right] - sums[top, right] - sums[bottom, left] + sums[top, left]
+    box_counts = counts[bottom, right] - counts[top, right] - counts[bottom, left] + counts[top, left]
+
+    global_mean = LuminosityStats.from_array(image_data).mean
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        local_mean = np.where(box_counts > 0, box_sums / box_counts, global_mean)
+
+    return (local_mean * mask_threshold).astype(np.float32)
+
+
+@dataclass
+class Preprocessed:
+    """
+    An image ready for GoldFinder, plus the luminosity statistics of the original (unmasked) image. Every later stage
+    reads these instead of making another pass over the image
+    """
+
+    image: np.ndarray  # the (masked) 2D uint8 image
+    stats: LuminosityStats  # statistics of the unmasked image
+    region: masking.Region | None = None  # the pixels the mask kept, if a mask was applied
+
+    def threshold(self, method: str = "mean", mask_threshold: float = 0.7) -> float | np.ndarray:
+        """
+        :param method: One of THRESHOLD_METHODS. 'mean': mask_threshold times the average luminosity. 'otsu': Otsu's
+                       threshold of the histogram. 'local': mask_threshold times the local average luminosity
+        :param mask_threshold: The fraction of the average luminosity a pixel must be lower than to be part of a splotch.
+                               Not used by 'otsu'
+        :return: The luminosity a pixel must be lower than to be considered part of a splotch. This is a per-pixel
+                 array for 'local'
+        """
+
+        if method == "mean":
+            return self.stats.mean * mask_threshold
+        if method == "otsu":
+            return self.stats.otsu_threshold()
+        if method == "local":
+            return local_threshold(self.image, mask_threshold)
+
+        raise ValueError(f"Unknown threshold method '{method}'. Expected one of {list(THRESHOLD_METHODS)}")
+
+
+def preprocess(image: Image.Image | np.ndarray, mask: Image.Image | np.ndarray | masking.Region | None = None,
+               out: np.ndarray | None = None) -> Preprocessed:
+    """
+    Converts an image to an array once, computes its luminosity histogram and applies the mask
+
+    :param image: The 8-bit ("L") image or 2D uint8 array to preprocess
+    :param mask: The mask to apply. Pixels where the mask is white (or that are not in the region) are made white. If
+                 None, no mask is applied
+    :param out: A uint8 array with the image's shape to write the preprocessed image to (e.g., shared memory, see
+                helper.shared), so no other copy of the image is made. If None, a new array is made when a mask is
+                applied
+    :return: The preprocessed image and its statistics
+    """
+
+    with profiling.stage("histogram"):
+        image_data = as_array(image)
+
+        if out is not None:
+            np.copyto(out, image_data)
+            image_data = out
+
+        stats = LuminosityStats.from_array(image_data)
+
+    region = None
+
+    if mask is not None:
+        with profiling.stage("mask"):
+            region = mask if isinstance(mask, masking.Region) else masking.Region.from_mask(as_array(mask))
+            image_data = region.apply(image_data, out)
+
+    return Preprocessed(image_data, stats, region)
@@ -0,0 +1,274 @@
+from dataclasses import dataclass, field, asdict
+from typing import Callable
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+PROFILE_FORMATS = ("json", "chrome")
+
+_current: contextvars.ContextVar["Profiler | None"] = contextvars.ContextVar("profiler", default=None)
+
+
+@dataclass
+class StageRecord:
+    name: str
+    start: float  # seconds since the profiler was created
+    duration: float  # seconds
+    peak_bytes: int | None  # the peak traced memory above the memory in use when the stage started. None if not tracked
+    depth: int  # the number of stages this stage is nested in
+    thread_id: int
+
+
+@dataclass
+class _OpenStage:
+    name: str
+    start: float
+    start_bytes: int
+    peak_bytes: int
+
+
+@dataclass
+class Profiler:
+    """
+    Collects the time and peak memory of each stage of a run, plus named counters (e.g., the number of components
+    labeled). Stages and counters are recorded by the module-level stage and count functions while the profiler is
+    active (see activate), so the code being profiled does not need a reference to it
+    """
+
+    track_memory: bool = True  # whether to trace allocations with tracemalloc, which slows allocation-heavy code down
+    callbacks: list[Callable[[StageRecord], None]] = field(default_factory=list)  # called with each finished stage
+    stages: list[StageRecord] = field(default_factory=list)
+    counters: dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._open = threading.local()
+
+    def _stack(self) -> list[_OpenStage]:
+        if not hasattr(self._open, "stack"):
+            self._open.stack = []
+
+        return self._open.stack
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Records the time and peak memory of the code in the with block as one stage. Stages can be nested; the peak
+        memory of a stage includes the stages nested in it
+
+        :param name: The name of the stage, e.g. 'find_gold'
+        """
+
+        stack = self._stack()
+        tracking = self.track_memory and tracemalloc.is_tracing()
+
+        current_bytes = 0
+        if tracking:
+            current_bytes, peak = tracemalloc.get_traced_memory()
+
+            # the enclosing stage keeps the peak seen so far, since the peak is reset for this stage
+            if stack:
+                stack[-1].peak_bytes = max(stack[-1].peak_bytes, peak)
+
+            tracemalloc.reset_peak()
+
+        open_stage = _OpenStage(name, time.perf_counter(), current_bytes, current_bytes)
+        stack.append(open_stage)
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+
+            peak_bytes = None
+            if tracking:
+                open_stage.peak_bytes = max(open_stage.peak_bytes, tracemalloc.get_traced_memory()[1])
+                peak_bytes = open_stage.peak_bytes - open_stage.start_bytes
+
+                if stack:
+                    stack[-1].peak_bytes = max(stack[-1].peak_bytes, open_stage.peak_bytes)
+
+            self.record(StageRecord(
+                name, open_stage.start - self._origin, end - open_stage.start, peak_bytes, len(stack),
+                threading.get_ident()
+            ))
+
+    def record(self, stage: StageRecord) -> None:
+        """
+        Adds a finished stage and passes it to every callback
+
+        :param stage: The stage
+        """
+
+        with self._lock:
+            self.stages.append(stage)
+
+        for callback in self.callbacks:
+            callback(stage)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Adds to a counter
+
+        :param name: The name of the counter, e.g. 'pixels_scanned'
+        :param value: The amount to add
+        """
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def totals(self) -> dict[str, float]:
+        """
+        :return: The total seconds spent in each stage name, in the order the names were first finished
+        """
+
+        totals = {}
+        for stage in self.stages:
+            totals[stage.name] = totals.get(stage.name, 0.0) + stage.duration
+
+        return totals
+
+    def to_dict(self) -> dict:
+        """
+        :return: The stages and counters as JSON-serializable values
+        """
+
+        return {"stages": [asdict(stage) for stage in self.stages], "counters": dict(self.counters)}
+
+    def chrome_trace(self) -> dict:
+        """
+        :return: The stages and counters in the Chrome trace event format, which chrome://tracing and Perfetto can open.
+                 Each stage is a complete ('X') event and the counters are one counter ('C') event at the end
+        """
+
+        pid = os.getpid()
+        events = []
+
+        for stage in self.stages:
+            events.append({
+                "name": stage.name,
+                "ph": "X",
+                "ts": stage.start * 1e6,
+                "dur": stage.duration * 1e6,
+                "pid": pid,
+                "tid": stage.thread_id,
+                "args": {} if stage.peak_bytes is None else {"peak_bytes": stage.peak_bytes}
+            })
+
+        if self.counters:
+            end = max((stage.start + stage.duration for stage in self.stages), default=0.0)
+            events.append({"name": "counters", "ph": "C", "ts": end * 1e6, "pid": pid, "args": dict(self.counters)})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path, file_format: str = "json") -> None:
+        """
+        :param path: The file to write the profile to
+        :param file_format: One of PROFILE_FORMATS: 'json' (to_dict) or 'chrome' (chrome_trace)
+        """
+
+        if file_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format '{file_format}'. Expected one of {list(PROFILE_FORMATS)}")
+
+        with open(path, "w") as f:
+            json.dump(self.to_dict() if file_format == "json" else self.chrome_trace(), f, indent=2)
+
+    def summary(self) -> str:
+        """
+        :return: A table of the stages and counters, for printing
+        """
+
+        lines = ["--- PROFILE ---"]
+
+        for stage in self.stages:
+            memory = "" if stage.peak_bytes is None else f"{stage.peak_bytes / 1024 ** 2:10.1f} MiB"
+            lines.append(f"{'  ' * stage.depth + stage.name:<30}{stage.duration * 1000:10.1f} ms{memory}")
+
+        for name, value in self.counters.items():
+            lines.append(f"{name:<30}{value:>13}")
+
+        return "\n".join(lines)
+
+
+def current() -> Profiler | None:
+    """
+    :return: The active profiler, or None if no profiler is active
+    """
+
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(profiler: Profiler):
+    """
+    Makes the profiler the active one for the with block. tracemalloc is started for the block if the profiler tracks
+    memory and it is not running yet
+
+    :param profiler: The profiler
+    """
+
+    start_tracing = profiler.track_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+
+    token = _current.set(profiler)
+
+    try:
+        yield profiler
+    finally:
+        _current.reset(token)
+
+        if start_tracing:
+            tracemalloc.stop()
+
+
+class stage(contextlib.ContextDecorator):
+    """
+    Records a stage in the active profiler. Usable as a context manager (with profiling.stage('load'): ...) or as a
+    decorator (@profiling.stage('gold_cluster')). Does nothing if no profiler is active
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stage = None
+
+    def _recreate_cm(self):
+        # a new instance per call, so the decorated function can be called from several threads or recursively
+        return stage(self.name)
+
+    def __enter__(self):
+        profiler = current()
+
+        if profiler is not None:
+            self._stage = profiler.stage(self.name)
+            self._stage.__enter__()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._stage is not None:
+            self._stage.__exit__(*exc_info)
+            self._stage = None
+
+        return False
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Adds to a counter of the active profiler. Does nothing if no profiler is active
+
+    :param name: The name of the counter
+    :param value: The amount to add
+    """
+
+    profiler = current()
+
+    if profiler is not None:
+        profiler.count(name, value)
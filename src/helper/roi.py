@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import pathlib
+import struct
+import zipfile
+
+from src.helper import masking
+
+# ImageJ's ROI file format (see ij.io.RoiDecoder)
+MAGIC = b"Iout"
+HEADER_SIZE = 64
+SUB_PIXEL_RESOLUTION = 128  # an option flag: float coordinates follow the integer ones
+SUB_PIXEL_VERSION = 222  # the first version that can store float coordinates
+
+POLYGON, RECT, OVAL, LINE, FREELINE, POLYLINE, NO_ROI, FREEHAND, TRACED, ANGLE, POINT = range(11)
+TYPE_NAMES = ("polygon", "rect", "oval", "line", "freeline", "polyline", "noRoi", "freehand", "traced", "angle",
+              "point")
+AREA_TYPES = (POLYGON, RECT, OVAL, FREEHAND, TRACED)
+COORDINATE_TYPES = (POLYGON, FREELINE, POLYLINE, FREEHAND, TRACED, ANGLE, POINT)
+
+
+class UnsupportedRoi(ValueError):
+    """
+    Raised when a ROI file is not an ImageJ ROI or uses a feature that is not supported (e.g., a composite shape)
+    """
+
+
+@dataclass
+class Roi:
+    """
+    An ImageJ region of interest, as saved by the ROI manager in .roi files (or .zip files of them)
+    """
+
+    name: str
+    type: int  # one of the type constants, e.g. POLYGON
+    box: tuple[int, int, int, int]  # (left, top, right, bottom), right and bottom exclusive
+    points: np.ndarray  # (n, 2) float array of (x, y) vertices or points, in image coordinates. Empty for rects/ovals
+
+    @property
+    def type_name(self) -> str:
+        return TYPE_NAMES[self.type]
+
+    @property
+    def is_area(self) -> bool:
+        return self.type in AREA_TYPES
+
+    def row_spans(self) -> np.ndarray:
+        """
+        Rasterizes an area ROI. Like ImageJ, a pixel is inside if its center is inside the shape
+
+        :return: An (n, 3) int64 array of (row, start column, end column) runs, end exclusive (see masking.Region)
+        :raises ValueError: If the ROI is not an area (e.g., points or lines)
+        """
+
+        if not self.is_area:
+            raise ValueError(f"A {self.type_name} ROI has no area")
+
+        left, top, right, bottom = self.box
+
+        if self.type == RECT:
+            rows = np.arange(top, bottom)
+            return np.column_stack((rows, np.full_like(rows, left), np.full_like(rows, right))).astype(np.int64)
+
+        if self.type == OVAL:
+            return oval_spans(self.box)
+
+        return polygon_spans(self.points)
+
+    def region(self, image_size: tuple[int, int] | None = None) -> masking.Region:
+        """
+        :param image_size: The (width, height) of the image to clip the ROI to. If None, it is not clipped
+        :return: The pixels of an area ROI
+        """
+
+        return masking.Region.from_spans(self.row_spans(), image_size)
+
+
+def polygon_spans(points: np.ndarray) -> np.ndarray:
+    """
+    Finds the pixels whose centers are inside a polygon (even-odd rule), one scanline of pixel centers at a time
+
+    :param points: The (n, 2) array of (x, y) vertices
+    :return: An (n, 3) array of (row, start column, end column) runs
+    """
+
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+    rows = np.arange(np.floor(y0.min()), np.ceil(y0.max()), dtype=np.int64)
+    centers = rows[:, None] + 0.5
+
+    # an edge crosses a scanline if its ends are on different sides of it. Horizontal edges never do
+    row_index, edge = np.nonzero((y0 <= centers) != (y1 <= centers))
+    crossings = x0[edge] + (centers[row_index, 0] - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+
+    # every scanline crosses the polygon an even number of times, and the inside is between alternate crossings
+    order = np.lexsort((crossings, row_index))
+    row_index, crossings = row_index[order], crossings[order]
+
+    starts = np.ceil(crossings[0::2] - 0.5).astype(np.int64)
+    ends = np.ceil(crossings[1::2] - 0.5).astype(np.int64)
+    spans = np.column_stack((rows[row_index[0::2]], starts, ends))
+
+    return spans[ends > starts]
+
+
+def oval_spans(box: tuple[int, int, int, int]) -> np.ndarray:
+    """
+    :param box: The (left, top, right, bottom) bounding box of an ellipse
+    :return: The (row, start column, end column) runs of the pixels whose centers are inside the ellipse
+    """
+
+    left, top, right, bottom = box
+    center_x, center_y = (left + right) / 2, (top + bottom) / 2
+    radius_x, radius_y = (right - left) / 2, (bottom - top) / 2
+
+    rows = np.arange(top, bottom, dtype=np.int64)
+    half_widths = radius_x * np.sqrt(np.clip(1 - ((rows + 0.5 - center_y) / radius_y) ** 2, 0, None))
+
+    starts = np.ceil(center_x - half_widths - 0.5).astype(np.int64)
+    ends = np.ceil(center_x + half_widths - 0.5).astype(np.int64)
+    spans = np.column_stack((rows, starts, ends))
+
+    return spans[ends > starts]
+
+
+def parse(data: bytes, name: str = "") -> Roi:
+    """
+    Parses one ImageJ ROI
+
+    :param data: The contents of a .roi file
+    :param name: The name of the ROI, e.g. its file name
+    :return: The ROI
+    :raises UnsupportedRoi: If the data is not an ImageJ ROI, or is a composite shape
+    """
+
+    if len(data) < HEADER_SIZE or data[:4] != MAGIC:
+        raise UnsupportedRoi(f"{name or 'The data'} is not an ImageJ ROI")
+
+    version, roi_type, top, left, bottom, right, num_points = struct.unpack_from(">hBxhhhhH", data, 4)
+    shape_size, = struct.unpack_from(">i", data, 36)
+    options, = struct.unpack_from(">H", data, 50)
+
+    if roi_type >= len(TYPE_NAMES):
+        raise UnsupportedRoi(f"{name or 'The ROI'} has an unknown type ({roi_type})")
+
+    if shape_size > 0:
+        raise UnsupportedRoi(f"{name or 'The ROI'} is a composite shape, which is not supported")
+
+    points = np.zeros((0, 2))
+
+    if roi_type in COORDINATE_TYPES:
+        offset = HEADER_SIZE + 4 * num_points
+
+        if options & SUB_PIXEL_RESOLUTION and version >= SUB_PIXEL_VERSION:
+            xs = np.frombuffer(data, ">f4", num_points, offset)
+            ys = np.frombuffer(data, ">f4", num_points, offset + 4 * num_points)
+        else:
+            xs = np.frombuffer(data, ">i2", num_points, HEADER_SIZE) + left
+            ys = np.frombuffer(data, ">i2", num_points, HEADER_SIZE + 2 * num_points) + top
+
+        points = np.column_stack((xs, ys)).astype(float)
+
+    return Roi(name, roi_type, (left, top, right, bottom), points)
+
+
+def read(path) -> list[Roi]:
+    """
+    Reads the ROIs of a .roi file, or of every .roi file in a .zip file (as saved by ImageJ's ROI manager)
+
+    :param path: The path to the file
+    :return: The ROIs, in file order
+    """
+
+    path = pathlib.Path(path)
+
+    if not zipfile.is_zipfile(path):
+        return [parse(path.read_bytes(), path.stem)]
+
+    with zipfile.ZipFile(path) as archive:
+        return [
+            parse(archive.read(entry), pathlib.PurePath(entry).stem)
+            for entry in archive.namelist() if entry.endswith(".roi")
+        ]
+
+
+def points(rois: list[Roi]) -> np.ndarray:
+    """
+    :param rois: ROIs, e.g. the point ROIs that mark the gold particles in a bundle's 'Results ... ROI.zip' files
+    :return: An (n, 2) array of the (x, y) pixel coordinates of every point of every point ROI
+    """
+
+    return np.concatenate([np.zeros((0, 2))] + [roi.points for roi in rois if roi.type == POINT])
+
+
+def region(rois: list[Roi], image_size: tuple[int, int] | None = None) -> masking.Region:
+    """
+    :param rois: ROIs. Only the area ROIs are used
+    :param image_size: The (width, height) of the image to clip the ROIs to. If None, they are not clipped
+    :return: The pixels in any of the area ROIs
+    :raises ValueError: If none of the ROIs is an area
+    """
+
+    if not any(roi.is_area for roi in rois):
+        raise ValueError("None of the ROIs is an area")
+
+    return masking.Region.from_spans(np.concatenate([roi.row_spans() for roi in rois if roi.is_area]), image_size)
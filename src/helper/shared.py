@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import contextlib
+import os
+import tempfile
+
+from src.helper import masking
+
+# A RAM-backed file system, so shared arrays never touch the disk. Elsewhere, the default temporary directory is used
+# and the page cache keeps the arrays in memory
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+FILE_PREFIX = "golden-"
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """
+    A description of an array in shared memory (a memory-mapped file). It is a few bytes to pickle, so it can be sent to
+    worker processes, which open the array without copying it
+    """
+
+    path: str
+    shape: tuple[int, ...]
+    dtype: str
+
+    @staticmethod
+    def create(shape: tuple[int, ...], dtype=np.uint8) -> "SharedArray":
+        """
+        :param shape: The shape of the array. It must have at least one element
+        :param dtype: The data type of the array
+        :return: A new zero-filled shared array. The caller unlinks it when it is no longer needed
+        """
+
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+
+        if size == 0:
+            raise ValueError("A shared array must have at least one element")
+
+        fd, path = tempfile.mkstemp(prefix=FILE_PREFIX, dir=SHARED_MEMORY_DIR)
+
+        try:
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
+        return SharedArray(path, tuple(int(length) for length in shape), dtype.str)
+
+    @staticmethod
+    def from_array(array: np.ndarray) -> "SharedArray":
+        """
+        :return: A new shared array with a copy of the array's contents
+        """
+
+        shared = SharedArray.create(array.shape, array.dtype)
+        np.copyto(shared.open(writable=True), array)
+
+        return shared
+
+    def open(self, writable: bool = False) -> np.memmap:
+        """
+        :param writable: Whether writes to the returned array are shared. If False, the array is read-only
+        :return: The array, backed by the shared memory
+        """
+
+        return np.memmap(self.path, dtype=np.dtype(self.dtype), mode="r+" if writable else "r", shape=self.shape)
+
+    def unlink(self) -> None:
+        """
+        Frees the shared memory once every process has closed its arrays. Opening the array afterward fails
+        """
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+@dataclass(frozen=True)
+class SharedRegion:
+    """
+    A masking.Region whose boolean array is in shared memory, so it can be sent to worker processes like a SharedArray
+    """
+
+    box: tuple[int, int, int, int]
+    inside: SharedArray | None  # None if the region is empty, since a shared array can't be
+
+    @staticmethod
+    def from_region(region: masking.Region) -> "SharedRegion":
+        """
+        :return: A new shared region with a copy of the region's array. The caller unlinks it when it is no longer
+                 needed
+        """
+
+        return SharedRegion(region.box, SharedArray.from_array(region.inside) if region.inside.size > 0 else None)
+
+    def open(self) -> masking.Region:
+        """
+        :return: The region, with its array backed by the shared memory
+        """
+
+        inside = self.inside.open() if self.inside is not None else np.zeros((0, 0), dtype=bool)
+        return masking.Region(self.box, inside)
+
+    def unlink(self) -> None:
+        if self.inside is not None:
+            self.inside.unlink()
+
+
+@contextlib.contextmanager
+def temporary(shape: tuple[int, ...], dtype=np.uint8):
+    """
+    A shared array that is unlinked when the with block exits
+
+    :param shape: The shape of the array
+    :param dtype: The data type of the array
+    """
+
+    shared = SharedArray.create(shape, dtype)
+
+    try:
+        yield shared
+    finally:
+        shared.unlink()
@@ -0,0 +1,438 @@
+from dataclasses import dataclass
+
+from PIL import Image
+
+import numpy as np
+
+import os
+import pathlib
+import struct
+
+# TIFF tags
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+
+# field type -> struct format of one value
+FIELD_FORMATS = {1: "B", 3: "H", 4: "I", 16: "Q"}
+
+WHITE_IS_ZERO = 0
+BLACK_IS_ZERO = 1
+RGB = 2
+
+ROWS_PER_CHUNK = 1024  # rows converted at once when an image can't be memory-mapped as is
+MIN_PYRAMID_SIZE = 256
+
+
+class UnsupportedTiff(ValueError):
+    """
+    Raised for TIFF files whose pixels can't be read straight from the file (e.g., compressed ones). These are decoded
+    with PIL instead
+    """
+
+
+@dataclass
+class TiffLayout:
+    """
+    Where the pixels of the first image in a TIFF file are, read from its header without touching the pixel data
+    """
+
+    width: int
+    height: int
+    samples_per_pixel: int
+    bits_per_sample: int
+    compression: int
+    photometric: int
+    planar_configuration: int
+    offsets: list[int]  # of each strip, or of each tile if tile_width is not None
+    byte_counts: list[int]
+    rows_per_strip: int
+    tile_width: int | None = None
+    tile_height: int | None = None
+
+    def check_supported(self) -> None:
+        """
+        :raise UnsupportedTiff: If the pixels are compressed or not 8-bit grayscale or RGB
+        """
+
+        if self.compression != 1:
+            raise UnsupportedTiff(f"Compressed TIFF (compression {self.compression})")
+        if self.bits_per_sample != 8:
+            raise UnsupportedTiff(f"{self.bits_per_sample}-bit TIFF")
+        if self.samples_per_pixel > 1 and self.planar_configuration != 1:
+            raise UnsupportedTiff("Planar TIFF")
+        if (self.photometric, self.samples_per_pixel) not in ((WHITE_IS_ZERO, 1), (BLACK_IS_ZERO, 1)) \
+                and not (self.photometric == RGB and self.samples_per_pixel in (3, 4)):
+            raise UnsupportedTiff(f"TIFF with photometric interpretation {self.photometric}")
+
+    def is_contiguous(self) -> bool:
+        """
+        :return: True if the image is stored in strips that directly follow each other, so the whole image is one block
+                 of bytes in the file
+        """
+
+        if self.tile_width is not None:
+            return False
+
+        return all(
+            offset + byte_count == next_offset
+            for offset, byte_count, next_offset in zip(self.offsets, self.byte_counts, self.offsets[1:])
+        )
+
+
+def read_tags(f, header: bytes, byte_order: str) -> dict[int, list[int]]:
+    """
+    :param f: The TIFF file, opened in binary mode
+    :param header: The first 8 bytes of the file
+    :param byte_order: The struct byte order of the file
+    :return: The values of each tag of the first image file directory that has a supported field type
+    :raise UnsupportedTiff: If the file is not a classic TIFF file
+    :raise struct.error: If the file is cut off
+    """
+
+    magic, ifd_offset = struct.unpack(byte_order + "HI", header[2:8])
+    if magic != 42:
+        raise UnsupportedTiff("Not a classic TIFF file")
+
+    f.seek(ifd_offset)
+    (num_entries,) = struct.unpack(byte_order + "H", f.read(2))
+    entries = f.read(12 * num_entries)
+
+    tags = {}
+
+    for i in range(num_entries):
+        tag, field_type, count = struct.unpack(byte_order + "HHI", entries[12 * i:12 * i + 8])
+
+        if field_type not in FIELD_FORMATS:
+            continue
+
+        value_format = f"{byte_order}{count}{FIELD_FORMATS[field_type]}"
+        size = struct.calcsize(value_format)
+
+        if size <= 4:
+            data = entries[12 * i + 8:12 * i + 8 + size]
+        else:
+            (value_offset,) = struct.unpack(byte_order + "I", entries[12 * i + 8:12 * i + 12])
+            position = f.tell()
+            f.seek(value_offset)
+            data = f.read(size)
+            f.seek(position)
+
+        tags[tag] = list(struct.unpack(value_format, data))
+
+    return tags
+
+
+def read_layout(path) -> TiffLayout:
+    """
+    Reads the layout of the first image in a TIFF file from its header and first image file directory
+
+    :param path: The TIFF file
+    :return: The layout
+    :raise UnsupportedTiff: If the file is not a (classic, non-BigTIFF) TIFF file, is cut off or lacks the tags that
+                            locate the pixels
+    """
+
+    with open(path, "rb") as f:
+        header = f.read(8)
+
+        if header[:2] == b"II":
+            byte_order = "<"
+        elif header[:2] == b"MM":
+            byte_order = ">"
+        else:
+            raise UnsupportedTiff("Not a TIFF file")
+
+        try:
+            tags = read_tags(f, header, byte_order)
+        except struct.error as error:  # the header or a tag's values are cut off
+            raise UnsupportedTiff(f"Truncated TIFF file ({error})") from error
+
+    tiled = TILE_OFFSETS in tags
+    required = (TILE_OFFSETS, TILE_BYTE_COUNTS, TILE_WIDTH, TILE_LENGTH) if tiled \
+        else (STRIP_OFFSETS, STRIP_BYTE_COUNTS)
+
+    missing = [tag for tag in (IMAGE_WIDTH, IMAGE_LENGTH, *required) if len(tags.get(tag, [])) == 0]
+    if missing:
+        raise UnsupportedTiff(f"TIFF without the required tags {missing}")
+
+    if len(tags[required[0]]) != len(tags[required[1]]):
+        raise UnsupportedTiff("TIFF with a different number of offsets and byte counts")
+
+    return TiffLayout(
+        width=tags[IMAGE_WIDTH][0],
+        height=tags[IMAGE_LENGTH][0],
+        samples_per_pixel=tags.get(SAMPLES_PER_PIXEL, [1])[0],
+        bits_per_sample=tags.get(BITS_PER_SAMPLE, [1])[0],
+        compression=tags.get(COMPRESSION, [1])[0],
+        photometric=tags.get(PHOTOMETRIC, [BLACK_IS_ZERO])[0],
+        planar_configuration=tags.get(PLANAR_CONFIGURATION, [1])[0],
+        offsets=tags[TILE_OFFSETS if tiled else STRIP_OFFSETS],
+        byte_counts=tags[TILE_BYTE_COUNTS if tiled else STRIP_BYTE_COUNTS],
+        rows_per_strip=tags.get(ROWS_PER_STRIP, [tags[IMAGE_LENGTH][0]])[0],
+        tile_width=tags[TILE_WIDTH][0] if tiled else None,
+        tile_height=tags[TILE_LENGTH][0] if tiled else None
+    )
+
+
+def to_luminosity(pixels: np.ndarray, photometric: int) -> np.ndarray:
+    """
+    Converts raw pixels to 8-bit luminosity exactly like PIL's convert("L")
+
+    :param pixels: A (rows, columns, samples) uint8 array
+    :param photometric: The photometric interpretation of the pixels
+    :return: A (rows, columns) uint8 array
+    """
+
+    if photometric == WHITE_IS_ZERO:
+        return 255 - pixels[..., 0]
+    if photometric == BLACK_IS_ZERO:
+        return pixels[..., 0]
+
+    # PIL's fixed-point ITU-R 601-2 luma transform
+    rgb = pixels[..., :3].astype(np.uint32)
+    return ((rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+
+class TiffImage:
+    """
+    An uncompressed 8-bit TIFF image whose pixels are read straight from a memory map of the file, so only the rows or
+    tiles that are used are ever read from disk
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The TIFF file
+        :raise UnsupportedTiff: If the pixels can't be read straight from the file. Use PIL for these
+        """
+
+        self.path = pathlib.Path(path)
+        self.layout = read_layout(path)
+        self.layout.check_supported()
+
+        self.file = np.memmap(path, dtype=np.uint8, mode="r")
+
+        if any(offset + byte_count > len(self.file)
+               for offset, byte_count in zip(self.layout.offsets, self.layout.byte_counts)):
+            raise UnsupportedTiff("TIFF whose pixels are cut off")
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """
+        :return: (width, height), like PIL's Image.size
+        """
+
+        return self.layout.width, self.layout.height
+
+    def raw_rows(self, top: int, bottom: int) -> np.ndarray:
+        """
+        :return: The raw (rows, width, samples) pixels of rows [top, bottom) of a strip-based image
+        """
+
+        layout = self.layout
+        row_bytes = layout.width * layout.samples_per_pixel
+        strips = []
+
+        for strip in range(top // layout.rows_per_strip, (bottom - 1) // layout.rows_per_strip + 1):
+            strip_top = strip * layout.rows_per_strip
+            first = max(top, strip_top) - strip_top
+            last = min(bottom, strip_top + layout.rows_per_strip) - strip_top
+
+            start = layout.offsets[strip] + first * row_bytes
+            strips.append(self.file[start:start + (last - first) * row_bytes])
+
+        data = strips[0] if len(strips) == 1 else np.concatenate(strips)
+        return data.reshape(bottom - top, layout.width, layout.samples_per_pixel)
+
+    def raw_tiles(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """
+        :return: The raw (rows, columns, samples) pixels of a (left, top, right, bottom) box of a tiled image
+        """
+
+        layout = self.layout
+        left, top, right, bottom = box
+        tiles_across = -(-layout.width // layout.tile_width)
+        tile_bytes = layout.tile_width * layout.tile_height * layout.samples_per_pixel
+
+        region = np.empty((bottom - top, right - left, layout.samples_per_pixel), dtype=np.uint8)
+
+        for tile_row in range(top // layout.tile_height, (bottom - 1) // layout.tile_height + 1):
+            for tile_col in range(left // layout.tile_width, (right - 1) // layout.tile_width + 1):
+                offset = layout.offsets[tile_row * tiles_across + tile_col]
+                tile = self.file[offset:offset + tile_bytes].reshape(
+                    layout.tile_height, layout.tile_width, layout.samples_per_pixel
+                )
+
+                tile_top, tile_left = tile_row * layout.tile_height, tile_col * layout.tile_width
+                rows = slice(max(top, tile_top), min(bottom, tile_top + layout.tile_height))
+                cols = slice(max(left, tile_left), min(right, tile_left + layout.tile_width))
+
+                region[rows.start - top:rows.stop - top, cols.start - left:cols.stop - left] = tile[
+                    rows.start - tile_top:rows.stop - tile_top, cols.start - tile_left:cols.stop - tile_left
+                ]
+
+        return region
+
+    def read_region(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """
+        :param box: The (left, top, right, bottom) region to read
+        :return: The luminosity of the region as a 2D uint8 array. Only the strips or tiles that overlap the region are
+                 read from disk
+        """
+
+        left, top, right, bottom = box
+
+        if self.layout.tile_width is not None:
+            raw = self.raw_tiles(box)
+        else:
+            raw = self.raw_rows(top, bottom)[:, left:right]
+
+        return to_luminosity(raw, self.layout.photometric)
+
+    def getpixel(self, xy: tuple[int, int]) -> int:
+        """
+        :return: The luminosity of one pixel, like PIL's Image.getpixel. Only the pixel's strip or tile is read
+        """
+
+        x, y = xy
+        return int(self.read_region((x, y, x + 1, y + 1))[0, 0])
+
+    def as_array(self) -> np.ndarray:
+        """
+        :return: The luminosity of the whole image as a writable 2D uint8 array. Contiguous 8-bit grayscale images are
+                 memory-mapped copy-on-write, so pixels are only read from disk when they are used and writing to the
+                 array never changes the file. Other images are converted a chunk of rows at a time
+        """
+
+        layout = self.layout
+
+        if layout.is_contiguous() and layout.samples_per_pixel == 1 and layout.photometric == BLACK_IS_ZERO:
+            return np.memmap(
+                self.path, dtype=np.uint8, mode="c", offset=layout.offsets[0], shape=(layout.height, layout.width)
+            )
+
+        image_data = np.empty((layout.height, layout.width), dtype=np.uint8)
+
+        for top in range(0, layout.height, ROWS_PER_CHUNK):
+            bottom = min(top + ROWS_PER_CHUNK, layout.height)
+            image_data[top:bottom] = self.read_region((0, top, layout.width, bottom))
+
+        return image_data
+
+
+def open_array(path) -> np.ndarray:
+    """
+    Loads the luminosity of a TIFF file as a writable 2D uint8 array, memory-mapping it when possible and decoding it
+    with PIL otherwise
+
+    :param path: The TIFF file
+    :return: The luminosity, identical to np.asarray(Image.open(path).convert("L"))
+    """
+
+    try:
+        return TiffImage(path).as_array()
+    except UnsupportedTiff:
+        return np.array(Image.open(path).convert("L"))
+
+
+def downsample(image_data: np.ndarray) -> np.ndarray:
+    """
+    Halves the width and height of an image by averaging 2x2 blocks of pixels, a chunk of rows at a time so that a
+    memory-mapped image is never read into memory all at once. An odd last row or column is dropped
+
+    :param image_data: A 2D uint8 array
+    :return: The downsampled 2D uint8 array
+    """
+
+    height, width = image_data.shape[0] // 2, image_data.shape[1] // 2
+    downsampled = np.empty((height, width), dtype=np.uint8)
+
+    for top in range(0, height, ROWS_PER_CHUNK):
+        bottom = min(top + ROWS_PER_CHUNK, height)
+
+        blocks = image_data[2 * top:2 * bottom, :2 * width].reshape(bottom - top, 2, width, 2).astype(np.uint16)
+        downsampled[top:bottom] = (blocks.sum(axis=(1, 3)) + 2) // 4
+
+    return downsampled
+
+
+class Pyramid:
+    """
+    Successively halved versions of an image, for previews and visualizations of images that are too large to show at
+    full resolution
+    """
+
+    def __init__(self, levels: list[np.ndarray]):
+        self.levels = levels  # levels[k] is downsampled by 2 ** k
+
+    @staticmethod
+    def build(image_data: np.ndarray, min_size: int = MIN_PYRAMID_SIZE) -> "Pyramid":
+        """
+        :param image_data: The full-resolution 2D uint8 image
+        :param min_size: Levels are added until the longest side is at most this many pixels
+        :return: The pyramid
+        """
+
+        levels = [image_data]
+
+        while max(levels[-1].shape) > min_size and min(levels[-1].shape) >= 2:
+            levels.append(downsample(levels[-1]))
+
+        return Pyramid(levels)
+
+    @staticmethod
+    def cached(image_data: np.ndarray, directory, min_size: int = MIN_PYRAMID_SIZE) -> "Pyramid":
+        """
+        Loads the downsampled levels of an image from a directory, or builds them and saves them there. Saved levels are
+        memory-mapped, and loading them touches the directory, so caches can evict the least recently used pyramids
+
+        :param image_data: The full-resolution 2D uint8 image
+        :param directory: The directory for this image's levels. The caller is responsible for using a different
+                          directory for each image (e.g., one named after a hash of the image file)
+        :param min_size: See Pyramid.build
+        :return: The pyramid. Its first level is image_data
+        """
+
+        directory = pathlib.Path(directory)
+        paths = sorted(directory.glob("level_*.npy"), key=lambda path: int(path.stem.removeprefix("level_")))
+
+        if len(paths) > 0:
+            try:
+                levels = [np.load(path, mmap_mode="r") for path in paths]
+                os.utime(directory)
+                return Pyramid([image_data, *levels])
+            except OSError:  # the levels were evicted while they were being loaded, so they are built again
+                pass
+
+        pyramid = Pyramid.build(image_data, min_size)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for k, level in enumerate(pyramid.levels[1:], start=1):
+            temp_path = directory / f".level_{k}.npy"
+            np.save(temp_path, level)
+            temp_path.replace(directory / f"level_{k}.npy")
+
+        return pyramid
+
+    def level_for(self, max_size: int) -> tuple[np.ndarray, int]:
+        """
+        :param max_size: The longest side the level may have
+        :return: [the largest level that fits in max_size (or the smallest level), its downsampling factor]
+        """
+
+        for k, level in enumerate(self.levels):
+            if max(level.shape) <= max_size:
+                return level, 2 ** k
+
+        return self.levels[-1], 2 ** (len(self.levels) - 1)
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def connected_components(num_nodes: int, edges_a: np.ndarray, edges_b: np.ndarray) -> np.ndarray:
+    """
+    Finds the connected components of an undirected graph using array-based union-find (hooking and pointer jumping),
+    so that no Python-level loop runs per node or per edge
+
+    :param num_nodes: The number of nodes in the graph. Nodes are the integers [0, num_nodes)
+    :param edges_a: One endpoint of each edge
+    :param edges_b: The other endpoint of each edge
+    :return: An array that maps each node to the smallest node in its component
+    """
+
+    parent = np.arange(num_nodes, dtype=np.intp)
+    edges_a = np.asarray(edges_a, dtype=np.intp)
+    edges_b = np.asarray(edges_b, dtype=np.intp)
+
+    while True:
+        roots_a = parent[edges_a]
+        roots_b = parent[edges_b]
+
+        differ = roots_a != roots_b
+        if not differ.any():
+            return parent
+
+        roots_a = roots_a[differ]
+        roots_b = roots_b[differ]
+
+        # hook the larger root under the smaller one. parent[x] <= x always holds, so this can't create a cycle
+        np.minimum.at(parent, np.maximum(roots_a, roots_b), np.minimum(roots_a, roots_b))
+
+        # pointer jumping until every node points directly at a root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+class UnionFind:
+    """
+    A disjoint set forest over the integers [0, size) with path halving and union by size, for algorithms that have to
+    process unions one at a time (e.g., Kruskal's algorithm)
+    """
+
+    def __init__(self, size: int):
+        # plain lists are much faster than numpy arrays for scalar access
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, node: int) -> int:
+        parent = self.parent
+
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+
+        return node
+
+    def union(self, node_a: int, node_b: int) -> bool:
+        """
+        :return: True if the nodes were in different sets (and are now merged), False if they were already in one set
+        """
+
+        root_a = self.find(node_a)
+        root_b = self.find(node_b)
+
+        if root_a == root_b:
+            return False
+
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+
+        return True
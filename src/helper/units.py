@@ -24,3 +24,15 @@ def microns_to_pixels(*args: float, pixels_per_micron: float = PIXEL_PER_MICRON)
     """
     
     return tuple(int(arg * pixels_per_micron) for arg in args)
+
+
+def nanometers_to_pixels(*args: float, pixels_per_nm: float = PIXEL_PER_NM) -> tuple[float, ...]:
+    """
+    Converts lengths in nanometers to (fractional) pixels
+    
+    :param args: The lengths in nanometers
+    :param pixels_per_nm: The conversion ratio of pixels to nanometers
+    :return: The lengths in pixels
+    """
+    
+    return tuple(arg * pixels_per_nm for arg in args)
@@ -1,7 +1,10 @@
 from numbers import Number
 
 import math
-import networkx as nx
+
+from src.network import mst
+
+DEFAULT_BACKEND = "delaunay"
 
 
 def dist(p1, p2):
@@ -9,6 +12,8 @@ def dist(p1, p2):
 
 
 def gen_network(points):
+    import networkx as nx  # only the reference backend uses networkx
+    
     g = nx.Graph()
     g.add_nodes_from(points)
     
@@ -19,20 +24,57 @@ def gen_network(points):
     
     # return the MST of the network for later analysis
     return nx.minimum_spanning_tree(g)
+
+
+def networkx_mst_weight(points: list[tuple[Number, Number]]) -> float:
+    """
+    The reference implementation of the MST weight, which builds the complete graph of the points. This takes O(n^2)
+    time and memory, so it is only meant for testing the other backends.
     
+    :param points: The points of the gold particles (list of tuples)
+    :return: The total weight of the minimum spanning tree
+    """
+    
+    network = gen_network([tuple(point) for point in points])
+    return sum(network.edges[edge]["weight"] for edge in network.edges)
+
 
-def density(points: list[tuple[Number, Number]]) -> float:
+BACKENDS = {
+    "delaunay": mst.mst_weight,
+    "networkx": networkx_mst_weight
+}
+
+
+def density(points: list[tuple[Number, Number]], backend: str = DEFAULT_BACKEND) -> float:
     """
     Finds the density of a set of points using the minimum spanning tree of the network of the points, using distance as
     weight.
     
     :param points: The points of the gold particles (list of tuples)
+    :param backend: How to find the minimum spanning tree. One of BACKENDS: 'delaunay' (O(n log n), the default) or
+                    'networkx' (O(n^2), the reference implementation)
     :return: A density score, where a higher score means a higher density. 0 = no density, infinity = infinite density
     """
     
-    if len(points) in (0, 1):  # return infinity since there is an infinite density with infinitely small area
+    if len(points) in (0, 1):
+        return score(len(points), 0)
+    
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown density backend '{backend}'. Expected one of {list(BACKENDS)}")
+    
+    return score(len(points), BACKENDS[backend](points))
+
+
+def score(num_points: int, total_weight: float) -> float:
+    """
+    :param num_points: The number of points
+    :param total_weight: The total weight of the minimum spanning tree of the points
+    :return: The density score of the points (see density)
+    """
+    
+    # return infinity since there is an infinite density with infinitely small area. This is also the case when all
+    # the points coincide
+    if num_points in (0, 1) or total_weight == 0:
         return float("inf")
     
-    network = gen_network(points)
-    total_weight = sum(network.edges[edge]["weight"] for edge in network.edges)
-    return len(points) / total_weight * 100  # multiply by 100 so the density values aren't insanely small
+    return num_points / total_weight * 100  # multiply by 100 so the density values aren't insanely small
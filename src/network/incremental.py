@@ -0,0 +1,396 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from numbers import Number
+
+import math
+
+import numpy as np
+
+from src.helper import profiling, union_find
+from src.network import density, mst
+
+NOISE_LABEL = -1  # the label DBSCAN and HDBSCAN give to particles that are not in any cluster
+DEFAULT_MAX_ENTRIES = 1024
+
+YAO_CONES = 6  # the Euclidean MST is a subgraph of the Yao graph with 6 (or more) cones
+YAO_CHUNK_ELEMENTS = 2 ** 20  # bounds the (new points x all points) distance arrays built at once
+
+# A new point set is derived from a cached one if at least this fraction of its points are in the cached set, and
+# (points added x points) is at most MAX_ADDED_PAIRS. Otherwise, its tree is built from scratch, which is faster
+MIN_SHARED_FRACTION = 0.5
+MAX_ADDED_PAIRS = 2 ** 22
+
+# Removing points only re-solves the hole they leave in the Delaunay triangulation if it has at most this many
+# vertices. Otherwise, the remaining points are triangulated again
+MAX_HOLE_VERTICES = 64
+
+
+def as_points(points: list[tuple[Number, Number]] | np.ndarray) -> np.ndarray:
+    """
+    :param points: The points (list of tuples or an (n, 2) array)
+    :return: The points as an (n, 2) float array
+    """
+
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def point_set_key(points: np.ndarray) -> bytes:
+    """
+    :param points: An (n, 2) float array of points
+    :return: A key that is the same for every ordering of the same points (duplicates included)
+    """
+
+    return np.ascontiguousarray(points[np.lexsort((points[:, 1], points[:, 0]))]).tobytes()
+
+
+def point_codes(points: np.ndarray) -> np.ndarray:
+    """
+    :param points: An (n, 2) float array of points
+    :return: Each point as one complex number, x + iy, which compare equal exactly when the points do and sort by x,
+             then y
+    """
+
+    return np.ascontiguousarray(points, dtype=np.float64).view(np.complex128)[:, 0]
+
+
+def occurrence_ranks(codes: np.ndarray) -> np.ndarray:
+    """
+    :param codes: Point codes (see point_codes)
+    :return: For each point, the number of equal points before it
+    """
+
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+
+    starts = np.flatnonzero(np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+    ranks = np.empty(len(codes), dtype=np.intp)
+    ranks[order] = np.arange(len(codes)) - np.repeat(starts, np.diff(np.append(starts, len(codes))))
+
+    return ranks
+
+
+def match_points(points_a: np.ndarray, points_b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Matches the points of two multisets, so a point that is twice in one set and once in the other is matched once
+
+    :param points_a: An (n, 2) float array of points
+    :param points_b: An (m, 2) float array of points
+    :return: [which points of a are matched to a point of b, which points of b are matched to a point of a]
+    """
+
+    codes = np.concatenate((point_codes(points_a), point_codes(points_b)))
+    ranks = np.concatenate((occurrence_ranks(codes[:len(points_a)]), occurrence_ranks(codes[len(points_a):])))
+
+    # the k-th copy of a point in a is matched to its k-th copy in b, and matched pairs end up next to each other
+    order = np.lexsort((ranks, codes.imag, codes.real))
+    same = (codes[order][1:] == codes[order][:-1]) & (ranks[order][1:] == ranks[order][:-1])
+
+    matched = np.zeros(len(codes), dtype=bool)
+    matched[order[:-1][same]] = True
+    matched[order[1:][same]] = True
+
+    return matched[:len(points_a)], matched[len(points_a):]
+
+
+@dataclass
+class SpanningTree:
+    """
+    The Euclidean minimum spanning tree of a set of points, which can be updated when points are added or removed
+    without being rebuilt from scratch
+    """
+
+    points: np.ndarray  # (n, 2) float array
+    edges: np.ndarray  # (n - 1, 2) endpoints of each edge, as indices into points
+    weights: np.ndarray  # the length of each edge
+    # (m, 2) edges that include every edge of the Delaunay triangulation of the points, or None if they are not known
+    # (after points are added)
+    delaunay: np.ndarray | None = None
+
+    @staticmethod
+    def build(points: np.ndarray) -> "SpanningTree":
+        """
+        :param points: An (n, 2) float array of points
+        :return: The minimum spanning tree of the points, found from scratch (see mst.minimum_spanning_tree)
+        """
+
+        if len(points) < 2:
+            return SpanningTree(points, np.zeros((0, 2), dtype=np.intp), np.zeros(0), np.zeros((0, 2), dtype=np.intp))
+
+        edges_a, edges_b = mst.candidate_edges(points)
+        weights = np.hypot(*(points[edges_a] - points[edges_b]).T)
+        tree_edges = mst.kruskal(len(points), edges_a, edges_b, weights)
+
+        return SpanningTree(
+            points, np.column_stack((edges_a[tree_edges], edges_b[tree_edges])), weights[tree_edges],
+            np.column_stack((edges_a, edges_b))
+        )
+
+    @property
+    def weight(self) -> float:
+        return float(self.weights.sum())
+
+    def density(self) -> float:
+        """
+        :return: The density score of the points (see density.density)
+        """
+
+        return density.score(len(self.points), self.weight)
+
+    def remove(self, keep: np.ndarray) -> "SpanningTree":
+        """
+        Removes points from the tree. Every edge of the old tree between two kept points is in the new tree, so only the
+        pieces the tree falls apart into have to be reconnected, with the Delaunay edges between different pieces.
+        Removing a point only adds Delaunay edges between the point's Delaunay neighbors, so when few points are
+        removed, the triangulation is not computed again.
+
+        :param keep: A boolean array of which points to keep
+        :return: The minimum spanning tree of the kept points
+        """
+
+        points = self.points[keep]
+        new_index = np.cumsum(keep) - 1
+
+        kept_edges = keep[self.edges].all(axis=1)
+        edges = new_index[self.edges[kept_edges]]
+        weights = self.weights[kept_edges]
+
+        delaunay = None
+        if self.delaunay is not None:
+            kept_delaunay = keep[self.delaunay]
+            hole = np.unique(self.delaunay[kept_delaunay.any(axis=1) & ~kept_delaunay.all(axis=1)])
+            hole = new_index[hole[keep[hole]]]
+
+            if len(hole) <= MAX_HOLE_VERTICES:
+                hole_a, hole_b = np.triu_indices(len(hole), 1)
+                delaunay = np.concatenate((
+                    new_index[self.delaunay[kept_delaunay.all(axis=1)]],
+                    np.column_stack((hole[hole_a], hole[hole_b]))
+                ))
+
+        if len(edges) >= len(points) - 1:
+            return SpanningTree(points, edges, weights, delaunay)
+
+        if delaunay is None:
+            delaunay = np.column_stack(mst.candidate_edges(points))
+
+        pieces = np.unique(
+            union_find.connected_components(len(points), edges[:, 0], edges[:, 1]), return_inverse=True
+        )[1]
+
+        edges_a, edges_b = delaunay[:, 0], delaunay[:, 1]
+        crossing = pieces[edges_a] != pieces[edges_b]
+        edges_a, edges_b = edges_a[crossing], edges_b[crossing]
+        crossing_weights = np.hypot(*(points[edges_a] - points[edges_b]).T)
+
+        joins = mst.kruskal(pieces.max() + 1, pieces[edges_a], pieces[edges_b], crossing_weights)
+
+        return SpanningTree(
+            points,
+            np.concatenate((edges, np.column_stack((edges_a[joins], edges_b[joins])))),
+            np.concatenate((weights, crossing_weights[joins])),
+            delaunay
+        )
+
+    def add(self, new_points: np.ndarray) -> "SpanningTree":
+        """
+        Adds points to the tree. The new tree only uses edges of the old tree and edges from a new point to its nearest
+        neighbor in each of YAO_CONES directions, so Kruskal's algorithm runs over about n + 6k edges instead of the
+        Delaunay triangulation of every point.
+
+        :param new_points: An (k, 2) float array of the points to add
+        :return: The minimum spanning tree of the old and new points
+        """
+
+        if len(new_points) == 0:
+            return self
+
+        points = np.concatenate((self.points, new_points))
+        if len(points) < 2:
+            return SpanningTree(points, np.zeros((0, 2), dtype=np.intp), np.zeros(0))
+
+        yao_a, yao_b = yao_edges(points, np.arange(len(self.points), len(points)))
+
+        edges_a = np.concatenate((self.edges[:, 0], yao_a))
+        edges_b = np.concatenate((self.edges[:, 1], yao_b))
+        weights = np.concatenate((self.weights, np.hypot(*(points[yao_a] - points[yao_b]).T)))
+
+        tree_edges = mst.kruskal(len(points), edges_a, edges_b, weights)
+
+        return SpanningTree(points, np.column_stack((edges_a[tree_edges], edges_b[tree_edges])), weights[tree_edges])
+
+
+def yao_edges(points: np.ndarray, sources: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Connects each source point to the nearest other point in each of YAO_CONES equal angular cones around it, and to
+    every point that coincides with it. Any edge of the minimum spanning tree that touches a source point is one of
+    these edges, since a nearer point in the same cone (less than 60 degrees wide) would make it the longest edge of a
+    triangle.
+
+    :param points: An (n, 2) float array of points
+    :param sources: The indices of the points to connect
+    :return: [the source endpoint of each edge, the other endpoint of each edge], as indices into points
+    """
+
+    edges_a, edges_b = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+    chunk_size = max(1, YAO_CHUNK_ELEMENTS // len(points))
+
+    for start in range(0, len(sources), chunk_size):
+        chunk = sources[start:start + chunk_size]
+        rows = np.arange(len(chunk))
+
+        offsets = points[None, :, :] - points[chunk, None, :]
+        distances = np.hypot(offsets[..., 0], offsets[..., 1])
+        distances[rows, chunk] = np.inf  # a point is not its own neighbor
+
+        # a point that coincides with the source has no direction, so it would hide the source's real nearest neighbor
+        # in cone 0. Such points are joined to the source directly instead of competing in a cone
+        same_rows, same_points = np.nonzero(distances == 0)
+        edges_a.append(chunk[same_rows])
+        edges_b.append(same_points)
+        distances[same_rows, same_points] = np.inf
+
+        cones = (np.floor(np.arctan2(offsets[..., 1], offsets[..., 0]) / (2 * math.pi / YAO_CONES)) % YAO_CONES)
+
+        for cone in range(YAO_CONES):
+            in_cone = np.where(cones == cone, distances, np.inf)
+            nearest = in_cone.argmin(axis=1)
+            found = np.isfinite(in_cone[rows, nearest])
+
+            edges_a.append(chunk[found])
+            edges_b.append(nearest[found])
+
+    return np.concatenate(edges_a), np.concatenate(edges_b)
+
+
+class DensityService:
+    """
+    Finds cluster densities, caching the minimum spanning tree of each cluster by its point set. A cluster that is
+    not cached is derived from the cached cluster it shares the most points with (by removing and adding points), so
+    re-clustering or editing a few particles only updates the affected trees. Noise is not a cluster and has no
+    density.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        :param max_entries: The number of trees to keep. The least recently used trees are dropped first
+        """
+
+        self.max_entries = max_entries
+        self.trees: OrderedDict[bytes, SpanningTree] = OrderedDict()
+
+        # the points of the last call (as sorted x + iy codes, see point_codes) and the cluster each one was in, as an
+        # index into owner_keys. Arrays instead of a dict, so no Python object is made per point
+        self.owner_points = np.zeros(0, dtype=np.complex128)
+        self.owner_index = np.zeros(0, dtype=np.intp)
+        self.owner_keys: list[bytes] = []
+
+    def _get(self, key: bytes | None) -> SpanningTree | None:
+        tree = self.trees.get(key) if key is not None else None
+
+        if tree is not None:
+            self.trees.move_to_end(key)
+
+        return tree
+
+    def _put(self, key: bytes, tree: SpanningTree) -> None:
+        self.trees[key] = tree
+        self.trees.move_to_end(key)
+
+        while len(self.trees) > self.max_entries:
+            self.trees.popitem(last=False)
+
+    def tree(self, points: list[tuple[Number, Number]] | np.ndarray, base: bytes | None = None) -> SpanningTree:
+        """
+        :param points: The points (list of tuples or an (n, 2) array)
+        :param base: The key (see point_set_key) of a cached point set to derive the tree from, if it is not cached
+        :return: The minimum spanning tree of the points
+        """
+
+        points = as_points(points)
+        key = point_set_key(points)
+
+        tree = self._get(key)
+        if tree is not None:
+            profiling.count("density_cache_hits")
+            return tree
+
+        base_tree = self._get(base)
+        keep, added = None, None
+
+        # at least the difference in size has to be added, so skip comparing the point sets if that is too many
+        if base_tree is not None and (len(points) - len(base_tree.points)) * len(points) <= MAX_ADDED_PAIRS:
+            keep, shared = match_points(base_tree.points, points)
+            added = points[~shared]
+
+        if (keep is not None and np.count_nonzero(keep) >= MIN_SHARED_FRACTION * len(points)
+                and len(added) * len(points) <= MAX_ADDED_PAIRS):
+            profiling.count("density_trees_derived")
+            tree = (base_tree if keep.all() else base_tree.remove(keep)).add(added)
+        else:
+            profiling.count("density_trees_built")
+            tree = SpanningTree.build(points)
+
+        self._put(key, tree)
+        return tree
+
+    def density(self, points: list[tuple[Number, Number]] | np.ndarray, base: bytes | None = None) -> float:
+        """
+        :param points: The points (list of tuples or an (n, 2) array)
+        :param base: See tree
+        :return: The density score of the points (see density.density)
+        """
+
+        return self.tree(points, base).density()
+
+    def densities(self, clusters: dict) -> dict[int, float]:
+        """
+        Finds the density of every cluster. Each cluster that changed since the last call is derived from the cluster
+        most of its points were in then
+
+        :param clusters: The clusters of particles (see clustering.gold_cluster)
+        :return: The density of each cluster, in the same order. Noise (NOISE_LABEL) is NaN
+        """
+
+        densities = {}
+        keys, codes, indices = [], [np.zeros(0, dtype=np.complex128)], [np.zeros(0, dtype=np.intp)]
+
+        for label, cluster_points in clusters.items():
+            if label == NOISE_LABEL:
+                densities[label] = float("nan")
+                continue
+
+            points = as_points(cluster_points)
+            cluster_codes = point_codes(points)
+
+            densities[label] = self.density(points, self.previous_owner(cluster_codes))
+
+            codes.append(cluster_codes)
+            indices.append(np.full(len(points), len(keys), dtype=np.intp))
+            keys.append(point_set_key(points))
+
+        codes = np.concatenate(codes)
+        order = np.argsort(codes, kind="stable")
+
+        self.owner_points = codes[order]
+        self.owner_index = np.concatenate(indices)[order]
+        self.owner_keys = keys
+
+        return densities
+
+    def previous_owner(self, codes: np.ndarray) -> bytes | None:
+        """
+        :param codes: The codes of a cluster's points (see point_codes)
+        :return: The key of the cluster that most of the points were in during the last call of densities, or None if
+                 none of them were in a cluster
+        """
+
+        if len(self.owner_points) == 0:
+            return None
+
+        found = np.searchsorted(self.owner_points, codes).clip(max=len(self.owner_points) - 1)
+        matched = self.owner_points[found] == codes
+
+        if not matched.any():
+            return None
+
+        return self.owner_keys[int(np.bincount(self.owner_index[found[matched]]).argmax())]
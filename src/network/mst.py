@@ -0,0 +1,104 @@
+from numbers import Number
+
+from scipy.spatial import Delaunay, QhullError
+
+import numpy as np
+
+from src.helper import profiling, union_find
+
+
+def candidate_edges(points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds a set of edges that is guaranteed to contain a Euclidean minimum spanning tree of the points: the edges of
+    the Delaunay triangulation. There are O(n) of them instead of the n(n-1)/2 edges of the complete graph.
+
+    :param points: An (n, 2) array of points, n >= 2
+    :return: [the first endpoint of each edge, the second endpoint of each edge], as indices into points
+    """
+
+    if len(points) <= 3:
+        # Too few points to triangulate when they are collinear or coincide, and there are at most 3 pairs anyway
+        edges_a, edges_b = np.triu_indices(len(points), 1)
+        return edges_a, edges_b
+
+    centered = points - points.mean(axis=0)
+    if np.linalg.matrix_rank(centered) <= 1:
+        # All points are on one line (duplicates included), so the tree is the chain of the points in order along it.
+        # Qhull can't triangulate them
+        order = np.argsort(centered @ np.linalg.svd(centered)[2][0], kind="stable")
+        return order[:-1], order[1:]
+
+    try:
+        triangulation = Delaunay(points)
+    except QhullError:
+        # Nearly degenerate input. Joggling it gives a valid triangulation whose edges still connect each point to its
+        # neighbors
+        triangulation = Delaunay(points, qhull_options="QJ")
+
+    simplices = triangulation.simplices
+    edges = np.concatenate((simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]))
+
+    # Duplicate points aren't part of the triangulation. Connect each one to the vertex it coincides with.
+    if len(triangulation.coplanar) > 0:
+        edges = np.concatenate((edges, triangulation.coplanar[:, [0, 2]]))
+
+    edges = np.unique(np.sort(edges, axis=1), axis=0)
+    return edges[:, 0], edges[:, 1]
+
+
+def kruskal(num_nodes: int, edges_a: np.ndarray, edges_b: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Kruskal's algorithm: picks edges from shortest to longest, skipping those that would close a cycle
+
+    :param num_nodes: The number of nodes. Nodes are the integers [0, num_nodes)
+    :param edges_a: The first endpoint of each candidate edge
+    :param edges_b: The second endpoint of each candidate edge
+    :param weights: The length of each candidate edge
+    :return: The indices of the candidate edges in the minimum spanning forest
+    """
+
+    order = np.argsort(weights, kind="stable")
+    forest = union_find.UnionFind(num_nodes)
+
+    tree_edges = []
+    for edge, node_a, node_b in zip(order.tolist(), edges_a[order].tolist(), edges_b[order].tolist()):
+        if forest.union(node_a, node_b):
+            tree_edges.append(edge)
+
+            if len(tree_edges) == num_nodes - 1:
+                break
+
+    profiling.count("mst_candidate_edges", len(order))
+    profiling.count("mst_edges", len(tree_edges))
+
+    return np.array(tree_edges, dtype=np.intp)
+
+
+def minimum_spanning_tree(points: list[tuple[Number, Number]] | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the Euclidean minimum spanning tree of a set of points with Kruskal's algorithm over the Delaunay edges
+
+    :param points: The points (list of tuples or an (n, 2) array)
+    :return: [an (n - 1, 2) array of the endpoints of each MST edge as indices into points, the length of each edge]
+    """
+
+    points = np.asarray(points, dtype=float)
+
+    if len(points) < 2:
+        return np.zeros((0, 2), dtype=np.intp), np.zeros(0)
+
+    edges_a, edges_b = candidate_edges(points)
+    weights = np.hypot(*(points[edges_a] - points[edges_b]).T)
+
+    tree_edges = kruskal(len(points), edges_a, edges_b, weights)
+
+    return np.column_stack((edges_a[tree_edges], edges_b[tree_edges])), weights[tree_edges]
+
+
+def mst_weight(points: list[tuple[Number, Number]] | np.ndarray) -> float:
+    """
+    :param points: The points (list of tuples or an (n, 2) array)
+    :return: The total length of the Euclidean minimum spanning tree of the points
+    """
+
+    return float(minimum_spanning_tree(points)[1].sum())
@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from src import batch
+from src.gold_finder import gold_finder as gf, parallel, tiling
+from src.clustering import clustering
+from src.helper import catalog, particles, preprocessing, shared
+from src.helper.output import render, writer
+
+DEFAULT_IO_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 2  # the number of loaded (or analyzed) bundles that can wait for the next stage
+FIGURE_DIR_NAME = "figures"
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden pipeline",
+        description="Find gold particles and their density in every image bundle of a dataset directory, loading, "
+                    "analyzing and writing different bundles at the same time"
+    )
+
+    parser.add_argument(
+        "outdir",
+        type=str,
+        help="The dataset directory to write the results to, partitioned by bundle (e.g., 'bundle=S1/part-0.csv')"
+    )
+
+    parser.add_argument(
+        "--data",
+        type=str,
+        default="./data/analyzed synapses/",
+        help="The directory that contains one subdirectory per image bundle. Default: './data/analyzed synapses/'"
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes that analyze bundles. Default: the number of CPUs"
+    )
+
+    parser.add_argument(
+        "--workers-per-image",
+        type=int,
+        default=1,
+        help="The number of worker processes that find the gold particles of each image, in row bands (or tiles) of "
+             "it. More than 1 speeds up images that are large compared to the number of bundles. Default: 1"
+    )
+
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=DEFAULT_IO_WORKERS,
+        help=f"The number of threads that load images and write results. Default: {DEFAULT_IO_WORKERS}"
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"The number of bundles that can wait between two stages. Loading pauses when the analysis falls behind, "
+             f"which bounds memory use. Default: {DEFAULT_QUEUE_SIZE}"
+    )
+
+    parser.add_argument(
+        "-m", "--mask",
+        action="store_true",
+        help="Whether to apply the mask to each image before finding gold particles. Default: False"
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=list(writer.FORMATS),
+        default="csv",
+        help="The file format of the results. 'parquet' and 'arrow' need pyarrow. Default: 'csv'"
+    )
+
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Find gold particles in tiles of this many pixels to bound memory use on very large images"
+    )
+
+    parser.add_argument(
+        "--figures",
+        action="store_true",
+        help=f"Also save each image with its particles marked on it to '{FIGURE_DIR_NAME}/<bundle>.png' in outdir"
+    )
+
+    return parser.parse_args()
+
+
+def load(bundle: catalog.BundleEntry, use_mask: bool) -> dict:
+    """
+    Reads a bundle's image (and mask) and preprocesses it into shared memory. This runs in a thread, so it overlaps with
+    the analysis of other bundles, and the analysis process opens the image without it being pickled and copied
+
+    :param bundle: The catalog entry of the bundle. Its image and mask are unloaded afterward (see
+                   BundleEntry.unload)
+    :param use_mask: Whether to apply the mask
+    :return: The shared preprocessed image and the shared region the mask kept (or None), which the caller unlinks
+             (see release), the image's mean luminosity and the seconds it took
+    """
+
+    start = time.perf_counter()
+
+    try:
+        mask = bundle.mask if use_mask else None
+        image = shared.SharedArray.create(bundle.image.shape, np.uint8)
+
+        try:
+            preprocessed = preprocessing.preprocess(bundle.image, mask, out=image.open(writable=True))
+            region = shared.SharedRegion.from_region(preprocessed.region) if preprocessed.region is not None else None
+        except BaseException:
+            image.unlink()
+            raise
+    finally:
+        # the preprocessed copy in shared memory is all the later stages need, and the caller keeps the entry until the
+        # run ends, so the decoded image and mask are dropped to keep memory bounded by the queues
+        bundle.unload()
+
+    return {
+        "image": image,
+        "luminosity": preprocessed.stats.mean,
+        "region": region,
+        "timings": {"load": time.perf_counter() - start}
+    }
+
+
+def detect(image: shared.SharedArray, luminosity: float, region: shared.SharedRegion | None, tile_size: int | None,
+           executor: ProcessPoolExecutor, num_tasks: int) -> dict:
+    """
+    Finds the gold particles of a preprocessed image with its row bands (or tiles) spread over the worker processes
+    (see parallel.find_particles). This runs in a thread, which waits for the workers
+
+    :param image: The shared preprocessed image
+    :param luminosity: The mean luminosity of the image
+    :param region: The pixels to scan, or None to scan the whole image
+    :param tile_size: The tile size for GoldFinder, or None to split the image into num_tasks bands of rows
+    :param executor: The worker processes
+    :param num_tasks: The number of tasks to split the image into
+    :return: The gold particles and the seconds it took
+    """
+
+    start = time.perf_counter()
+    finder = gf.GoldFinder(
+        image.open(), img_luminosity=luminosity, tile_size=tile_size,
+        region=region.open() if region is not None else None
+    )
+    gold_particles = particles.ParticleTable.from_particles(
+        parallel.find_particles(finder, executor, num_tasks, image, region)
+    )
+
+    return {"table": gold_particles, "timings": {"detect": time.perf_counter() - start}}
+
+
+def analyze(image: shared.SharedArray, luminosity: float, region: shared.SharedRegion | None, tile_size: int | None,
+            gold_particles: particles.ParticleTable | None = None) -> dict:
+    """
+    Runs detection, clustering and density on a preprocessed image. This runs in a worker process
+
+    :param image: The shared preprocessed image
+    :param luminosity: The mean luminosity of the image
+    :param region: The pixels to scan, or None to scan the whole image
+    :param tile_size: The tile size for GoldFinder, or None to process the whole image at once
+    :param gold_particles: The gold particles, if they were already found (see detect). If None, they are found here
+    :return: The output columns (see writer.particle_columns), the number of particles, the clusters and the seconds
+             spent in each stage
+    """
+
+    timings = {}
+    image_data = image.open()
+
+    if gold_particles is None:
+        start = time.perf_counter()
+        gold_particles = gf.GoldFinder(
+            image_data, img_luminosity=luminosity, tile_size=tile_size,
+            region=region.open() if region is not None else None
+        ).find_table()
+        timings["detect"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    clusters = clustering.cluster_table(gold_particles, tiling.image_size(image_data))
+    timings["cluster"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = writer.particle_columns(clusters)
+    timings["density"] = time.perf_counter() - start
+
+    return {"columns": columns, "particles": len(gold_particles), "clusters": clusters, "timings": timings}
+
+
+def write(dataset: writer.DatasetWriter, item: dict, figure_dir: pathlib.Path | None) -> dict:
+    """
+    Writes a bundle's results to its partition of the dataset (and its figure). This runs in a thread
+
+    :param dataset: The dataset to write to
+    :param item: The loaded and analyzed bundle
+    :param figure_dir: The directory to save the figure to, or None to not draw one
+    :return: The seconds it took
+    """
+
+    start = time.perf_counter()
+    dataset.write(item["name"], item["columns"])
+
+    if figure_dir is not None:
+        render.render(item["image"].open(), item["clusters"]).save(figure_dir / f"{item['name']}.png")
+
+    return {"timings": {"write": time.perf_counter() - start}}
+
+
+async def run_stage(inbox: asyncio.Queue, outbox: asyncio.Queue, work: Callable[[dict], Awaitable[dict]],
+                    last: bool = False) -> None:
+    """
+    One worker of a pipeline stage: takes items from the inbox until it gets None, awaits work(item) and puts the item,
+    updated with the result, in the outbox. A failed item is reported and dropped. This is the only place items are
+    released: when they fail (or are cancelled), and after the last stage that uses their image
+
+    :param inbox: The queue to take items from
+    :param outbox: The queue to put items in
+    :param work: Runs the stage on an item, e.g. on an executor. Returns the keys to update the item with
+    :param last: Whether this is the last stage that uses the items' images
+    """
+
+    while (item := await inbox.get()) is not None:
+        update = None
+
+        try:
+            update = await work(item)
+        except Exception as e:
+            print(f"{item['name']}: failed ({e})")
+        finally:
+            if update is None or last:
+                release(item)
+
+        if update is None:
+            continue
+
+        item["timings"].update(update.pop("timings"))
+        item.update(update)
+
+        await outbox.put(item)  # waits while the next stage is full, which slows this stage down to its pace
+
+
+def release(item: dict) -> None:
+    """
+    Frees the shared memory of an item's image (and region) once no stage needs it
+    """
+
+    for key in ("image", "region"):
+        if isinstance(item.get(key), (shared.SharedArray, shared.SharedRegion)):
+            item[key].unlink()
+
+
+async def run_workers(workers: list[Awaitable[None]], outbox: asyncio.Queue, num_next: int) -> None:
+    """
+    Waits for the workers of a stage, then tells each of the num_next workers of the next stage to stop
+    """
+
+    await asyncio.gather(*workers)
+
+    for _ in range(num_next):
+        await outbox.put(None)
+
+
+async def feed(bundles: list[catalog.BundleEntry], outbox: asyncio.Queue) -> None:
+    for bundle in bundles:
+        await outbox.put({"name": bundle.name, "bundle": bundle, "timings": {}})
+
+
+async def run_pipeline(bundles: list[catalog.BundleEntry], dataset: writer.DatasetWriter, use_mask: bool = False,
+                       tile_size: int | None = None, workers: int | None = None,
+                       io_workers: int = DEFAULT_IO_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                       figure_dir: pathlib.Path | None = None, workers_per_image: int = 1) -> list[dict]:
+    """
+    Loads, analyzes and writes bundles in three stages that run at the same time on different bundles: loading in a
+    thread pool, analysis in a process pool and writing in the thread pool. The stages are joined by bounded queues, so
+    a stage that gets ahead waits for the next one, and the throughput is that of the slowest stage instead of the sum
+    of all of them
+
+    :param bundles: The bundles to analyze
+    :param dataset: The dataset to write the results to
+    :param use_mask: Whether to apply each bundle's mask before finding gold particles
+    :param tile_size: The tile size for GoldFinder, or None to process each image at once
+    :param workers: The number of worker processes. If None, the number of CPUs
+    :param io_workers: The number of threads that load and write bundles
+    :param queue_size: The number of bundles that can wait between two stages
+    :param figure_dir: The directory to save a figure of each bundle to, or None to not draw figures
+    :param workers_per_image: The number of worker processes that find the gold particles of each image. If more than
+                              1, each image is split into row bands (or its tiles) that the workers share
+    :return: The summaries of the bundles that were written, in the order they finished (see batch.analyze_bundle)
+    """
+
+    loop = asyncio.get_running_loop()
+    workers = workers or os.cpu_count()
+
+    to_load, to_analyze, to_write = (asyncio.Queue(maxsize=queue_size) for _ in range(3))
+    written = asyncio.Queue()
+
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool, ProcessPoolExecutor(max_workers=workers) as cpu_pool:
+        def load_work(item: dict) -> Awaitable[dict]:
+            return loop.run_in_executor(io_pool, load, item.pop("bundle"), use_mask)
+
+        async def analyze_work(item: dict) -> dict:
+            image, luminosity, region = item["image"], item.pop("luminosity"), item["region"]
+
+            if workers_per_image <= 1:
+                # the shared image and region are sent to the worker process as the few bytes that describe them
+                return await loop.run_in_executor(cpu_pool, analyze, image, luminosity, region, tile_size)
+
+            # the bands of the image are spread over the worker processes by a thread, then one worker clusters them
+            detected = await loop.run_in_executor(
+                None, detect, image, luminosity, region, tile_size, cpu_pool, workers_per_image
+            )
+            analyzed = await loop.run_in_executor(
+                cpu_pool, analyze, image, luminosity, None, tile_size, detected["table"]
+            )
+            analyzed["timings"].update(detected["timings"])
+
+            return analyzed
+
+        def write_work(item: dict) -> Awaitable[dict]:
+            return loop.run_in_executor(io_pool, write, dataset, item, figure_dir)
+
+        await asyncio.gather(
+            run_workers([feed(bundles, to_load)], to_load, io_workers),
+            run_workers([run_stage(to_load, to_analyze, load_work) for _ in range(io_workers)], to_analyze, workers),
+            run_workers([run_stage(to_analyze, to_write, analyze_work) for _ in range(workers)], to_write, io_workers),
+            run_workers([run_stage(to_write, written, write_work, last=True) for _ in range(io_workers)], written, 0)
+        )
+
+    results = []
+    while not written.empty():
+        item = written.get_nowait()
+        results.append({
+            "name": item["name"],
+            "particles": item["particles"],
+            "clusters": len(item["clusters"].cluster_ranges()),
+            "timings": item["timings"]
+        })
+
+    return results
+
+
+def main():
+    args = get_args()
+
+    dataset = writer.DatasetWriter(args.outdir, args.format)
+
+    figure_dir = None
+    if args.figures:
+        figure_dir = pathlib.Path(args.outdir) / FIGURE_DIR_NAME
+        figure_dir.mkdir(parents=True, exist_ok=True)
+
+    bundle_catalog = catalog.BundleCatalog(args.data)
+    bundles = list(bundle_catalog)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_pipeline(
+        bundles, dataset, args.mask, args.tile_size, args.workers, args.io_workers, args.queue_size, figure_dir,
+        args.workers_per_image
+    ))
+
+    for result in results:
+        print(f"{result['name']}: {result['particles']} particles in {result['clusters']} clusters")
+
+    bundle_catalog.save()  # keep the scale bar positions found while loading the images
+    batch.print_summary(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+import argparse
+import dataclasses
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from src import cli
+from src.clustering import clustering
+from src.gold_finder import tiling
+from src.helper import cache, catalog, preprocessing
+from src.helper.output import writer
+from src.network import incremental
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_MAX_BUNDLES = 4  # bundles whose decoded images are kept in memory
+DEFAULT_MAX_DETECTIONS = 32
+
+ROWS_PER_MESSAGE = 10_000  # particle rows are streamed in messages of at most this many rows
+RETRY_AFTER_SECONDS = 1
+
+
+class LRUCache:
+    """
+    A thread-safe mapping that keeps at most max_entries values, dropping the least recently used first
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: The value of the key, or None if it is not cached
+        """
+
+        with self.lock:
+            value = self.entries.get(key)
+
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            return value
+
+    def put(self, key, value) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+@dataclass(frozen=True)
+class Job:
+    """
+    The parameters of one analysis request. They mirror the options of src.cli
+    """
+
+    name: str
+    mask: bool = False
+    tile_size: int | None = None
+    threshold_method: str = "mean"
+    cluster_method: str = clustering.DEFAULT_METHOD
+    eps_nm: float | None = None
+
+    @staticmethod
+    def from_json(data: dict) -> "Job":
+        """
+        :param data: The request body
+        :return: The job
+        :raises ValueError: If a parameter is missing, unknown or invalid
+        """
+
+        if not isinstance(data, dict) or not isinstance(data.get("name"), str):
+            raise ValueError("The request needs the 'name' of a bundle")
+
+        unknown = set(data) - {field.name for field in dataclasses.fields(Job)}
+        if unknown:
+            raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+
+        job = Job(**data)
+
+        if job.threshold_method not in preprocessing.THRESHOLD_METHODS:
+            raise ValueError(f"Unknown threshold method '{job.threshold_method}'. "
+                             f"Expected one of {list(preprocessing.THRESHOLD_METHODS)}")
+
+        if job.cluster_method not in clustering.METHODS:
+            raise ValueError(f"Unknown clustering method '{job.cluster_method}'. "
+                             f"Expected one of {list(clustering.METHODS)}")
+
+        if job.tile_size is not None and (not isinstance(job.tile_size, int) or job.tile_size <= 0):
+            raise ValueError("'tile_size' must be a positive integer")
+
+        return job
+
+
+class Analyzer:
+    """
+    Runs analysis jobs against one dataset directory, keeping the bundle catalog, decoded images and detected particles
+    in memory between jobs
+    """
+
+    def __init__(self, data_path, max_bundles: int = DEFAULT_MAX_BUNDLES,
+                 max_detections: int = DEFAULT_MAX_DETECTIONS, cache_dir: str | None = cache.DEFAULT_CACHE_DIR):
+        """
+        :param data_path: The directory that contains one subdirectory per image bundle
+        :param max_bundles: The number of bundles whose images are kept in memory
+        :param max_detections: The number of detection results (per bundle and detection parameters) kept in memory
+        :param cache_dir: The on-disk detection cache to fall back to (see helper.cache). If None, it is not used
+        """
+
+        self.catalog = catalog.BundleCatalog(data_path)
+        self.catalog_lock = threading.Lock()
+
+        self.bundles = LRUCache(max_bundles)
+        self.detections = LRUCache(max_detections)
+
+        # one lock per bundle name, held while a bundle is looked up and its particles are detected, so concurrent jobs
+        # on the same bundle don't decode its image (a cached_property, which is not thread-safe) or detect twice
+        self.bundle_locks: dict[str, threading.Lock] = {}
+        self.detection_cache = cache.DetectionCache(cache_dir) if cache_dir is not None else None
+
+        self.density_service = incremental.DensityService()
+        self.density_lock = threading.Lock()
+
+    def names(self) -> list[str]:
+        """
+        :return: The names of every bundle in the dataset directory
+        """
+
+        with self.catalog_lock:
+            return [entry.name for entry in self.catalog]
+
+    def bundle(self, name: str) -> catalog.BundleEntry:
+        """
+        :param name: The name of the bundle
+        :return: The bundle. Its image stays loaded while the bundle is in the cache, and is reloaded if its files change
+        :raises KeyError: If there is no bundle with that name
+        """
+
+        with self.catalog_lock:
+            entry = self.catalog.get(name)
+
+        bundle = self.bundles.get(name)
+
+        if bundle is None or bundle.stamps != entry.stamps:
+            # a copy of the catalog entry, so the catalog does not keep the images of evicted bundles alive
+            bundle = dataclasses.replace(entry)
+            self.bundles.put(name, bundle)
+
+        return bundle
+
+    def bundle_lock(self, name: str) -> threading.Lock:
+        """
+        :param name: The name of the bundle
+        :return: The lock of the bundle (see bundle_locks)
+        """
+
+        with self.catalog_lock:
+            return self.bundle_locks.setdefault(name, threading.Lock())
+
+    def run(self, job: Job, emit: Callable[[dict], None]) -> None:
+        """
+        Runs one job, passing a message to emit after each stage
+
+        :param job: The job
+        :param emit: Called with each message: 'detected', 'clustered', one or more 'rows' (the particle columns, see
+                     writer.particle_columns) and 'done'
+        """
+
+        start = time.perf_counter()
+
+        # jobs on other bundles go ahead, and a job with the same detection parameters waits, then reuses the detection
+        with self.bundle_lock(job.name):
+            bundle = self.bundle(job.name)
+
+            key = (job.name, json.dumps(bundle.stamps, sort_keys=True), job.mask, job.tile_size, job.threshold_method)
+            detection = self.detections.get(key)
+            cached = detection is not None
+
+            if detection is None:
+                detection = cli.detect(bundle, job.mask, job.tile_size, job.threshold_method, self.detection_cache)
+                self.detections.put(key, detection)
+
+                # keep the scale bar position found while loading the image
+                with self.catalog_lock:
+                    if job.name in self.catalog.entries:
+                        self.catalog.entries[job.name].bar_position = bundle.bar_position
+
+                    self.catalog.save()
+
+        image, gold_particles = detection
+        emit({"event": "detected", "particles": len(gold_particles), "cached": cached,
+              "seconds": time.perf_counter() - start})
+
+        # the detection is cached and shared by concurrent jobs, so each job clusters its own copy
+        clusters = clustering.cluster_table(
+            gold_particles.copy(), tiling.image_size(image), method=job.cluster_method, eps_nm=job.eps_nm
+        )
+        emit({"event": "clustered", "clusters": len(clusters.cluster_ranges()),
+              "seconds": time.perf_counter() - start})
+
+        with self.density_lock:
+            columns = writer.particle_columns(clusters, self.density_service)
+
+        num_rows = len(columns["particle_x"])
+        for row in range(0, max(num_rows, 1), ROWS_PER_MESSAGE):
+            emit({
+                "event": "rows",
+                "columns": {name: values[row:row + ROWS_PER_MESSAGE].tolist() for name, values in columns.items()}
+            })
+
+        emit({"event": "done", "seconds": time.perf_counter() - start})
+
+
+class JobQueue:
+    """
+    A thread pool with bounded concurrency and a bounded queue. A job is rejected, instead of queued, when the queue is
+    full, so clients can back off instead of piling up work
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        :param workers: The number of jobs that run at once
+        :param queue_size: The number of jobs that can wait for a worker
+        """
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="golden-job")
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args) -> Future | None:
+        """
+        :return: The future of the job, or None if the queue is full
+        """
+
+        if not self.slots.acquire(blocking=False):
+            return None
+
+        with self.lock:
+            self.pending += 1
+
+        return self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        # the slot is freed before the future's result is set, so a caller that waited for the job can submit again
+        try:
+            return fn(*args)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+            self.slots.release()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], analyzer: Analyzer, jobs: JobQueue):
+        super().__init__(address, RequestHandler)
+
+        self.analyzer = analyzer
+        self.jobs = jobs
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /bundles lists the bundles, GET /status reports the queue and caches, and POST /analyze runs a job (a JSON
+    Job) and streams its messages back as newline-delimited JSON
+    """
+
+    server: AnalysisServer
+
+    def send_json(self, status: HTTPStatus, data: dict, headers: dict | None = None) -> None:
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/bundles":
+            self.send_json(HTTPStatus.OK, {"bundles": self.server.analyzer.names()})
+        elif self.path == "/status":
+            self.send_json(HTTPStatus.OK, {
+                "workers": self.server.jobs.workers,
+                "pending": self.server.jobs.pending,
+                "cached_bundles": len(self.server.analyzer.bundles),
+                "cached_detections": len(self.server.analyzer.detections)
+            })
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if self.path != "/analyze":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        try:
+            job = Job.from_json(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+            self.server.analyzer.bundle(job.name)
+        except (ValueError, TypeError) as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        except KeyError:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Dataset '{job.name}' not found"})
+            return
+
+        messages = queue.Queue()
+        future = self.server.jobs.submit(self.server.analyzer.run, job, messages.put)
+
+        if future is None:
+            self.send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many jobs are queued, try again later"},
+                {"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            return
+
+        future.add_done_callback(lambda _: messages.put(None))
+
+        # HTTP/1.0: the response ends when the connection is closed, so messages are written as they come
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        while (message := messages.get()) is not None:
+            self.write_message(message)
+
+        if future.exception() is not None:
+            self.write_message({"event": "error", "error": repr(future.exception())})
+
+    def write_message(self, message: dict) -> None:
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden server",
+        description="Keep the bundle catalog, images and detected particles in memory and analyze bundles on request"
+    )
+
+    parser.add_argument("--data", type=str, default="./data/analyzed synapses/",
+                        help="The directory that contains one subdirectory per image bundle. "
+                             "Default: './data/analyzed synapses/'")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help=f"Default: {DEFAULT_HOST}")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Default: {DEFAULT_PORT}")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"The number of jobs that run at once. Default: {DEFAULT_WORKERS}")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"The number of jobs that can wait for a worker before new jobs are rejected. "
+                             f"Default: {DEFAULT_QUEUE_SIZE}")
+    parser.add_argument("--max-bundles", type=int, default=DEFAULT_MAX_BUNDLES,
+                        help=f"The number of bundles whose images are kept in memory. Default: {DEFAULT_MAX_BUNDLES}")
+    parser.add_argument("--max-detections", type=int, default=DEFAULT_MAX_DETECTIONS,
+                        help=f"The number of detection results kept in memory. Default: {DEFAULT_MAX_DETECTIONS}")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the on-disk detection cache")
+    parser.add_argument("--cache-dir", type=str, default=cache.DEFAULT_CACHE_DIR,
+                        help=f"The on-disk detection cache directory. Default: '{cache.DEFAULT_CACHE_DIR}'")
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    analyzer = Analyzer(
+        args.data, args.max_bundles, args.max_detections, None if args.no_cache else args.cache_dir
+    )
+    jobs = JobQueue(args.workers, args.queue_size)
+
+    with AnalysisServer((args.host, args.port), analyzer, jobs) as server:
+        print(f"Serving on http://{args.host}:{server.server_address[1]}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            jobs.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import time
+
+from src.evaluation import sweep
+from src.helper import catalog
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="Golden sweep",
+        description="Evaluate every combination of GoldFinder parameters against the ground truth of each image bundle"
+    )
+
+    parser.add_argument("out", type=str, help="The CSV file to write the grid of metrics to")
+
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="The names of the bundles to evaluate. Default: every bundle"
+    )
+
+    parser.add_argument(
+        "--data",
+        type=str,
+        default="./data/analyzed synapses/",
+        help="The directory that contains one subdirectory per image bundle. Default: './data/analyzed synapses/'"
+    )
+
+    parser.add_argument("--mask-thresholds", type=float, nargs="+", default=[0.6, 0.65, 0.7, 0.75, 0.8])
+    parser.add_argument("--circle-thresholds", type=float, nargs="+", default=[0.2, 0.3, 0.4, 0.5, 0.6])
+    parser.add_argument("--min-pixels", type=int, nargs="+", default=[5, 10, 15, 20, 30])
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. Default: the number of CPUs"
+    )
+
+    parser.add_argument(
+        "-m", "--mask",
+        action="store_true",
+        help="Whether to apply the mask to each image before finding gold particles. Default: False"
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    bundle_catalog = catalog.BundleCatalog(args.data)
+    bundles = [bundle_catalog.get(name) for name in args.names] if args.names else list(bundle_catalog)
+
+    start = time.perf_counter()
+
+    grid = sweep.sweep(
+        bundles, args.mask_thresholds, args.circle_thresholds, args.min_pixels, use_mask=args.mask,
+        workers=args.workers
+    )
+    grid.to_csv(args.out, index=False)
+
+    totals = grid[grid["bundle"] == "total"]
+    best = totals.loc[totals["f1"].idxmax()]
+
+    print(f"{len(totals)} combinations on {len(bundles)} bundles in {time.perf_counter() - start:.2f}s")
+    print(f"best F1 {best['f1']:.3f} (precision {best['precision']:.3f}, recall {best['recall']:.3f}) with "
+          f"mask_threshold={best['mask_threshold']}, circle_threshold={best['circle_threshold']}, "
+          f"min_pixels={best['min_pixels']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from src import batch
+
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+
+import pathlib
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class BatchTest(TestCase):
+    def test_run_batch(self):
+        rng = np.random.default_rng(0)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            outdir = pathlib.Path(tmp) / "out"
+            
+            for name in ("A", "B", "C"):
+                write_bundle(data_dir, name, rng)
+            
+            results = batch.run_batch(str(data_dir), str(outdir), workers=2)
+            
+            self.assertEqual(sorted(result["name"] for result in results), ["A", "B", "C"])
+            
+            for result in results:
+                self.assertEqual(set(result["timings"]), set(batch.STAGES))
+                
+                output = pd.read_csv(outdir / f"bundle={result['name']}" / "part-0.csv")
+                self.assertEqual(len(output), result["particles"])
@@ -0,0 +1,138 @@
+from src.helper import cache, catalog, particles, tiff
+
+from unittest import TestCase
+import numpy as np
+
+from unittest import mock
+
+import os
+import pathlib
+import shutil
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class CacheTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_path = pathlib.Path(self.tmp.name)
+        
+        self.input_file = self.tmp_path / "image.tif"
+        self.input_file.write_bytes(b"not really a tiff")
+        
+        self.detection_cache = cache.DetectionCache(self.tmp_path / "cache")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_round_trip(self):
+        key = self.detection_cache.key([self.input_file], {"min_pixels": 15})
+        image = np.arange(100, dtype=np.uint8).reshape(10, 10)
+        
+        self.assertIsNone(self.detection_cache.get(key))
+        
+        table = particles.ParticleTable([(1, 2), (3, 4)], [1.25, 3.5], [2.5, 4.75], [20, 90], [0.5, 0.75])
+        self.detection_cache.put(key, image, table, 123.5)
+        cached = self.detection_cache.get(key)
+        
+        np.testing.assert_array_equal(cached.image, image)
+        self.assertEqual(cached.particles.to_list(), [(1, 2), (3, 4)])
+        
+        for column in ("x", "y", "size", "score", "cluster_id"):
+            np.testing.assert_array_equal(getattr(cached.particles, column), getattr(table, column))
+        
+        self.assertEqual(cached.img_luminosity, 123.5)
+    
+    def test_pixels_only(self):
+        self.detection_cache.put("a", np.zeros((5, 5), dtype=np.uint8), [(1, 2)], 0)
+        
+        self.assertEqual(self.detection_cache.get("a").particles.to_list(), [(1, 2)])
+    
+    def test_key_changes(self):
+        key = self.detection_cache.key([self.input_file], {"min_pixels": 15})
+        
+        self.assertNotEqual(key, self.detection_cache.key([self.input_file], {"min_pixels": 16}))
+        
+        self.input_file.write_bytes(b"a different image")
+        self.assertNotEqual(key, self.detection_cache.key([self.input_file], {"min_pixels": 15}))
+    
+    def test_code_changes(self):
+        source_root = self.tmp_path / "src"
+        for package in cache.DETECTION_PACKAGES:
+            shutil.copytree(cache.SOURCE_ROOT / package, source_root / package)
+        
+        code_version = cache.code_version
+        
+        with mock.patch.object(cache, "code_version", lambda: code_version(source_root)):
+            key = self.detection_cache.key([self.input_file], {"min_pixels": 15})
+            self.detection_cache.put(key, np.zeros((5, 5), dtype=np.uint8), [(1, 2)], 0)
+            
+            # the detection imports preprocessing and union_find, which aren't in gold_finder
+            for module in ("preprocessing.py", "union_find.py"):
+                with open(source_root / "helper" / module, "a") as f:
+                    f.write("\n# changed\n")
+                
+                changed_key = self.detection_cache.key([self.input_file], {"min_pixels": 15})
+                self.assertNotEqual(key, changed_key)
+                self.assertIsNone(self.detection_cache.get(changed_key))
+                
+                key = changed_key
+    
+    def test_lru_eviction(self):
+        image = np.zeros((100, 100), dtype=np.uint8)
+        
+        self.detection_cache.put("a", image, [], 0)
+        self.detection_cache.put("b", image, [], 0)
+        
+        # make "a" the most recently used entry
+        for path in self.detection_cache.paths("b"):
+            os.utime(path, (0, 0))
+        self.detection_cache.get("a")
+        
+        self.detection_cache.max_bytes = 25_000
+        self.detection_cache.put("c", image, [], 0)
+        
+        self.assertIsNotNone(self.detection_cache.get("a"))
+        self.assertIsNone(self.detection_cache.get("b"))
+        self.assertIsNotNone(self.detection_cache.get("c"))
+    
+    def test_pyramids_are_evicted(self):
+        image = np.zeros((100, 100), dtype=np.uint8)
+        
+        stale = self.detection_cache.pyramid_directory / "stale"
+        tiff.Pyramid.cached(np.zeros((400, 400), dtype=np.uint8), stale, min_size=100)
+        for path in [*stale.iterdir(), stale]:
+            os.utime(path, (0, 0))
+        
+        self.detection_cache.max_bytes = 25_000
+        self.detection_cache.put("a", image, [], 0)
+        self.detection_cache.put("b", image, [], 0)
+        
+        # the pyramid is the least recently used entry, so it goes before "a"
+        self.assertFalse(stale.exists())
+        self.assertIsNotNone(self.detection_cache.get("a"))
+        self.assertIsNotNone(self.detection_cache.get("b"))
+    
+    def test_pyramids_are_evicted_on_cache_hits(self):
+        data_dir = self.tmp_path / "data"
+        image_path = write_bundle(data_dir, "A", np.random.default_rng(0), size=600) / "A.tif"
+        
+        self.detection_cache.put("a", np.zeros((100, 100), dtype=np.uint8), [], 0)
+        self.detection_cache.max_bytes = 150_000  # room for the detection and one pyramid
+        
+        for version in range(4):
+            # each edit of the image makes a new pyramid, while its detection stays a cache hit (no put)
+            image_path.write_bytes(image_path.read_bytes() + bytes(version + 1))
+            bundle = catalog.BundleCatalog(data_dir).get("A")
+            
+            self.assertIsNotNone(self.detection_cache.get("a"))
+            self.detection_cache.pyramid(bundle)
+            
+            self.assertEqual(len(list(self.detection_cache.pyramid_directory.iterdir())), 1)
+    
+    def test_clear(self):
+        self.detection_cache.put("a", np.zeros((5, 5), dtype=np.uint8), [], 0)
+        self.detection_cache.clear()
+        
+        self.assertIsNone(self.detection_cache.get("a"))
@@ -0,0 +1,60 @@
+from src.helper import catalog, data_loading as dl
+
+from unittest import TestCase
+import numpy as np
+
+import pathlib
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class CatalogTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_path = pathlib.Path(self.tmp.name)
+        
+        rng = np.random.default_rng(0)
+        for name in ("S1", "S2", "S3"):
+            write_bundle(self.base_path, name, rng)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_get_indexes_one_bundle(self):
+        bundle_catalog = catalog.BundleCatalog(self.base_path)
+        entry = bundle_catalog.get("S2")
+        
+        self.assertEqual(list(bundle_catalog.entries), ["S2"])
+        self.assertIsNone(entry.bar_position)
+        self.assertNotIn("image", vars(entry))  # nothing is decoded until it's accessed
+        
+        with self.assertRaises(KeyError):
+            bundle_catalog.get("S4")
+    
+    def test_matches_load_bundle(self):
+        entry = catalog.BundleCatalog(self.base_path).get("S1")
+        bundle = dl.load_bundle(self.base_path / "S1")
+        
+        np.testing.assert_array_equal(np.asarray(entry.image), np.asarray(bundle.image))
+        np.testing.assert_array_equal(np.asarray(entry.mask), np.asarray(bundle.mask))
+        self.assertTrue(entry.ground_truth_6nm.equals(bundle.ground_truth_6nm))
+        self.assertTrue(entry.ground_truth_12nm.equals(bundle.ground_truth_12nm))
+    
+    def test_index_is_persisted(self):
+        bundle_catalog = catalog.BundleCatalog(self.base_path)
+        _ = bundle_catalog.get("S1").image
+        bundle_catalog.save()
+        
+        entry = catalog.BundleCatalog(self.base_path).entries["S1"]
+        
+        self.assertEqual(entry.bar_position, dl.BarPosition.BOTTOM)
+        self.assertFalse(entry.is_stale())
+    
+    def test_refresh(self):
+        bundle_catalog = catalog.BundleCatalog(self.base_path)
+        self.assertEqual(sorted(entry.name for entry in bundle_catalog), ["S1", "S2", "S3"])
+        
+        (self.base_path / "S1" / "S1 mask.tif").unlink()
+        self.assertTrue(bundle_catalog.entries["S1"].is_stale())
+        self.assertIsNone(bundle_catalog.get("S1").mask)
@@ -0,0 +1,46 @@
+from src.clustering import clustering
+from src.helper import units as uc
+
+from unittest import TestCase
+from sklearn.cluster import DBSCAN
+import numpy as np
+
+
+class ClusteringTest(TestCase):
+    def test_grid_matches_dbscan(self):
+        rng = np.random.default_rng(0)
+        
+        for eps in (5, 20, 60):
+            centers = rng.uniform(0, 1000, (10, 2))
+            points = np.concatenate([rng.normal(center, 25, (30, 2)) for center in centers]).round()
+            
+            expected = DBSCAN(eps=eps, min_samples=3).fit_predict(points)
+            np.testing.assert_array_equal(clustering.grid_dbscan(points, eps, 3), expected)
+    
+    def test_methods_group_every_point(self):
+        rng = np.random.default_rng(1)
+        points = [tuple(point) for point in rng.integers(0, 500, (200, 2)).tolist()]
+        
+        for method in clustering.METHODS:
+            clusters = clustering.gold_cluster(points, (500, 500), method=method)
+            
+            self.assertEqual(sorted(point for cluster in clusters.values() for point in cluster), sorted(points))
+    
+    def test_group_by_label(self):
+        points = np.array([[0, 0], [1, 1], [2, 2], [3, 3]])
+        labels = np.array([1, -1, 1, 0])
+        
+        self.assertEqual(
+            clustering.group_by_label(points, labels),
+            {-1: [(1, 1)], 0: [(3, 3)], 1: [(0, 0), (2, 2)]}
+        )
+    
+    def test_eps_nm(self):
+        # particles 20nm apart are one cluster with a 30nm radius and all noise with a 10nm radius
+        points = [uc.nanometers_to_pixels(20 * i, 0) for i in range(5)]
+        
+        self.assertEqual(list(clustering.gold_cluster(points, (1000, 1000), eps_nm=30)), [0])
+        self.assertEqual(list(clustering.gold_cluster(points, (1000, 1000), eps_nm=10)), [-1])
+    
+    def test_no_particles(self):
+        self.assertEqual(clustering.gold_cluster([], (100, 100)), {})
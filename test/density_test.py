@@ -15,6 +15,45 @@ class DensityTest(TestCase):
         print(f"\n{dense_score=:.2f}, {sparse_score=:.2f}")
         
         self.assertGreater(dense_score, sparse_score)
+    
+    def test_backends_agree(self):
+        for num in (2, 3, 10, 200):
+            points = gen_points(5, num)
+            
+            self.assertAlmostEqual(
+                density.density(points, backend="delaunay"),
+                density.density(points, backend="networkx"),
+                places=9
+            )
+    
+    def test_degenerate_points(self):
+        collinear = [(x, 2 * x + 1) for x in np.random.uniform(0, 10, 50)]
+        grid = [(x, y) for x in range(8) for y in range(8)]  # lots of equal-length edges
+        
+        for points in (collinear, grid):
+            self.assertAlmostEqual(
+                density.density(points, backend="delaunay"),
+                density.density(points, backend="networkx"),
+                places=9
+            )
+    
+    def test_three_degenerate_points(self):
+        # DBSCAN finds clusters of 3 pixels, which qhull can't triangulate if they are on a line or coincide
+        collinear = [(0, 0), (1, 1), (2, 2)]
+        duplicates = [(0, 0), (0, 0), (1, 1), (2, 2)]
+        
+        for points in (collinear, duplicates):
+            self.assertAlmostEqual(
+                density.density(points, backend="delaunay"),
+                density.density(points, backend="networkx"),
+                places=9
+            )
+        
+        self.assertEqual(density.density([(1, 1), (1, 1), (1, 1)]), float("inf"))
+    
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            density.density(gen_points(1, 10), backend="nope")
         
 
 def gen_points(std_dev, num):
@@ -0,0 +1,60 @@
+from src.evaluation import evaluation
+from src.helper import catalog, units as uc
+
+from unittest import TestCase
+import numpy as np
+
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class EvaluationTest(TestCase):
+    def test_match_is_one_to_one(self):
+        detections = np.array([[0.0, 0.0], [0.5, 0.0], [10.0, 10.0]])
+        truth = np.array([[0.4, 0.0], [50.0, 50.0]])
+        
+        matched_detections, matched_truth = evaluation.match(detections, truth, 1.0)
+        
+        # both of the first two detections are in range of the first truth, but only the closest one matches
+        self.assertEqual(matched_detections.tolist(), [1])
+        self.assertEqual(matched_truth.tolist(), [0])
+    
+    def test_evaluate(self):
+        truth = {
+            "12nm": np.array([uc.pixels_to_microns(100, 100)]),
+            "6nm": np.array([uc.pixels_to_microns(200, 200), uc.pixels_to_microns(300, 300)])
+        }
+        
+        mask = np.full((400, 400), 255, dtype=np.uint8)
+        mask[:, :200] = 0
+        
+        # one hit per class, one miss inside the mask and one outside of it
+        detections = [(101, 100), (200, 201), (50, 50), (350, 50)]
+        
+        result = evaluation.evaluate("test", detections, truth, mask, np.array(["12nm", "6nm", "6nm", "12nm"]))
+        
+        self.assertEqual(result.classes["12nm"].true_positive, 1)
+        self.assertEqual(result.classes["12nm"].false_negative, 0)
+        self.assertEqual(result.classes["12nm"].false_positive, 0)
+        self.assertEqual(result.classes["6nm"].true_positive, 1)
+        self.assertEqual(result.classes["6nm"].false_negative, 1)
+        self.assertEqual(result.classes["6nm"].false_positive, 1)
+        
+        self.assertEqual(result.overall.false_positive, 1)
+        self.assertAlmostEqual(result.overall.precision, 2 / 3)
+        self.assertAlmostEqual(result.overall.recall, 2 / 3)
+    
+    def test_evaluate_bundles(self):
+        rng = np.random.default_rng(0)
+        
+        with tempfile.TemporaryDirectory() as data_dir:
+            for name in ("A", "B"):
+                write_bundle(data_dir, name, rng, num_particles=20)
+            
+            evaluations = evaluation.evaluate_bundles(list(catalog.BundleCatalog(data_dir)), workers=2)
+        
+        self.assertEqual(sorted(result.name for result in evaluations), ["A", "B"])
+        
+        total = evaluations[0] + evaluations[1]
+        self.assertGreater(total.overall.recall, 0.8)
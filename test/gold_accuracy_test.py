@@ -12,21 +12,21 @@ POSITIVE_DISTANCE_MICRONS = POSITIVE_DISTANCE_NM / 1000
 
 class AccuracyTest(TestCase):
     @staticmethod
-    def get_confusion_matrix(bundle: dl.ImageBundle, gold_locations):
+    def get_confusion_matrix(bundle: dl.ImageBundle, particles):
         true_positive_12nm = 0
         true_positive_6nm = 0
         
         false_positive = 0
         
-        for location in gold_locations:
+        for particle in particles:
             # This value is true if the location is in the mask, false if it isn't
             # This is required since, for some reason, the ground truth data also includes some particles that are not
             # in the mask. To fix this, if the particle is outside the mask but is found in the ground truth data anyway
             # count it as a true positive. But if the particle is outside the mask and is not found in the ground truth
             # data, do *not* count it as a false positive.
-            in_mask: bool = bundle.mask.getpixel(location) != 255
+            in_mask: bool = bundle.mask.getpixel((int(particle["pixel_x"]), int(particle["pixel_y"]))) != 255
 
-            micron_location = uc.pixels_to_microns(*location)
+            micron_location = uc.pixels_to_microns(particle["x"], particle["y"])
 
             distances_6nm = np.sqrt((bundle.ground_truth_6nm["X"] - micron_location[0]) ** 2 +
                                     (bundle.ground_truth_6nm["Y"] - micron_location[1]) ** 2)
@@ -34,12 +34,16 @@ class AccuracyTest(TestCase):
             distances_12nm = np.sqrt((bundle.ground_truth_12nm["X"] - micron_location[0]) ** 2 +
                                      (bundle.ground_truth_12nm["Y"] - micron_location[1]) ** 2)
 
-            if any(distances_12nm <= POSITIVE_DISTANCE_MICRONS):
-                true_positive_12nm += 1
+            near_12nm = any(distances_12nm <= POSITIVE_DISTANCE_MICRONS)
+            near_6nm = any(distances_6nm <= POSITIVE_DISTANCE_MICRONS)
             
-            elif any(distances_6nm <= POSITIVE_DISTANCE_MICRONS):
+            # check the ground truth of the predicted size class first
+            if near_6nm and (particle["size_class"] == "6nm" or not near_12nm):
                 true_positive_6nm += 1
             
+            elif near_12nm:
+                true_positive_12nm += 1
+            
             elif in_mask:
                 false_positive += 1
         
@@ -75,11 +79,11 @@ class AccuracyTest(TestCase):
         
         # Calculate the gold locations and get the confusion matrices
         for bundle in image_bundles:
-            gold_locations = gf.GoldFinder(bundle.image).find_gold()
+            particles = gf.GoldFinder(bundle.image).find_particles()
             
             false_positives, confusion_matrix = self.get_confusion_matrix(
                 bundle,
-                gold_locations
+                particles
             )
             
             sum_false_positives += false_positives
@@ -0,0 +1,172 @@
+from src.gold_finder import gold_finder as gf
+from src.helper import masking, profiling
+
+from benchmark.synthetic import synthetic_image
+
+from unittest import TestCase
+import numpy as np
+
+
+class GoldFinderTest(TestCase):
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        finder = gf.GoldFinder(None)
+        
+        for density in (0.1, 0.3, 0.5):
+            blurred = smooth(rng.random((80, 100)), 2)
+            image_data = blurred < np.quantile(blurred, density)
+            
+            self.assertEqual(finder.find_circles(image_data), reference_find_circles(finder, image_data))
+    
+    def test_thresholds(self):
+        blurred = smooth(np.random.default_rng(1).random((80, 100)), 2)
+        image_data = blurred < np.quantile(blurred, 0.3)
+        
+        for circle_threshold in (0.1, 0.4, 0.8):
+            for min_pixels in (1, 15, 40):
+                finder = gf.GoldFinder(None, circle_threshold=circle_threshold, min_pixels=min_pixels)
+                
+                self.assertEqual(finder.find_circles(image_data), reference_find_circles(finder, image_data))
+
+    
+    def test_tiled(self):
+        image = synthetic_image((300, 400), 60, np.random.default_rng(2))[0]
+        expected = gf.GoldFinder(image).find_gold()
+        
+        self.assertGreater(len(expected), 0)
+        
+        for tile_size in (50, 128, 1000):
+            self.assertEqual(gf.GoldFinder(image, tile_size=tile_size).find_gold(), expected)
+    
+    def test_particles(self):
+        image, truth = synthetic_image((600, 600), 60, np.random.default_rng(1), margin=20)
+        finder = gf.GoldFinder(image)
+        
+        particles = finder.find_particles()
+        self.assertEqual(list(zip(particles["pixel_x"].tolist(), particles["pixel_y"].tolist())), finder.find_gold())
+        
+        # match each particle to the closest drawn disk
+        distances = np.hypot(particles["y"][:, None] - truth[:, 0], particles["x"][:, None] - truth[:, 1])
+        closest = distances.argmin(axis=1)
+        
+        # the subpixel centroid is closer to the true center than the rounded down one
+        pixel_distances = np.hypot(particles["pixel_y"] - truth[closest, 0], particles["pixel_x"] - truth[closest, 1])
+        self.assertLess(np.median(distances.min(axis=1)), np.median(pixel_distances))
+        
+        np.testing.assert_array_equal(particles["size_class"], np.where(truth[closest, 2] == 12, "12nm", "6nm"))
+    
+    def test_tiled_particles(self):
+        image = synthetic_image((300, 400), 60, np.random.default_rng(2))[0]
+        expected = gf.GoldFinder(image).find_particles()
+        
+        tiled = gf.GoldFinder(image, tile_size=128).find_particles()
+        
+        for field in expected.dtype.names:
+            if expected.dtype[field].kind == "f":
+                np.testing.assert_allclose(tiled[field], expected[field])
+            else:
+                np.testing.assert_array_equal(tiled[field], expected[field])
+    
+    def test_region(self):
+        image = synthetic_image((300, 400), 80, np.random.default_rng(3))[0]
+        
+        rows, cols = np.mgrid[0:300, 0:400]
+        region = masking.Region.from_mask(np.where(np.hypot(rows - 150, cols - 220) < 90, 0, 255).astype(np.uint8))
+        masked = region.apply(image)
+        luminosity = gf.GoldFinder.get_avg_luminosity(image)
+        
+        expected = gf.GoldFinder(masked, img_luminosity=luminosity).find_gold()
+        self.assertGreater(len(expected), 0)
+        
+        for tile_size in (None, 64):
+            # the unmasked image gives the same particles, since pixels outside the region are never scanned
+            for source in (masked, image):
+                finder = gf.GoldFinder(source, img_luminosity=luminosity, tile_size=tile_size, region=region)
+                self.assertEqual(finder.find_gold(), expected)
+        
+        profiler = profiling.Profiler()
+        
+        with profiling.activate(profiler):
+            gf.GoldFinder(masked, img_luminosity=luminosity, region=region).find_particles()
+        
+        self.assertLess(profiler.counters["pixels_scanned"], 200 * 200)
+    
+    def test_default_params(self):
+        region = masking.Region((1, 2, 3, 4), np.ones((2, 2), dtype=bool))
+        finder = gf.GoldFinder(np.zeros((5, 5), dtype=np.uint8), tile_size=64, region=region)
+        
+        self.assertEqual(gf.GoldFinder.default_params(tile_size=64, region=region), finder.params())
+        self.assertEqual(gf.GoldFinder.default_params()["min_pixels"], 15)
+        
+        with self.assertRaises(TypeError):
+            gf.GoldFinder.default_params(tile=64)
+    
+    def test_avg_luminosity_ignores_white(self):
+        image = np.full((10, 10), 255, dtype=np.uint8)
+        image[:5] = 100
+        image[5, :5] = 40
+        
+        self.assertAlmostEqual(gf.GoldFinder.get_avg_luminosity(image), (50 * 100 + 5 * 40) / 55)
+
+
+def smooth(array, radius):
+    # box blur so the random splotches have blobby, particle-like shapes
+    padded = np.pad(array, radius, mode="edge")
+    out = np.zeros_like(array)
+    
+    for d_row in range(2 * radius + 1):
+        for d_col in range(2 * radius + 1):
+            out += padded[d_row:d_row + array.shape[0], d_col:d_col + array.shape[1]]
+    
+    return out / (2 * radius + 1) ** 2
+
+
+def reference_find_circles(finder, image_data):
+    """
+    The original set-based splotch analysis, one splotch at a time
+    """
+    
+    processed = set()
+    centers = []
+    
+    for x in range(image_data.shape[0]):
+        for y in range(image_data.shape[1]):
+            if not image_data[x, y] or (x, y) in processed:
+                continue
+            
+            splotch = {(x, y)}
+            stack = [(x, y)]
+            
+            while stack:
+                coord = stack.pop()
+                
+                for offset in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                    new = (coord[0] + offset[0], coord[1] + offset[1])
+                    
+                    if (0 <= new[0] < image_data.shape[0] and 0 <= new[1] < image_data.shape[1]
+                            and image_data[new] and new not in splotch):
+                        splotch.add(new)
+                        stack.append(new)
+            
+            processed.update(splotch)
+            
+            if len(splotch) < finder.min_pixels:
+                continue
+            
+            center = (sum(c[0] for c in splotch) // len(splotch), sum(c[1] for c in splotch) // len(splotch))
+            
+            if not image_data[center]:
+                continue
+            
+            perimeter = [
+                c for c in splotch
+                if any((c[0] + o[0], c[1] + o[1]) not in splotch for o in ((-1, 0), (1, 0), (0, -1), (0, 1)))
+            ]
+            
+            rad_squared = min((c[0] - center[0]) ** 2 + (c[1] - center[1]) ** 2 for c in perimeter)
+            in_circle = sum((c[0] - center[0]) ** 2 + (c[1] - center[1]) ** 2 <= rad_squared for c in splotch)
+            
+            if in_circle / len(splotch) > finder.circle_threshold:
+                centers.append(center)
+    
+    return centers
@@ -0,0 +1,103 @@
+from src.helper import profiling
+from src.network import density, incremental, mst
+
+from unittest import TestCase
+import numpy as np
+
+
+class IncrementalTest(TestCase):
+    def test_add(self):
+        rng = np.random.default_rng(0)
+        
+        for num_old, num_new in ((0, 1), (1, 1), (2, 3), (200, 1), (200, 5), (50, 60)):
+            old, new = rng.normal(0, 10, (num_old, 2)), rng.normal(0, 10, (num_new, 2))
+            tree = incremental.SpanningTree.build(old).add(new)
+            
+            self.assertEqual(len(tree.edges), num_old + num_new - 1)
+            self.assertAlmostEqual(tree.weight, mst.mst_weight(np.concatenate((old, new))), places=9)
+    
+    def test_remove(self):
+        rng = np.random.default_rng(1)
+        points = rng.normal(0, 10, (300, 2))
+        tree = incremental.SpanningTree.build(points)
+        
+        for fraction in (0.01, 0.3, 0.9):
+            keep = rng.random(len(points)) >= fraction
+            removed = tree.remove(keep)
+            
+            self.assertEqual(len(removed.edges), np.count_nonzero(keep) - 1)
+            self.assertAlmostEqual(removed.weight, mst.mst_weight(points[keep]), places=9)
+    
+    def test_degenerate_points(self):
+        grid = np.array([(x, y) for x in range(8) for y in range(8)], dtype=float)
+        duplicates = np.concatenate((grid[:10], grid[:10]))
+        
+        for points in (grid, duplicates):
+            tree = incremental.SpanningTree.build(points[:-3]).add(points[-3:])
+            self.assertAlmostEqual(tree.weight, mst.mst_weight(points), places=9)
+            
+            keep = np.arange(len(points)) % 3 != 0
+            self.assertAlmostEqual(tree.remove(keep).weight, mst.mst_weight(tree.points[keep]), places=9)
+    
+    def test_add_duplicates(self):
+        # the nearest neighbor of (5, 0) that is not a copy of it, (10, 1), is in the same cone as its copy
+        old = np.array([(0, 0), (1, 0), (2, 0), (10, 1)], dtype=float)
+        new = np.array([(5, 0), (5, 0)], dtype=float)
+        
+        tree = incremental.SpanningTree.build(old).add(new)
+        self.assertAlmostEqual(tree.weight, mst.mst_weight(np.concatenate((old, new))), places=9)
+    
+    def test_three_degenerate_points(self):
+        service = incremental.DensityService()
+        densities = service.densities({0: [(0, 0), (1, 1), (2, 2)], 1: [(1, 1), (1, 1), (1, 1)]})
+        
+        self.assertAlmostEqual(densities[0], density.density([(0, 0), (1, 1), (2, 2)]), places=9)
+        self.assertEqual(densities[1], float("inf"))
+    
+    def test_densities_follow_edits(self):
+        rng = np.random.default_rng(2)
+        points = [tuple(point) for point in rng.integers(0, 2000, (400, 2)).tolist()]
+        
+        steps = [
+            {0: points[:200], 1: points[200:390], -1: points[390:]},
+            {0: points[:200], 1: points[200:392], -1: points[392:]},  # noise points join a cluster
+            {0: points[5:200], 1: points[200:392], -1: points[392:] + points[:5]},  # and cluster points become noise
+            {0: points[5:392], -1: points[392:] + points[:5]},  # the clusters merge
+            {0: points[5:100], 1: points[100:392], -1: points[392:] + points[:5]}  # and split again
+        ]
+        
+        service = incremental.DensityService()
+        profiler = profiling.Profiler(track_memory=False)
+        
+        with profiling.activate(profiler):
+            for clusters in steps:
+                densities = service.densities(clusters)
+                
+                self.assertEqual(list(densities), list(clusters))
+                self.assertTrue(np.isnan(densities[-1]))
+                
+                for label, cluster_points in clusters.items():
+                    if label != -1:
+                        self.assertAlmostEqual(densities[label], density.density(cluster_points), places=9)
+        
+        self.assertEqual(profiler.counters["density_trees_built"], 2)
+        self.assertEqual(profiler.counters["density_trees_derived"], 5)
+        self.assertEqual(profiler.counters["density_cache_hits"], 2)
+    
+    def test_match_points(self):
+        a = np.array([[0, 0], [1, 1], [1, 1], [2, 2], [1, 1]], dtype=float)
+        b = np.array([[1, 1], [3, 3], [0, 0], [1, 1]], dtype=float)
+        
+        in_b, in_a = incremental.match_points(a, b)
+        
+        # two of the three copies of (1, 1) in a are matched
+        self.assertEqual(in_b.tolist(), [True, True, True, False, False])
+        self.assertEqual(in_a.tolist(), [True, False, True, True])
+    
+    def test_cache_is_bounded(self):
+        service = incremental.DensityService(max_entries=2)
+        
+        for offset in range(5):
+            service.density([(offset, 0), (offset + 1, 1), (offset, 3)])
+        
+        self.assertEqual(len(service.trees), 2)
@@ -0,0 +1,74 @@
+from src.gold_finder import labeling
+
+from unittest import TestCase
+import numpy as np
+
+
+class LabelingTest(TestCase):
+    def test_matches_flood_fill(self):
+        rng = np.random.default_rng(0)
+        
+        for density in (0.2, 0.45, 0.6, 0.9):
+            image_data = rng.random((60, 80)) < density
+            
+            components = labeling.label_components(image_data)
+            expected = flood_fill_labels(image_data)
+            
+            np.testing.assert_array_equal(components.labels, expected)
+            self.assertEqual(components.num, expected.max())
+    
+    def test_pixel_indices(self):
+        image_data = np.random.default_rng(1).random((40, 40)) < 0.5
+        components = labeling.label_components(image_data)
+        
+        self.assertEqual(components.areas().sum(), image_data.sum())
+        
+        for label in range(1, components.num + 1):
+            coords = components.coords(label)
+            self.assertEqual(len(coords), np.count_nonzero(components.labels == label))
+            self.assertTrue(np.all(components.labels[coords[:, 0], coords[:, 1]] == label))
+    
+    def test_large_component(self):
+        # a single snake-shaped component that would overflow a recursive flood fill
+        image_data = np.zeros((401, 400), dtype=bool)
+        image_data[::2] = True
+        image_data[1::4, -1] = True
+        image_data[3::4, 0] = True
+        
+        components = labeling.label_components(image_data)
+        
+        self.assertEqual(components.num, 1)
+        self.assertEqual(components.areas()[0], image_data.sum())
+    
+    def test_empty(self):
+        components = labeling.label_components(np.zeros((10, 10), dtype=bool))
+        
+        self.assertEqual(components.num, 0)
+        self.assertFalse(components.labels.any())
+
+
+def flood_fill_labels(image_data):
+    labels = np.zeros(image_data.shape, dtype=int)
+    next_label = 1
+    
+    for start in zip(*np.nonzero(image_data)):
+        if labels[start]:
+            continue
+        
+        labels[start] = next_label
+        stack = [start]
+        
+        while stack:
+            row, col = stack.pop()
+            
+            for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                neighbor = (row + d_row, col + d_col)
+                
+                if (0 <= neighbor[0] < image_data.shape[0] and 0 <= neighbor[1] < image_data.shape[1]
+                        and image_data[neighbor] and not labels[neighbor]):
+                    labels[neighbor] = next_label
+                    stack.append(neighbor)
+        
+        next_label += 1
+    
+    return labels
@@ -0,0 +1,68 @@
+from src.helper import masking
+
+from unittest import TestCase
+from PIL import Image
+import numpy as np
+
+
+class RegionTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image_data = rng.integers(0, 256, (50, 60), dtype=np.uint8)
+        
+        self.mask_data = np.full((50, 60), 255, dtype=np.uint8)
+        self.mask_data[10:30, 5:40] = np.where(rng.random((20, 35)) < 0.5, 255, 0)
+        
+        self.region = masking.Region.from_mask(self.mask_data)
+    
+    def test_bounding_box(self):
+        rows, cols = np.nonzero(self.mask_data != 255)
+        
+        self.assertEqual(self.region.box, (cols.min(), rows.min(), cols.max() + 1, rows.max() + 1))
+        self.assertEqual(self.region.area, np.count_nonzero(self.mask_data != 255))
+    
+    def test_apply_mask_matches_composite(self):
+        image = Image.fromarray(self.image_data, "L")
+        mask = Image.fromarray(self.mask_data, "L")
+        
+        expected = Image.composite(image, Image.new("L", image.size, 255), mask.point(lambda p: p != 255, mode="1"))
+        
+        np.testing.assert_array_equal(np.asarray(masking.apply_mask(image, mask)), np.asarray(expected))
+        np.testing.assert_array_equal(masking.apply_mask(self.image_data, self.mask_data), np.asarray(expected))
+    
+    def test_apply_in_place(self):
+        expected = masking.apply_mask(self.image_data, self.mask_data)
+        
+        self.region.apply(self.image_data, self.image_data)
+        
+        np.testing.assert_array_equal(self.image_data, expected)
+    
+    def test_row_spans_round_trip(self):
+        spans = self.region.row_spans
+        
+        for row, start, end in spans.tolist():
+            self.assertTrue((self.mask_data[row, start:end] != 255).all())
+        
+        self.assertEqual((spans[:, 2] - spans[:, 1]).sum(), self.region.area)
+        np.testing.assert_array_equal(masking.Region.from_spans(spans).to_mask((60, 50)), self.mask_data)
+    
+    def test_overlapping_spans(self):
+        region = masking.Region.from_spans(np.array([[2, 1, 5], [2, 3, 8], [4, -3, 2]]), image_size=(6, 10))
+        
+        self.assertEqual(region.box, (0, 2, 6, 5))
+        self.assertEqual(region.row_spans.tolist(), [[2, 1, 6], [4, 0, 2]])
+    
+    def test_crop(self):
+        np.testing.assert_array_equal(self.region.crop((0, 0, 60, 50)), self.mask_data != 255)
+        padded = np.pad(self.mask_data != 255, 10)
+        np.testing.assert_array_equal(self.region.crop((30, 20, 70, 40)), padded[30:50, 40:80])
+        
+        self.assertTrue(self.region.intersects((0, 0, 60, 50)))
+        self.assertFalse(self.region.intersects((45, 0, 60, 50)))
+    
+    def test_empty(self):
+        region = masking.Region.from_mask(np.full((5, 5), 255, dtype=np.uint8))
+        
+        self.assertEqual(region.area, 0)
+        self.assertEqual(len(region.row_spans), 0)
+        self.assertTrue((region.apply(self.image_data) == 255).all())
@@ -0,0 +1,104 @@
+from src.clustering import clustering
+from src.gold_finder import gold_finder as gf
+from src.helper import particles
+from src.helper.output import render, writer
+
+from unittest import TestCase
+import numpy as np
+
+import pickle
+
+from benchmark.synthetic import synthetic_image, synthetic_points
+
+
+class ParticleTableTest(TestCase):
+    def setUp(self):
+        self.points = np.rint(synthetic_points(500, 8, np.random.default_rng(0), extent=2000)).astype(np.int64)
+    
+    def test_from_particles(self):
+        image = synthetic_image((300, 400), 60, np.random.default_rng(1))[0]
+        finder = gf.GoldFinder(image)
+        
+        found = finder.find_particles()
+        table = finder.find_table()
+        
+        self.assertEqual(table.to_list(), finder.find_gold())
+        np.testing.assert_array_equal(table.x, found["x"])
+        np.testing.assert_array_equal(table.size, found["area"])
+        np.testing.assert_array_equal(table.score, found["circle_score"])
+        self.assertTrue((table.cluster_id == particles.NOISE).all())
+    
+    def test_cluster_table_matches_gold_cluster(self):
+        expected = clustering.gold_cluster(self.points, (2000, 2000), method="grid", eps_nm=100)
+        table = clustering.cluster_table(particles.ParticleTable(self.points), (2000, 2000), method="grid", eps_nm=100)
+        
+        groups = table.clusters()
+        
+        self.assertEqual(list(groups), list(expected))
+        
+        for label, points in expected.items():
+            self.assertEqual(list(map(tuple, groups[label].tolist())), points)
+            self.assertTrue((table.cluster(label).cluster_id == label).all())
+        
+        np.testing.assert_array_equal(table.cluster_sizes(), [len(points) for points in expected.values()])
+    
+    def test_clusters_are_views(self):
+        table = particles.ParticleTable([(5, 5), (1, 1), (2, 2), (3, 3)]).sort_by_cluster([1, 0, 1, -1])
+        
+        self.assertEqual(table.cluster_ranges(), {-1: slice(0, 1), 0: slice(1, 2), 1: slice(2, 4)})
+        self.assertEqual(table.clusters()[1].tolist(), [[5, 5], [2, 2]])
+        self.assertTrue(np.shares_memory(table.clusters()[1], table.pixels))
+        
+        table.cluster(1).size[:] = 7
+        self.assertEqual(table.size.tolist(), [0, 0, 7, 7])
+    
+    def test_particle_views(self):
+        table = particles.ParticleTable([(1, 2), (3, 4)], x=[1.5, 3.5], y=[2.5, 4.5], size=[10, 20], score=[0.5, 0.6])
+        particle = table[-1]
+        
+        self.assertEqual(
+            (particle.x, particle.y, particle.pixel, particle.size, particle.score), (3.5, 4.5, (3, 4), 20, 0.6)
+        )
+        self.assertFalse(hasattr(particle, "__dict__"))
+        self.assertFalse(hasattr(table, "__dict__"))
+        
+        particle.cluster_id = 4
+        self.assertEqual(table.cluster_id.tolist(), [particles.NOISE, 4])
+        self.assertEqual(list(table.clusters()), [particles.NOISE, 4])
+        
+        self.assertEqual([particle.pixel for particle in table], [(1, 2), (3, 4)])
+        
+        with self.assertRaises(IndexError):
+            _ = table[2]
+    
+    def test_copy_and_pickle(self):
+        table = clustering.cluster_table(particles.ParticleTable(self.points), (2000, 2000), method="grid", eps_nm=100)
+        
+        copy = table.copy()
+        copy.cluster_id[:] = 0
+        self.assertFalse((table.cluster_id == 0).all())
+        
+        unpickled = pickle.loads(pickle.dumps(table))
+        np.testing.assert_array_equal(unpickled.pixels, table.pixels)
+        self.assertEqual(unpickled.cluster_ranges(), table.cluster_ranges())
+    
+    def test_stages_accept_table(self):
+        clusters = clustering.gold_cluster(self.points, (2000, 2000), method="grid", eps_nm=100)
+        table = clustering.cluster_table(particles.ParticleTable(self.points), (2000, 2000), method="grid", eps_nm=100)
+        
+        expected = writer.particle_columns(clusters)
+        actual = writer.particle_columns(table)
+        
+        for name in writer.COLUMNS:
+            np.testing.assert_array_equal(actual[name], expected[name])
+        
+        image = np.full((2000, 2000), 200, dtype=np.uint8)
+        np.testing.assert_array_equal(
+            np.asarray(render.render(image, table)), np.asarray(render.render(image, clusters))
+        )
+    
+    def test_empty(self):
+        table = clustering.cluster_table(particles.ParticleTable(np.zeros((0, 2))), (100, 100))
+        
+        self.assertEqual(table.clusters(), {})
+        self.assertEqual(len(writer.particle_columns(table)["cluster_id"]), 0)
@@ -0,0 +1,134 @@
+from src import batch, pipeline
+from src.helper import catalog, shared
+from src.helper.output import writer
+
+from unittest import TestCase, mock
+import numpy as np
+import pandas as pd
+
+import asyncio
+import pathlib
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class PipelineTest(TestCase):
+    def test_run_pipeline(self):
+        rng = np.random.default_rng(0)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            outdir = pathlib.Path(tmp) / "out"
+            figure_dir = pathlib.Path(tmp) / "figures"
+            figure_dir.mkdir()
+            
+            for name in ("A", "B", "C", "D"):
+                write_bundle(data_dir, name, rng)
+            
+            bundles = list(catalog.BundleCatalog(data_dir))
+            results = asyncio.run(pipeline.run_pipeline(
+                bundles, writer.DatasetWriter(outdir), workers=2, io_workers=2, queue_size=1, figure_dir=figure_dir
+            ))
+            
+            self.assertEqual(sorted(result["name"] for result in results), ["A", "B", "C", "D"])
+            
+            for result in results:
+                self.assertEqual(set(result["timings"]), set(batch.STAGES))
+                self.assertTrue((figure_dir / f"{result['name']}.png").exists())
+                
+                output = pd.read_csv(outdir / f"bundle={result['name']}" / "part-0.csv")
+                self.assertEqual(len(output), result["particles"])
+            
+            # the same particles as a batch run
+            batch_results = batch.run_batch(str(data_dir), str(pathlib.Path(tmp) / "batch"), workers=2)
+            
+            self.assertEqual(
+                sorted((result["name"], result["particles"]) for result in results),
+                sorted((result["name"], result["particles"]) for result in batch_results)
+            )
+    
+    def test_workers_per_image(self):
+        rng = np.random.default_rng(2)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            
+            for name in ("A", "B"):
+                write_bundle(data_dir, name, rng)
+            
+            outputs = []
+            for workers_per_image in (1, 3):
+                outdir = pathlib.Path(tmp) / f"out-{workers_per_image}"
+                
+                results = asyncio.run(pipeline.run_pipeline(
+                    list(catalog.BundleCatalog(data_dir)), writer.DatasetWriter(outdir), use_mask=True, workers=2,
+                    io_workers=2, workers_per_image=workers_per_image
+                ))
+                
+                self.assertEqual(sorted(result["name"] for result in results), ["A", "B"])
+                self.assertTrue(all(set(result["timings"]) == set(batch.STAGES) for result in results))
+                
+                outputs.append([pd.read_csv(outdir / f"bundle={name}" / "part-0.csv") for name in ("A", "B")])
+            
+            # the same particles, clusters and densities whether an image is split between the workers or not
+            for split, whole in zip(*outputs):
+                pd.testing.assert_frame_equal(split, whole)
+    
+    def test_entries_are_unloaded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            
+            for name in ("A", "B"):
+                write_bundle(data_dir, name, np.random.default_rng(4))
+            
+            bundles = list(catalog.BundleCatalog(data_dir))
+            results = asyncio.run(pipeline.run_pipeline(
+                bundles, writer.DatasetWriter(pathlib.Path(tmp) / "out"), use_mask=True, workers=1, io_workers=1,
+                queue_size=1
+            ))
+            
+            self.assertEqual(len(results), 2)
+            
+            # the shared images and regions are freed
+            self.assertEqual(list(pathlib.Path(shared.SHARED_MEMORY_DIR or tempfile.gettempdir()).glob(
+                f"{shared.FILE_PREFIX}*")), [])
+            
+            # every entry is kept until the run ends, so a decoded image or mask would stay in memory until then
+            for bundle in bundles:
+                self.assertNotIn("image", vars(bundle))
+                self.assertNotIn("mask", vars(bundle))
+                self.assertIsNotNone(bundle.bar_position)
+    
+    def test_failed_bundles_are_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            write_bundle(data_dir, "A", np.random.default_rng(1))
+            (data_dir / "empty").mkdir()
+            
+            bundle_catalog = catalog.BundleCatalog(data_dir)
+            bundles = [bundle_catalog.get("A"), bundle_catalog.get("empty")]
+            
+            results = asyncio.run(pipeline.run_pipeline(
+                bundles, writer.DatasetWriter(pathlib.Path(tmp) / "out"), workers=1, io_workers=1, queue_size=1
+            ))
+            
+            self.assertEqual([result["name"] for result in results], ["A"])
+    
+    def test_failed_write_releases_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = pathlib.Path(tmp) / "data"
+            write_bundle(data_dir, "A", np.random.default_rng(3))
+            
+            unlink = shared.SharedArray.unlink
+            
+            with mock.patch.object(pipeline, "write", side_effect=OSError("disk full")), \
+                    mock.patch.object(shared.SharedArray, "unlink", autospec=True, side_effect=unlink) as unlinked:
+                results = asyncio.run(pipeline.run_pipeline(
+                    list(catalog.BundleCatalog(data_dir)), writer.DatasetWriter(pathlib.Path(tmp) / "out"), workers=1,
+                    io_workers=1, queue_size=1
+                ))
+            
+            self.assertEqual(results, [])
+            self.assertEqual(unlinked.call_count, 1)
+            self.assertFalse(pathlib.Path(unlinked.call_args.args[0].path).exists())
@@ -0,0 +1,38 @@
+from src.gold_finder import gold_finder as gf, prefilter
+
+from benchmark.synthetic import synthetic_image
+
+from unittest import TestCase
+import numpy as np
+
+
+class PrefilterTest(TestCase):
+    def test_block_mean(self):
+        image_data = np.random.default_rng(0).integers(0, 256, (37, 50)).astype(np.uint8)
+        
+        expected = np.array([
+            [image_data[row:row + 8, col:col + 8].mean() for col in range(0, 50, 8)]
+            for row in range(0, 37, 8)
+        ])
+        
+        np.testing.assert_allclose(prefilter.block_mean(image_data, 8), expected)
+    
+    def test_finds_the_same_particles(self):
+        image = synthetic_image((1024, 1024), 20, np.random.default_rng(1))[0]
+        finder = gf.GoldFinder(image)
+        
+        self.assertIsNotNone(prefilter.candidate_tiles(image, finder.get_threshold(), 4, 8))
+        np.testing.assert_array_equal(gf.GoldFinder(image, prefilter=4).find_particles(), finder.find_particles())
+    
+    def test_dense_images_are_processed_whole(self):
+        image = synthetic_image((512, 512), 400, np.random.default_rng(2))[0]
+        finder = gf.GoldFinder(image)
+        
+        self.assertIsNone(prefilter.candidate_tiles(image, finder.get_threshold(), 4, 8))
+        self.assertEqual(gf.GoldFinder(image, prefilter=4).find_gold(), finder.find_gold())
+    
+    def test_no_candidates(self):
+        image = np.full((100, 100), 200, dtype=np.uint8)
+        
+        self.assertEqual(prefilter.candidate_tiles(image, 100, 4, 8), [])
+        self.assertEqual(gf.GoldFinder(image, prefilter=4).find_gold(), [])
@@ -0,0 +1,49 @@
+from src.helper import preprocessing, masking
+
+from unittest import TestCase
+from PIL import Image
+import numpy as np
+
+
+class PreprocessingTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image_data = rng.integers(0, 256, (50, 60), dtype=np.uint8)
+        self.mask_data = np.where(rng.random((50, 60)) < 0.5, 255, 0).astype(np.uint8)
+    
+    def test_mean_ignores_white(self):
+        stats = preprocessing.LuminosityStats.from_array(self.image_data)
+        
+        self.assertAlmostEqual(stats.mean, self.image_data[self.image_data < 255].mean())
+    
+    def test_mask_matches_apply_mask(self):
+        image = Image.fromarray(self.image_data, "L")
+        mask = Image.fromarray(self.mask_data, "L")
+        
+        preprocessed = preprocessing.preprocess(image, mask)
+        
+        np.testing.assert_array_equal(preprocessed.image, np.asarray(masking.apply_mask(image, mask)))
+        self.assertAlmostEqual(preprocessed.stats.mean, self.image_data[self.image_data < 255].mean())
+    
+    def test_array_is_not_copied(self):
+        self.assertIs(preprocessing.preprocess(self.image_data).image, self.image_data)
+    
+    def test_otsu_separates_modes(self):
+        rng = np.random.default_rng(1)
+        image_data = np.concatenate((rng.normal(50, 5, 1000), rng.normal(180, 5, 1000))).clip(0, 254).astype(np.uint8)
+        
+        threshold = preprocessing.LuminosityStats.from_array(image_data).otsu_threshold()
+        
+        self.assertEqual(np.count_nonzero(image_data < threshold), 1000)
+    
+    def test_local_threshold(self):
+        block_size = 7
+        thresholds = preprocessing.local_threshold(self.image_data, 0.5, block_size)
+        
+        for row, col in ((0, 0), (25, 30), (49, 59), (10, 2)):
+            window = self.image_data[max(row - 3, 0):row + 4, max(col - 3, 0):col + 4]
+            self.assertAlmostEqual(thresholds[row, col], window[window < 255].mean() * 0.5, places=3)
+    
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            preprocessing.preprocess(self.image_data).threshold("nope")
@@ -0,0 +1,98 @@
+from src.gold_finder import gold_finder as gf
+from src.clustering import clustering
+from src.helper import profiling
+from src.helper.output import writer
+
+from benchmark.synthetic import synthetic_image
+
+from unittest import TestCase
+import numpy as np
+
+import json
+import os
+import tempfile
+
+
+class ProfilingTest(TestCase):
+    def test_inactive_does_nothing(self):
+        self.assertIsNone(profiling.current())
+        
+        with profiling.stage("unused"):
+            profiling.count("unused")
+    
+    def test_nested_stages(self):
+        profiler = profiling.Profiler()
+        
+        with profiling.activate(profiler):
+            with profiling.stage("outer"):
+                with profiling.stage("inner"):
+                    data = np.ones(1024 ** 2, dtype=np.uint8)  # 1 MiB
+                    del data
+        
+        self.assertEqual([stage.name for stage in profiler.stages], ["inner", "outer"])
+        self.assertEqual([stage.depth for stage in profiler.stages], [1, 0])
+        
+        inner, outer = profiler.stages
+        self.assertGreaterEqual(inner.peak_bytes, 1024 ** 2)
+        self.assertGreaterEqual(outer.peak_bytes, inner.peak_bytes)
+        self.assertGreaterEqual(outer.duration, inner.duration)
+    
+    def test_decorator_and_callbacks(self):
+        finished = []
+        profiler = profiling.Profiler(track_memory=False, callbacks=[finished.append])
+        
+        @profiling.stage("square")
+        def square(value):
+            return value * value
+        
+        with profiling.activate(profiler):
+            self.assertEqual(square(3), 9)
+            self.assertEqual(square(4), 16)
+        
+        self.assertEqual([stage.name for stage in finished], ["square", "square"])
+        self.assertIsNone(finished[0].peak_bytes)
+        self.assertEqual(list(profiler.totals()), ["square"])
+    
+    def test_pipeline_counters(self):
+        image = synthetic_image((512, 512), 30, np.random.default_rng(0))[0]
+        profiler = profiling.Profiler(track_memory=False)
+        
+        with profiling.activate(profiler):
+            locations = gf.GoldFinder(image).find_gold()
+            writer.particle_columns(clustering.gold_cluster(locations, (512, 512)))
+        
+        self.assertEqual(profiler.counters["pixels_scanned"], 512 * 512)
+        self.assertEqual(profiler.counters["particles_accepted"], len(locations))
+        self.assertGreaterEqual(
+            profiler.counters["components_labeled"],
+            len(locations) + profiler.counters["rejected_min_pixels"] + profiler.counters["rejected_circularity"]
+        )
+        self.assertGreater(profiler.counters["mst_edges"], 0)
+        self.assertEqual([stage.name for stage in profiler.stages], ["find_gold", "gold_cluster", "density"])
+    
+    def test_write(self):
+        profiler = profiling.Profiler(track_memory=False)
+        
+        with profiling.activate(profiler):
+            with profiling.stage("load"):
+                profiling.count("pixels_scanned", 100)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            
+            profiler.write(path, "json")
+            with open(path) as f:
+                profile = json.load(f)
+            
+            self.assertEqual(profile["stages"][0]["name"], "load")
+            self.assertEqual(profile["counters"], {"pixels_scanned": 100})
+            
+            profiler.write(path, "chrome")
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+            
+            self.assertEqual([event["ph"] for event in events], ["X", "C"])
+            self.assertEqual(events[1]["args"], {"pixels_scanned": 100})
+            
+            with self.assertRaises(ValueError):
+                profiler.write(path, "xml")
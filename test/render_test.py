@@ -0,0 +1,46 @@
+from src.helper.output import render
+
+from unittest import TestCase
+import numpy as np
+
+
+class RenderTest(TestCase):
+    def test_markers(self):
+        image = np.full((100, 200), 50, dtype=np.uint8)
+        clusters = {-1: [(10, 10)], 0: [(150, 20), (160, 30)], 1: [(50, 80)]}
+        
+        rendering = np.asarray(render.render(image, clusters))
+        
+        self.assertEqual(rendering.shape, (100, 200, 3))
+        
+        # particles are (x, y), pixels are (row, column)
+        self.assertEqual(tuple(rendering[10, 10]), render.NOISE_COLOR)
+        self.assertEqual(tuple(rendering[20, 150]), render.cluster_color(0))
+        self.assertEqual(tuple(rendering[82, 50]), render.cluster_color(1))
+        self.assertEqual(tuple(rendering[0, 199]), (50, 50, 50))
+    
+    def test_colors_are_deterministic_and_distinct(self):
+        colors = [render.cluster_color(cluster_id) for cluster_id in range(20)]
+        
+        self.assertEqual(colors, [render.cluster_color(cluster_id) for cluster_id in range(20)])
+        self.assertEqual(len(set(colors)), 20)
+        self.assertNotIn(render.NOISE_COLOR, colors)
+    
+    def test_downsampling(self):
+        image = np.zeros((1000, 3000), dtype=np.uint8)
+        
+        rendering = np.asarray(render.render(image, {0: [(2999, 999)]}, max_size=1000))
+        
+        self.assertEqual(rendering.shape, (334, 1000, 3))
+        self.assertEqual(tuple(rendering[333, 999]), render.cluster_color(0))
+    
+    def test_labels_are_skipped_when_dense(self):
+        image = np.zeros((1000, 1000), dtype=np.uint8)  # one megapixel
+        clusters = {0: [(200, 200)], 1: [(700, 700)]}
+        
+        labeled = np.asarray(render.render(image, clusters, marker_radius=0))
+        unlabeled = np.asarray(render.render(image, clusters, marker_radius=0, max_labels_per_megapixel=1))
+        
+        # without labels, only the image and the two markers are left
+        self.assertEqual((unlabeled.max(axis=2) > 0).sum(), 2)
+        self.assertGreater((labeled.max(axis=2) > 0).sum(), 2)
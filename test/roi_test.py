@@ -0,0 +1,111 @@
+from src.helper import roi
+
+from unittest import TestCase
+import numpy as np
+
+import pathlib
+import struct
+import tempfile
+import zipfile
+
+
+def encode(roi_type: int, box: tuple[int, int, int, int], xs=(), ys=(), sub_pixel: bool = False) -> bytes:
+    """
+    Encodes a ROI the way ImageJ's RoiEncoder does, for the fields that roi.parse reads
+    """
+    
+    left, top, right, bottom = box
+    header = bytearray(roi.HEADER_SIZE)
+    header[:4] = roi.MAGIC
+    struct.pack_into(">hBxhhhhH", header, 4, 228, roi_type, top, left, bottom, right, len(xs))
+    struct.pack_into(">H", header, 50, roi.SUB_PIXEL_RESOLUTION if sub_pixel else 0)
+    
+    data = bytes(header)
+    data += (np.asarray(xs, dtype=float).round() - left).astype(">i2").tobytes()
+    data += (np.asarray(ys, dtype=float).round() - top).astype(">i2").tobytes()
+    
+    if sub_pixel:
+        data += np.asarray(xs, dtype=">f4").tobytes() + np.asarray(ys, dtype=">f4").tobytes()
+    
+    return data
+
+
+class RoiTest(TestCase):
+    def test_rect(self):
+        parsed = roi.parse(encode(roi.RECT, (2, 3, 7, 5)), "rect")
+        
+        self.assertTrue(parsed.is_area)
+        self.assertEqual(parsed.region().box, (2, 3, 7, 5))
+        self.assertEqual(parsed.region().area, 10)
+    
+    def test_polygon_matches_rect(self):
+        xs, ys = (2, 7, 7, 2), (3, 3, 5, 5)
+        polygon = roi.parse(encode(roi.POLYGON, (2, 3, 7, 5), xs, ys))
+        
+        np.testing.assert_array_equal(polygon.points, np.column_stack((xs, ys)))
+        np.testing.assert_array_equal(polygon.row_spans(), roi.parse(encode(roi.RECT, (2, 3, 7, 5))).row_spans())
+    
+    def test_polygon_pixel_centers(self):
+        xs, ys = (0.0, 40.0, 0.0), (0.0, 0.0, 30.0)
+        polygon = roi.parse(encode(roi.POLYGON, (0, 0, 40, 30), xs, ys, sub_pixel=True))
+        
+        rows, cols = np.mgrid[0:30, 0:40] + 0.5
+        expected = cols / 40 + rows / 30 < 1
+        
+        np.testing.assert_array_equal(polygon.region().crop((0, 0, 40, 30)), expected)
+    
+    def test_concave_polygon(self):
+        # a U shape: the middle of the top rows is outside
+        xs, ys = (0, 9, 9, 6, 6, 3, 3, 0), (0, 0, 9, 9, 4, 4, 9, 9)
+        region = roi.parse(encode(roi.POLYGON, (0, 0, 9, 9), xs, ys)).region()
+        
+        self.assertEqual(region.area, 9 * 9 - 3 * 5)
+        self.assertFalse(region.crop((3, 4, 6, 9)).any())
+    
+    def test_oval(self):
+        region = roi.parse(encode(roi.OVAL, (10, 20, 50, 40))).region()
+        
+        rows, cols = np.mgrid[20:40, 10:50] + 0.5
+        expected = ((cols - 30) / 20) ** 2 + ((rows - 30) / 10) ** 2 <= 1
+        
+        np.testing.assert_array_equal(region.crop((10, 20, 50, 40)), expected)
+    
+    def test_clipped_to_image(self):
+        region = roi.parse(encode(roi.RECT, (-5, -5, 5, 5))).region(image_size=(3, 4))
+        
+        self.assertEqual(region.box, (0, 0, 3, 4))
+        self.assertEqual(region.area, 12)
+    
+    def test_points(self):
+        parsed = roi.parse(encode(roi.POINT, (820, 1424, 821, 1425), (820.25,), (1424.5,), sub_pixel=True))
+        
+        self.assertFalse(parsed.is_area)
+        np.testing.assert_array_equal(roi.points([parsed]), [[820.25, 1424.5]])
+        
+        with self.assertRaises(ValueError):
+            parsed.region()
+        
+        with self.assertRaises(ValueError):
+            roi.region([parsed])
+    
+    def test_read_zip_and_roi(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            zip_path = pathlib.Path(tmp) / "RoiSet.zip"
+            
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                archive.writestr("a.roi", encode(roi.RECT, (0, 0, 4, 4)))
+                archive.writestr("b.roi", encode(roi.RECT, (2, 2, 6, 6)))
+            
+            rois = roi.read(zip_path)
+            
+            self.assertEqual([parsed.name for parsed in rois], ["a", "b"])
+            self.assertEqual(roi.region(rois).area, 16 + 16 - 4)
+            
+            roi_path = pathlib.Path(tmp) / "c.roi"
+            roi_path.write_bytes(encode(roi.OVAL, (0, 0, 4, 4)))
+            
+            self.assertEqual([parsed.type_name for parsed in roi.read(roi_path)], ["oval"])
+    
+    def test_not_a_roi(self):
+        with self.assertRaises(roi.UnsupportedRoi):
+            roi.parse(b"not a roi" * 10)
@@ -0,0 +1,95 @@
+from src import client, server
+from src.helper import data_loading
+
+from unittest import TestCase, mock
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import pathlib
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+from benchmark.synthetic import write_bundle
+
+
+class ServerTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        write_bundle(pathlib.Path(self.tmp.name), "A", np.random.default_rng(0))
+        
+        self.jobs = server.JobQueue(workers=1, queue_size=1)
+        self.server = server.AnalysisServer(("127.0.0.1", 0), server.Analyzer(self.tmp.name, cache_dir=None), self.jobs)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.jobs.shutdown()
+        self.tmp.cleanup()
+    
+    def test_analyze(self):
+        with urllib.request.urlopen(f"{self.url}/bundles") as response:
+            self.assertEqual(json.load(response), {"bundles": ["A"]})
+        
+        for cached in (False, True):
+            messages = list(client.analyze(self.url, {"name": "A"}))
+            
+            self.assertEqual([message["event"] for message in messages], ["detected", "clustered", "rows", "done"])
+            self.assertEqual(messages[0]["cached"], cached)
+            self.assertEqual(len(messages[2]["columns"]["particle_x"]), messages[0]["particles"])
+        
+        with urllib.request.urlopen(f"{self.url}/status") as response:
+            status = json.load(response)
+        
+        self.assertEqual((status["cached_bundles"], status["cached_detections"], status["pending"]), (1, 1, 0))
+    
+    def test_concurrent_jobs_load_once(self):
+        analyzer = server.Analyzer(self.tmp.name, cache_dir=None)
+        start = threading.Barrier(4)
+        
+        def run_job(_):
+            messages = []
+            start.wait()
+            analyzer.run(server.Job.from_json({"name": "A"}), messages.append)
+            return messages[0]["cached"]
+        
+        with mock.patch.object(data_loading, "load_source_array", wraps=data_loading.load_source_array) as load:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                cached = list(executor.map(run_job, range(4)))
+        
+        # the image is decoded and detected by one job, and the others reuse the detection
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(sorted(cached), [False, True, True, True])
+    
+    def test_bad_requests(self):
+        for job, code in (({"name": "B"}, 404), ({"name": "A", "cluster_method": "nope"}, 400), ({}, 400)):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                list(client.analyze(self.url, job))
+            
+            self.assertEqual(context.exception.code, code)
+    
+    def test_queue_is_bounded(self):
+        release = threading.Event()
+        
+        running = self.jobs.submit(release.wait)
+        queued = self.jobs.submit(release.wait)
+        
+        self.assertIsNone(self.jobs.submit(release.wait))
+        
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            list(client.analyze(self.url, {"name": "A"}))
+        
+        self.assertEqual(context.exception.code, 503)
+        self.assertEqual(context.exception.headers["Retry-After"], str(server.RETRY_AFTER_SECONDS))
+        
+        release.set()
+        running.result()
+        queued.result()
+        
+        self.assertIsNotNone(self.jobs.submit(release.wait))
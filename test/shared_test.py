@@ -0,0 +1,92 @@
+from src.gold_finder import gold_finder as gf, parallel
+from src.helper import masking, preprocessing, shared
+
+from unittest import TestCase
+import numpy as np
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark.synthetic import synthetic_image
+
+
+class SharedArrayTest(TestCase):
+    def test_round_trip(self):
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+        shared_array = shared.SharedArray.from_array(array)
+        
+        try:
+            np.testing.assert_array_equal(shared_array.open(), array)
+            self.assertFalse(shared_array.open().flags.writeable)
+        finally:
+            shared_array.unlink()
+        
+        self.assertFalse(os.path.exists(shared_array.path))
+    
+    def test_writes_are_shared(self):
+        with shared.temporary((2, 2)) as shared_array:
+            shared_array.open(writable=True)[0, 1] = 7
+            self.assertEqual(shared_array.open()[0, 1], 7)
+        
+        self.assertFalse(os.path.exists(shared_array.path))
+    
+    def test_region(self):
+        mask = np.full((6, 8), 255, dtype=np.uint8)
+        mask[1:4, 2:5] = 0
+        
+        for region in (masking.Region.from_mask(mask), masking.Region.from_mask(np.full((6, 8), 255, np.uint8))):
+            shared_region = shared.SharedRegion.from_region(region)
+            
+            try:
+                opened = shared_region.open()
+                
+                self.assertEqual(opened.box, region.box)
+                np.testing.assert_array_equal(opened.inside, region.inside)
+            finally:
+                shared_region.unlink()
+    
+    def test_preprocess_out(self):
+        image = np.full((4, 4), 100, dtype=np.uint8)
+        mask = np.zeros((4, 4), dtype=np.uint8)
+        mask[0] = 255
+        
+        with shared.temporary(image.shape) as shared_array:
+            preprocessed = preprocessing.preprocess(image, mask, out=shared_array.open(writable=True))
+            
+            np.testing.assert_array_equal(shared_array.open(), preprocessing.preprocess(image, mask).image)
+            self.assertEqual(preprocessed.stats.mean, 100)
+
+
+class ParallelTest(TestCase):
+    def setUp(self):
+        self.image, _ = synthetic_image((300, 400), 60, np.random.default_rng(0))
+    
+    def assert_same_particles(self, **kwargs):
+        expected = gf.GoldFinder(self.image, **kwargs).find_particles()
+        
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            actual = parallel.find_particles(gf.GoldFinder(self.image, **kwargs), executor, 3)
+        
+        self.assertGreater(len(expected), 0)
+        
+        for field in expected.dtype.names:
+            if expected.dtype[field].kind == "f":
+                np.testing.assert_allclose(actual[field], expected[field])
+            else:
+                np.testing.assert_array_equal(actual[field], expected[field])
+    
+    def test_bands(self):
+        self.assert_same_particles()
+    
+    def test_tiles(self):
+        self.assert_same_particles(tile_size=64)
+    
+    def test_local_threshold(self):
+        threshold = preprocessing.local_threshold(self.image, 0.7, block_size=63)
+        self.assert_same_particles(threshold=threshold)
+    
+    def test_region(self):
+        mask = np.full(self.image.shape, 255, dtype=np.uint8)
+        mask[40:260, 100:300] = 0
+        
+        self.assert_same_particles(region=masking.Region.from_mask(mask))
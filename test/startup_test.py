@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+import json
+import pathlib
+import subprocess
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("sklearn", "matplotlib", "pandas", "networkx", "scipy", "pyarrow")
+
+
+def imported_heavy_modules(statement: str, modules: tuple[str, ...] = HEAVY_MODULES) -> list[str]:
+    """
+    :param statement: The Python statement to run in a fresh interpreter
+    :param modules: The modules to look for
+    :return: The modules that are imported afterward
+    """
+    
+    code = f"import json, sys\n{statement}\nprint(json.dumps([m for m in {modules!r} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True, text=True)
+    
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+class StartupTest(TestCase):
+    def test_cli_imports_are_light(self):
+        self.assertEqual(imported_heavy_modules("import src.cli"), [])
+    
+    def test_help_is_light(self):
+        statement = "import src.cli\nsys.argv = ['golden', '-h']\ntry:\n    src.cli.get_args()\nexcept SystemExit:\n    pass"
+        self.assertEqual(imported_heavy_modules(statement), [])
+    
+    def test_client_imports_are_light(self):
+        self.assertEqual(imported_heavy_modules("import src.client", HEAVY_MODULES + ("numpy",)), [])
+    
+    def test_stages_import_what_they_need(self):
+        statement = ("from src.clustering import clustering\n"
+                     "clustering.gold_cluster([(0, 0), (1, 1), (2, 2)], (100, 100), method='grid')")
+        self.assertEqual(imported_heavy_modules(statement), [])
+        
+        statement = ("from src.clustering import clustering\n"
+                     "clustering.gold_cluster([(0, 0), (1, 1), (2, 2)], (100, 100))")
+        self.assertIn("sklearn", imported_heavy_modules(statement))
+        
+        statement = ("import numpy as np, os, tempfile\n"
+                     "from src.helper.output import out\n"
+                     "with tempfile.TemporaryDirectory() as tmp:\n"
+                     "    out.gen_visualization(np.zeros((50, 50), dtype=np.uint8), {0: [(10, 10), (20, 20)]}, False,\n"
+                     "                          os.path.join(tmp, 'figure.png'))")
+        self.assertNotIn("pandas", imported_heavy_modules(statement))
@@ -0,0 +1,43 @@
+from src.evaluation import evaluation, sweep
+from src.helper import catalog
+
+from unittest import TestCase
+import numpy as np
+
+import tempfile
+
+from benchmark.synthetic import write_bundle
+
+
+class SweepTest(TestCase):
+    def test_sweep_matches_evaluate_bundle(self):
+        rng = np.random.default_rng(0)
+        
+        with tempfile.TemporaryDirectory() as data_dir:
+            for name in ("A", "B"):
+                write_bundle(data_dir, name, rng, num_particles=20)
+            
+            bundles = list(catalog.BundleCatalog(data_dir))
+            grid = sweep.sweep(bundles, [0.6, 0.7], [0.3, 0.5], [5, 15], workers=2)
+            
+            # 2 bundles and a total for each of the 8 combinations
+            self.assertEqual(len(grid), 24)
+            
+            for bundle in bundles:
+                expected = evaluation.evaluate_bundle(bundle, mask_threshold=0.7, circle_threshold=0.5, min_pixels=15)
+                
+                row = grid[
+                    (grid["bundle"] == bundle.name) & (grid["mask_threshold"] == 0.7)
+                    & (grid["circle_threshold"] == 0.5) & (grid["min_pixels"] == 15)
+                ].iloc[0]
+                
+                self.assertEqual(row["true_positive"], expected.overall.true_positive)
+                self.assertEqual(row["false_positive"], expected.overall.false_positive)
+                self.assertEqual(row["12nm_false_negative"], expected.classes["12nm"].false_negative)
+                self.assertEqual(row["6nm_false_positive"], expected.classes["6nm"].false_positive)
+        
+        totals = grid[grid["bundle"] == "total"]
+        self.assertEqual(len(totals), 8)
+        self.assertEqual(
+            totals["true_positive"].sum(), grid[grid["bundle"] != "total"]["true_positive"].sum()
+        )
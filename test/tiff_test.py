@@ -0,0 +1,162 @@
+from src.helper import tiff, data_loading as dl
+
+from unittest import TestCase
+from PIL import Image
+import numpy as np
+
+import pathlib
+import struct
+import tempfile
+
+
+class TiffTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmp.name)
+        
+        rng = np.random.default_rng(0)
+        self.image_data = rng.integers(0, 256, (600, 500), dtype=np.uint8)
+        self.rgb_data = rng.integers(0, 256, (60, 50, 3), dtype=np.uint8)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_grayscale_is_memory_mapped(self):
+        Image.fromarray(self.image_data).save(self.path / "gray.tif")
+        
+        image_data = tiff.open_array(self.path / "gray.tif")
+        
+        self.assertIsInstance(image_data, np.memmap)
+        np.testing.assert_array_equal(image_data, self.image_data)
+        
+        # writes are copy-on-write
+        image_data[:10] = 255
+        np.testing.assert_array_equal(np.asarray(Image.open(self.path / "gray.tif")), self.image_data)
+        
+        region = tiff.TiffImage(self.path / "gray.tif").read_region((100, 250, 430, 590))
+        np.testing.assert_array_equal(region, self.image_data[250:590, 100:430])
+    
+    def test_rgb_matches_pil(self):
+        Image.fromarray(self.rgb_data).save(self.path / "rgb.tif")
+        
+        np.testing.assert_array_equal(
+            tiff.open_array(self.path / "rgb.tif"), np.asarray(Image.fromarray(self.rgb_data).convert("L"))
+        )
+    
+    def test_tiles_and_strips(self):
+        write_raw_tiff(self.path / "tiled.tif", self.image_data, tile_size=64)
+        write_raw_tiff(self.path / "strips.tif", self.image_data, rows_per_strip=37)
+        
+        for name in ("tiled.tif", "strips.tif"):
+            image = tiff.TiffImage(self.path / name)
+            
+            self.assertFalse(image.layout.is_contiguous())
+            np.testing.assert_array_equal(image.as_array(), self.image_data)
+            np.testing.assert_array_equal(image.read_region((30, 100, 200, 130)), self.image_data[100:130, 30:200])
+    
+    def test_compressed_falls_back_to_pil(self):
+        Image.fromarray(self.image_data).save(self.path / "lzw.tif", compression="tiff_lzw")
+        
+        with self.assertRaises(tiff.UnsupportedTiff):
+            tiff.TiffImage(self.path / "lzw.tif")
+        
+        np.testing.assert_array_equal(tiff.open_array(self.path / "lzw.tif"), self.image_data)
+    
+    def test_malformed_falls_back_to_pil(self):
+        write_raw_tiff(self.path / "strips.tif", self.image_data, rows_per_strip=600)
+        data = bytearray((self.path / "strips.tif").read_bytes())
+        
+        # rename the StripByteCounts tag (the last entry) to an unknown tag
+        (num_entries,) = struct.unpack_from("<H", data, 8)
+        struct.pack_into("<H", data, 10 + 12 * (num_entries - 1), 65000)
+        (self.path / "no_byte_counts.tif").write_bytes(data)
+        
+        (self.path / "truncated.tif").write_bytes(data[:30])
+        
+        for name in ("no_byte_counts.tif", "truncated.tif"):
+            with self.assertRaises(tiff.UnsupportedTiff):
+                tiff.TiffImage(self.path / name)
+        
+        self.assertEqual(tiff.open_array(self.path / "no_byte_counts.tif").shape, self.image_data.shape)
+    
+    def test_bar_position(self):
+        image_data = np.full((120, 100), 128, dtype=np.uint8)
+        image_data[100:] = 0
+        Image.fromarray(image_data).save(self.path / "bar.tif")
+        
+        self.assertEqual(dl.BarPosition.bar_pos(tiff.TiffImage(self.path / "bar.tif")), dl.BarPosition.BOTTOM)
+        
+        image_data, bar_position = dl.load_source_array(self.path / "bar.tif")
+        
+        self.assertEqual(bar_position, dl.BarPosition.BOTTOM)
+        np.testing.assert_array_equal(image_data, np.asarray(dl.load_source_image(self.path / "bar.tif")[0]))
+    
+    def test_pyramid(self):
+        pyramid = tiff.Pyramid.build(self.image_data, min_size=100)
+        
+        self.assertEqual([level.shape for level in pyramid.levels], [(600, 500), (300, 250), (150, 125), (75, 62)])
+        self.assertEqual(pyramid.levels[1][0, 0], (int(self.image_data[:2, :2].sum()) + 2) // 4)
+        
+        level, scale = pyramid.level_for(200)
+        self.assertEqual((level.shape, scale), ((150, 125), 4))
+        
+        tiff.Pyramid.cached(self.image_data, self.path / "pyramid", min_size=100)
+        cached = tiff.Pyramid.cached(self.image_data, self.path / "pyramid", min_size=100)
+        
+        self.assertEqual(len(cached.levels), 4)
+        np.testing.assert_array_equal(cached.levels[3], pyramid.levels[3])
+
+
+def write_raw_tiff(path, image_data, tile_size=None, rows_per_strip=None):
+    # a minimal little-endian, uncompressed grayscale TIFF, either tiled or in strips. The blocks are stored in reverse
+    # order so that they are not contiguous
+    if tile_size is not None:
+        tiles_down = -(-image_data.shape[0] // tile_size)
+        tiles_across = -(-image_data.shape[1] // tile_size)
+        
+        padded = np.zeros((tiles_down * tile_size, tiles_across * tile_size), dtype=np.uint8)
+        padded[:image_data.shape[0], :image_data.shape[1]] = image_data
+        
+        blocks = [
+            padded[row:row + tile_size, col:col + tile_size].tobytes()
+            for row in range(0, padded.shape[0], tile_size) for col in range(0, padded.shape[1], tile_size)
+        ]
+        layout_entries = [(322, 4, 1, tile_size), (323, 4, 1, tile_size)]
+        offsets_tag, byte_counts_tag = 324, 325
+    else:
+        blocks = [image_data[row:row + rows_per_strip].tobytes() for row in range(0, image_data.shape[0], rows_per_strip)]
+        layout_entries = [(278, 4, 1, rows_per_strip)]
+        offsets_tag, byte_counts_tag = 273, 279
+    
+    num_entries = 7 + len(layout_entries)
+    offsets_position = 8 + 2 + 12 * num_entries + 4
+    data_position = offsets_position + 8 * len(blocks)
+    
+    offsets = [0] * len(blocks)
+    position = data_position
+    for i in reversed(range(len(blocks))):
+        offsets[i] = position
+        position += len(blocks[i])
+    
+    entries = sorted([
+        (256, 4, 1, image_data.shape[1]),
+        (257, 4, 1, image_data.shape[0]),
+        (258, 3, 1, 8),
+        (259, 3, 1, 1),
+        (262, 3, 1, 1),
+        *layout_entries,
+        (offsets_tag, 4, len(blocks), offsets_position),
+        (byte_counts_tag, 4, len(blocks), offsets_position + 4 * len(blocks)),
+    ])
+    
+    with open(path, "wb") as f:
+        f.write(b"II" + struct.pack("<HI", 42, 8))
+        f.write(struct.pack("<H", num_entries))
+        
+        for tag, field_type, count, value in entries:
+            f.write(struct.pack("<HHII", tag, field_type, count, value))
+        
+        f.write(struct.pack("<I", 0))
+        f.write(struct.pack(f"<{len(blocks)}I", *offsets))
+        f.write(struct.pack(f"<{len(blocks)}I", *[len(block) for block in blocks]))
+        f.write(b"".join(reversed(blocks)))
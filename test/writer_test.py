@@ -0,0 +1,67 @@
+from src.helper.output import out, writer
+from src.network import density
+
+from unittest import TestCase, skipUnless
+import numpy as np
+import pandas as pd
+
+import importlib.util
+import tempfile
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class WriterTest(TestCase):
+    clusters = {
+        0: [(10, 20), (12, 25), (30, 40)],
+        -1: [(500, 500)],
+        3: [(100, 100), (110, 90)]
+    }
+    
+    def test_particle_columns(self):
+        # noise is not a cluster, so it has no density
+        rows = [
+            (x, y, cluster_id, np.nan if cluster_id == -1 else density.density(values))
+            for cluster_id, values in self.clusters.items() for x, y in values
+        ]
+        
+        output = out.create_output_df(self.clusters)
+        
+        self.assertEqual(list(output.columns), list(writer.COLUMNS))
+        np.testing.assert_array_equal(
+            output[["particle_x", "particle_y", "cluster_id", "cluster_density"]].to_numpy(), np.array(rows)
+        )
+        np.testing.assert_allclose(output["particle_x_um"], output["particle_x"] / 1790)
+    
+    def test_no_clusters(self):
+        output = out.create_output_df({})
+        
+        self.assertEqual(list(output.columns), list(writer.COLUMNS))
+        self.assertEqual(len(output), 0)
+    
+    def test_dataset_writer_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = writer.DatasetWriter(tmp)
+            
+            dataset.write("A", writer.particle_columns(self.clusters))
+            dataset.append("A", writer.particle_columns({1: [(1, 2)]}))
+            self.assertEqual(len(dataset.parts("A")), 2)
+            
+            # writing again replaces the partition
+            dataset.write("A", writer.particle_columns({1: [(1, 2)]}))
+            self.assertEqual([path.name for path in dataset.parts("A")], ["part-0.csv"])
+            self.assertEqual(len(pd.read_csv(dataset.parts("A")[0])), 1)
+    
+    @skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_open_dataset(self):
+        for file_format in writer.FORMATS:
+            with tempfile.TemporaryDirectory() as tmp:
+                dataset = writer.DatasetWriter(tmp, file_format)
+                
+                dataset.write("A", writer.particle_columns(self.clusters))
+                dataset.write("B", writer.particle_columns({1: [(1, 2)]}))
+                
+                table = writer.open_dataset(tmp, file_format).to_table().to_pandas()
+                
+                self.assertEqual(len(table), 7)
+                self.assertEqual(sorted(table["bundle"].astype(str).unique()), ["A", "B"])